@@ -0,0 +1,328 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+#
+# Measures the download throughput of APT with the Updates.fetch()
+# scheduling options (see libchannels.updates.FetchOptions).
+#
+# A number of .deb files are generated and served by a local HTTP
+# stand-in mirror, which adds a fixed latency to every request to look
+# like a remote one. Every configuration downloads the whole set, in a
+# fresh interpreter, a number of times, and the best time is reported.
+# Use --json to get machine-readable output.
+#
+
+import os
+import io
+import sys
+import json
+import time
+import random
+import shutil
+import tarfile
+import hashlib
+import argparse
+import tempfile
+import threading
+import subprocess
+
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+sys.path.insert(0, ROOT)
+
+# name -> FetchOptions arguments
+CONFIGURATIONS = {
+	"default" : {},
+	"access" : {"queue_mode" : "access"},
+	"host" : {"queue_mode" : "host"},
+	"host-4" : {"queue_mode" : "host", "max_queues" : 4},
+	"host-4-pipeline-1" : {"queue_mode" : "host", "max_queues" : 4, "pipeline_depth" : 1},
+	"host-4-pipeline-10" : {"queue_mode" : "host", "max_queues" : 4, "pipeline_depth" : 10},
+}
+
+def get_tar(files):
+	"""
+	Returns a gzipped tar archive with the given (name, content) files.
+	"""
+
+	buffer = io.BytesIO()
+
+	with tarfile.open(fileobj=buffer, mode="w:gz") as archive:
+		for name, content in files:
+			info = tarfile.TarInfo(name)
+			info.size = len(content)
+			info.mtime = 0
+			archive.addfile(info, io.BytesIO(content))
+
+	return buffer.getvalue()
+
+def write_deb(path, name, size, generator):
+	"""
+	Writes a minimal .deb package containing a single file of about
+	size bytes of random (thus incompressible) data.
+	"""
+
+	control = (
+		"Package: %s\n"
+		"Version: 1.0\n"
+		"Architecture: all\n"
+		"Maintainer: Benchmark <benchmark@localhost>\n"
+		"Description: Synthetic package\n" % name
+	).encode()
+
+	members = [
+		("debian-binary", b"2.0\n"),
+		("control.tar.gz", get_tar([("./control", control)])),
+		("data.tar.gz", get_tar([("./usr/share/%s/data" % name, generator.getrandbits(size * 8).to_bytes(size, "little"))])),
+	]
+
+	with open(path, "wb") as f:
+		f.write(b"!<arch>\n")
+
+		for member, content in members:
+			f.write(
+				("%-16s%-12d%-6d%-6d%-8s%-10d`\n" % (member, 0, 0, 0, "100644", len(content))).encode()
+			)
+			f.write(content)
+
+			# Members are 2-byte aligned
+			if len(content) % 2:
+				f.write(b"\n")
+
+def generate_mirror(root, count, size, seed=0):
+	"""
+	Writes count packages of about size bytes in root, and returns the
+	list of their (path, sha256, size), path being relative to root.
+	"""
+
+	generator = random.Random(seed)
+
+	files = []
+	for index in range(count):
+		name = "package%04d" % index
+		path = os.path.join("pool", "main", name[0], name, "%s_1.0_all.deb" % name)
+
+		os.makedirs(os.path.join(root, os.path.dirname(path)), exist_ok=True)
+		write_deb(os.path.join(root, path), name, size, generator)
+
+		with open(os.path.join(root, path), "rb") as f:
+			content = f.read()
+
+		files.append((path, hashlib.sha256(content).hexdigest(), len(content)))
+
+	return files
+
+class Mirror:
+
+	"""
+	A local HTTP mirror serving root, in a background thread. Every
+	request is delayed by latency seconds.
+	"""
+
+	def __init__(self, root, latency=0.0):
+		"""
+		Initializes the class.
+		"""
+
+		class Handler(SimpleHTTPRequestHandler):
+
+			# Keep the connections open, so that APT can pipeline
+			protocol_version = "HTTP/1.1"
+
+			def __init__(self, *args, **kwargs):
+				super().__init__(*args, directory=root, **kwargs)
+
+			def send_head(self):
+				time.sleep(latency)
+
+				return super().send_head()
+
+			def log_message(self, format, *args):
+				pass
+
+		self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+		self.server.daemon_threads = True
+
+		self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+	@property
+	def url(self):
+		"""
+		Returns the URL of the mirror.
+		"""
+
+		return "http://%s:%d" % self.server.server_address
+
+	def __enter__(self):
+		"""
+		Starts the mirror.
+		"""
+
+		self.thread.start()
+
+		return self
+
+	def __exit__(self, type, value, traceback):
+		"""
+		Stops the mirror.
+		"""
+
+		self.server.shutdown()
+		self.server.server_close()
+
+def run(url, manifest, configuration, repeat):
+	"""
+	Measures the given configuration, from a fresh interpreter, and
+	returns the results.
+	"""
+
+	environment = dict(os.environ)
+	environment["PYTHONPATH"] = os.pathsep.join(
+		[ROOT] + ([environment["PYTHONPATH"]] if "PYTHONPATH" in environment else [])
+	)
+
+	output = subprocess.check_output(
+		[
+			sys.executable,
+			os.path.abspath(__file__),
+			"--measure", url,
+			"--manifest", manifest,
+			"--configuration", json.dumps(configuration),
+			"--repeat", str(repeat)
+		],
+		env=environment
+	)
+
+	return json.loads(output.decode())
+
+def measure(url, files, configuration, repeat):
+	"""
+	Downloads every file from url with the given FetchOptions arguments,
+	and returns the best time and the throughput.
+
+	This is the benchmark process.
+	"""
+
+	import libchannels.updates
+
+	libchannels.updates.load_apt()
+	apt_pkg = libchannels.updates.apt_pkg
+
+	apt_pkg.init()
+
+	# The downloads go to temporary directories, which the unprivileged
+	# APT sandbox user can't write to
+	apt_pkg.config.set("APT::Sandbox::User", "root")
+
+	libchannels.updates.FetchOptions(**configuration).apply()
+
+	total = sum(size for path, sha256, size in files)
+
+	best = None
+	for i in range(repeat):
+		destination = tempfile.mkdtemp(prefix="libchannels-fetch-")
+
+		try:
+			fetcher = apt_pkg.Acquire()
+
+			items = [
+				apt_pkg.AcquireFile(
+					fetcher,
+					"%s/%s" % (url, path),
+					hash="SHA256:%s" % sha256,
+					size=size,
+					descr=path,
+					short_descr=os.path.basename(path),
+					destdir=destination
+				)
+				for path, sha256, size in files
+			]
+
+			start = time.perf_counter()
+			fetcher.run()
+			elapsed = time.perf_counter() - start
+
+			failed = [item.desc_uri for item in items if item.status != item.STAT_DONE]
+			if failed:
+				raise Exception("Unable to fetch %s" % ", ".join(failed))
+
+			fetcher.shutdown()
+		finally:
+			shutil.rmtree(destination)
+
+		if best == None or elapsed < best:
+			best = elapsed
+
+	return {
+		"seconds" : best,
+		"bytes" : total,
+		"throughput" : total / best,
+	}
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description="libchannels fetch throughput benchmark")
+	parser.add_argument("--packages", type=int, default=100, help="number of packages (default: 100)")
+	parser.add_argument("--size", type=int, default=256, help="size of every package, in KiB (default: 256)")
+	parser.add_argument("--latency", type=float, default=20, help="latency of every request, in ms (default: 20)")
+	parser.add_argument("--bandwidth", type=int, help="also measure every configuration with this bandwidth limit, in KiB/s (see FetchOptions)")
+	parser.add_argument("--repeat", type=int, default=3, help="runs per configuration (default: 3)")
+	parser.add_argument("--json", action="store_true", help="print the results as JSON")
+	parser.add_argument("--measure", metavar="URL", help=argparse.SUPPRESS)
+	parser.add_argument("--manifest", help=argparse.SUPPRESS)
+	parser.add_argument("--configuration", help=argparse.SUPPRESS)
+	parser.add_argument("configurations", nargs="*", default=list(CONFIGURATIONS), help="configurations to measure")
+	args = parser.parse_args()
+
+	if args.measure:
+		# Benchmark process
+		with open(args.manifest) as f:
+			files = json.load(f)
+
+		print(json.dumps(measure(args.measure, files, json.loads(args.configuration), args.repeat)))
+		sys.exit(0)
+
+	configurations = {}
+	for name in args.configurations:
+		configurations[name] = CONFIGURATIONS[name]
+
+		if args.bandwidth:
+			configurations["%s-limited" % name] = dict(CONFIGURATIONS[name], bandwidth_limit=args.bandwidth)
+
+	root = tempfile.mkdtemp(prefix="libchannels-mirror-")
+
+	try:
+		files = generate_mirror(root, args.packages, args.size * 1024)
+
+		manifest = os.path.join(root, "manifest.json")
+		with open(manifest, "w") as f:
+			json.dump(files, f)
+
+		results = {
+			"packages" : args.packages,
+			"size" : args.size * 1024,
+			"latency" : args.latency / 1000,
+			"configurations" : {}
+		}
+
+		with Mirror(root, latency=args.latency / 1000) as mirror:
+			for name, configuration in configurations.items():
+				try:
+					results["configurations"][name] = run(mirror.url, manifest, configuration, args.repeat)
+				except subprocess.CalledProcessError:
+					results["configurations"][name] = None
+	finally:
+		shutil.rmtree(root)
+
+	if args.json:
+		print(json.dumps(results, indent=4))
+	else:
+		for name, result in results["configurations"].items():
+			print(
+				"%-35s %s" % (
+					name,
+					"%8.2f s %10.2f MiB/s" % (result["seconds"], result["throughput"] / 1024 / 1024)
+					if result != None
+					else "    failed"
+				)
+			)
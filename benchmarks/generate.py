@@ -0,0 +1,342 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+#
+# Generates a synthetic libchannels system, to be used by the benchmarks.
+#
+# The generated tree contains:
+#
+#	channels.d/          the channel and provider definitions
+#	                     (CHANNEL_SEARCH_PATH)
+#	etc/sources.list     the main sources file, with unrelated entries
+#	etc/sources.list.d/  one sources file for every enabled channel
+#	lists/               the Release files, as found in /var/lib/apt/lists
+#	manifest.json        the generation parameters and the enabled channels
+#
+# Channels are numbered: dependencies and conflicts only point to channels
+# with a lower number, so that the dependency graph is acyclic. Some
+# channels provide a provider, too.
+# The same parameters (and seed) always give the same tree.
+#
+
+import os
+import json
+import random
+import argparse
+
+# Every Release file is padded with that many checksum lines, to look
+# like a real one
+HASH_LINES = 200
+
+def get_channel_name(index):
+	"""
+	Returns the name of the given channel.
+	"""
+
+	return "channel-%05d" % index
+
+def get_provider_name(index):
+	"""
+	Returns the name of the given provider.
+	"""
+
+	return "provider-%03d.provider" % index
+
+def get_mirror(index):
+	"""
+	Returns the default mirror of the given channel.
+	"""
+
+	return "http://mirror-%03d.example/debian" % (index % 100)
+
+def get_release_name(mirror, codename):
+	"""
+	Returns the name APT gives to the InRelease file of the given
+	repository.
+	"""
+
+	return "%s_dists_%s_InRelease" % (
+		mirror.split("://", 1)[1].strip("/").replace("/", "_"),
+		codename.replace("/", "_")
+	)
+
+class Generator:
+
+	"""
+	The Generator() class builds the synthetic channel graph and writes
+	it to disk.
+	"""
+
+	def __init__(
+		self,
+		channels=100,
+		depends=2,
+		conflicts=0.05,
+		providers=0.1,
+		proposed=0.2,
+		enabled=0.3,
+		seed=0
+	):
+		"""
+		Initializes the class.
+
+		depends is the maximum number of dependencies of every channel,
+		conflicts, providers, proposed and enabled are the ratio of
+		channels with a conflict, providing a provider, with a proposed
+		repository and enabled.
+		"""
+
+		self.count = channels
+		self.random = random.Random(seed)
+
+		self.parameters = {
+			"channels" : channels,
+			"depends" : depends,
+			"conflicts" : conflicts,
+			"providers" : providers,
+			"proposed" : proposed,
+			"enabled" : enabled,
+			"seed" : seed,
+		}
+
+		self.provider_count = max(1, int(channels * providers / 4))
+
+		# index -> list of channel indexes
+		self.depends = []
+		self.conflicts = []
+
+		# index -> provider index (or None)
+		self.provides = []
+
+		# index -> list of (repository name, codename, proposed)
+		self.repositories = []
+
+		for index in range(channels):
+			self.depends.append(
+				sorted(
+					self.random.sample(range(index), min(index, self.random.randint(0, depends)))
+				)
+			)
+
+			# A channel can't conflict with one of its dependencies: skip
+			# the conflict if every previous channel is one
+			candidates = [x for x in range(index) if not x in self.depends[index]]
+			self.conflicts.append(
+				[self.random.choice(candidates)]
+				if index > 1 and self.random.random() < conflicts and candidates
+				else []
+			)
+
+			self.provides.append(
+				self.random.randrange(self.provider_count)
+				if self.random.random() < providers
+				else None
+			)
+
+			repositories = [
+				("main", "suite-%05d" % index, False)
+			]
+			if self.random.random() < proposed:
+				repositories.append(("proposed", "suite-%05d-proposed" % index, True))
+
+			self.repositories.append(repositories)
+
+		self.enabled = self.get_enabled_channels(enabled)
+
+	def get_closure(self, index, enabled):
+		"""
+		Returns the set of channels to enable to enable the given one,
+		or None if that's not possible alongside the enabled ones.
+		"""
+
+		closure = set()
+		stack = [index]
+
+		while stack:
+			current = stack.pop()
+			if current in closure or current in enabled:
+				continue
+
+			closure.add(current)
+			stack.extend(self.depends[current])
+
+		selected = enabled | closure
+
+		provided = {}
+		for current in selected:
+			if any(x in selected for x in self.conflicts[current]):
+				return None
+
+			provider = self.provides[current]
+			if provider != None:
+				if provider in provided:
+					# Only one channel can provide a provider
+					return None
+
+				provided[provider] = current
+
+		return closure
+
+	def get_enabled_channels(self, ratio):
+		"""
+		Returns a consistent set of enabled channels, about ratio of the
+		total.
+		"""
+
+		enabled = set()
+
+		for index in self.random.sample(range(self.count), self.count):
+			if len(enabled) >= self.count * ratio:
+				break
+
+			closure = self.get_closure(index, enabled)
+			if closure != None:
+				enabled |= closure
+
+		return enabled
+
+	def write_channels(self, path):
+		"""
+		Writes the channel and provider definitions.
+		"""
+
+		os.makedirs(path, exist_ok=True)
+
+		for index in range(self.provider_count):
+			with open(os.path.join(path, get_provider_name(index)), "w") as f:
+				f.write(
+					"[provider]\n"
+					"name = Provider %d\n"
+					"description = Synthetic provider %d\n" % (index, index)
+				)
+
+		for index in range(self.count):
+			lines = [
+				"[channel]",
+				"name = Channel %d" % index,
+				"description = Synthetic channel %d" % index,
+			]
+
+			if self.depends[index]:
+				lines.append("depends = %s" % " ".join(get_channel_name(x) for x in self.depends[index]))
+
+			if self.conflicts[index]:
+				lines.append("conflicts = %s" % " ".join(get_channel_name(x) for x in self.conflicts[index]))
+
+			if self.provides[index] != None:
+				lines.append("provides = %s" % get_provider_name(self.provides[index]))
+
+			for repository, codename, proposed in self.repositories[index]:
+				lines += [
+					"",
+					"[%s]" % repository,
+					"default_mirror = %s" % get_mirror(index),
+					"origin = Origin %d" % (index % 10),
+					"label = Channel %d" % index,
+					"codename = %s" % codename,
+					"components = main contrib",
+				]
+
+				if proposed:
+					lines.append("proposed = yes")
+
+			with open(os.path.join(path, "%s.channel" % get_channel_name(index)), "w") as f:
+				f.write("\n".join(lines) + "\n")
+
+	def write_lists(self, path):
+		"""
+		Writes the Release file of every repository.
+		"""
+
+		os.makedirs(path, exist_ok=True)
+
+		hashes = "".join(
+			" %064x %8d main/binary-amd64/Packages%s\n" % (x, x * 1024, ".xz" if x % 2 else "")
+			for x in range(HASH_LINES)
+		)
+
+		for index in range(self.count):
+			for repository, codename, proposed in self.repositories[index]:
+				with open(os.path.join(path, get_release_name(get_mirror(index), codename)), "w") as f:
+					f.write(
+						"Origin: Origin %d\n"
+						"Label: Channel %d\n"
+						"Suite: %s\n"
+						"Codename: %s\n"
+						"Architectures: amd64 i386\n"
+						"Components: main contrib\n"
+						"Description: Synthetic repository\n"
+						"SHA256:\n"
+						"%s" % (index % 10, index, codename, codename, hashes)
+					)
+
+	def write_sources(self, path):
+		"""
+		Writes the sources files: the main one and one for every enabled
+		channel.
+		"""
+
+		parts = os.path.join(path, "sources.list.d")
+		os.makedirs(parts, exist_ok=True)
+
+		with open(os.path.join(path, "sources.list"), "w") as f:
+			f.write(
+				"# Unrelated entries\n"
+				"deb http://unrelated.example/debian stable main\n"
+				"# deb http://unrelated.example/debian testing main\n"
+			)
+
+		for index in sorted(self.enabled):
+			lines = []
+			for repository, codename, proposed in self.repositories[index]:
+				lines.append(
+					"%sdeb %s %s main contrib" % (
+						"# " if proposed else "",
+						get_mirror(index),
+						codename
+					)
+				)
+
+			with open(os.path.join(parts, "%s.list" % get_channel_name(index)), "w") as f:
+				f.write("\n".join(lines) + "\n")
+
+	def write(self, root):
+		"""
+		Writes the whole tree in root.
+		"""
+
+		self.write_channels(os.path.join(root, "channels.d"))
+		self.write_lists(os.path.join(root, "lists"))
+		self.write_sources(os.path.join(root, "etc"))
+
+		with open(os.path.join(root, "manifest.json"), "w") as f:
+			json.dump(
+				{
+					"parameters" : self.parameters,
+					"providers" : self.provider_count,
+					"enabled" : [get_channel_name(x) for x in sorted(self.enabled)],
+				},
+				f,
+				indent=4
+			)
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description="libchannels synthetic tree generator")
+	parser.add_argument("--channels", type=int, default=100, help="number of channels (default: 100)")
+	parser.add_argument("--depends", type=int, default=2, help="maximum dependencies per channel (default: 2)")
+	parser.add_argument("--conflicts", type=float, default=0.05, help="ratio of channels with a conflict (default: 0.05)")
+	parser.add_argument("--providers", type=float, default=0.1, help="ratio of channels providing a provider (default: 0.1)")
+	parser.add_argument("--proposed", type=float, default=0.2, help="ratio of channels with a proposed repository (default: 0.2)")
+	parser.add_argument("--enabled", type=float, default=0.3, help="ratio of enabled channels (default: 0.3)")
+	parser.add_argument("--seed", type=int, default=0, help="random seed (default: 0)")
+	parser.add_argument("root", help="where to write the tree")
+	args = parser.parse_args()
+
+	Generator(
+		channels=args.channels,
+		depends=args.depends,
+		conflicts=args.conflicts,
+		providers=args.providers,
+		proposed=args.proposed,
+		enabled=args.enabled,
+		seed=args.seed
+	).write(args.root)
@@ -0,0 +1,280 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+#
+# Measures discovery, resolution and sources writes on synthetic trees.
+#
+# A tree is generated (see generate.py) for every requested scale, then
+# every benchmark is run in a fresh interpreter pointed to that tree, a
+# number of times, and the best time is reported. Use --json (or
+# --output) to get machine-readable output, to be compared between runs.
+#
+
+import os
+import sys
+import json
+import shutil
+import argparse
+import platform
+import tempfile
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+sys.path.insert(0, ROOT)
+
+from benchmarks.generate import Generator
+
+# Number of channels enabled by the actions benchmarks
+ACTION_TARGETS = 10
+
+def get_environment(root):
+	"""
+	Returns the environment pointing libchannels to the given tree.
+	"""
+
+	environment = dict(os.environ)
+	environment["PYTHONPATH"] = os.pathsep.join(
+		[ROOT] + ([environment["PYTHONPATH"]] if "PYTHONPATH" in environment else [])
+	)
+	environment["CHANNEL_SEARCH_PATH"] = os.path.join(root, "channels.d")
+	environment["CHANNEL_INDEX_PATH"] = os.path.join(root, "channels.index")
+	environment["APT_LISTS_PATH"] = os.path.join(root, "lists")
+
+	return environment
+
+def run(root, repeat, workers):
+	"""
+	Runs every benchmark on the given tree, from a fresh interpreter,
+	and returns the results.
+	"""
+
+	output = subprocess.check_output(
+		[
+			sys.executable,
+			os.path.abspath(__file__),
+			"--measure", root,
+			"--repeat", str(repeat),
+			"--workers", str(workers)
+		],
+		env=get_environment(root)
+	)
+
+	return json.loads(output.decode())
+
+def measure(root, repeat, workers):
+	"""
+	Runs every benchmark on the given tree, and returns the best time
+	(in seconds) of every one of them.
+
+	This is the benchmark process: the environment must already point
+	to the tree (see get_environment()).
+	"""
+
+	import time
+
+	# aptsources initializes the APT configuration, so it must be
+	# imported before pointing APT to the tree
+	import apt_pkg
+	import aptsources.sourceslist
+
+	apt_pkg.config.set("Dir::Etc::sourcelist", os.path.join(root, "etc", "sources.list"))
+	apt_pkg.config.set("Dir::Etc::sourceparts", os.path.join(root, "etc", "sources.list.d"))
+
+	import libchannels.common
+	import libchannels.discovery
+	import libchannels.release
+	import libchannels.resolver
+	import libchannels.actions
+
+	from libchannels.actions import ActionType
+
+	results = {}
+
+	def best(name, function, setup=None):
+		"""
+		Stores the best time of the given function. setup, if given, is
+		called (untimed) before every run.
+		"""
+
+		for i in range(repeat):
+			if setup:
+				setup()
+
+			start = time.perf_counter()
+			function()
+			elapsed = time.perf_counter() - start
+
+			if not name in results or elapsed < results[name]:
+				results[name] = elapsed
+
+	def discover(workers=0):
+		"""
+		Returns a new ChannelDiscovery, after a discovery.
+		"""
+
+		libchannels.discovery.ChannelDiscovery.cache.clear()
+		libchannels.discovery.ChannelDiscovery.channels.clear()
+
+		discovery = libchannels.discovery.ChannelDiscovery(workers=workers)
+		discovery.discover()
+
+		return discovery
+
+	def get_resolver(discovery):
+		"""
+		Returns a new DependencyResolver for the given discovery.
+		"""
+
+		return libchannels.resolver.DependencyResolver(discovery.cache)
+
+	def drop_caches():
+		"""
+		Removes the channel index, if any, and forgets the parsed Release
+		files.
+		"""
+
+		if os.path.exists(os.environ["CHANNEL_INDEX_PATH"]):
+			os.remove(os.environ["CHANNEL_INDEX_PATH"])
+
+		libchannels.release._cache.clear()
+
+	# Discovery
+	libchannels.common.get_sourceslist()
+
+	best("discover_cold", discover, setup=drop_caches)
+	best("discover_warm", discover)
+	if workers > 1:
+		best("discover_parallel", lambda: discover(workers=workers))
+
+	discovery = discover()
+	channels = sorted(channel for channel in discovery.cache if not channel.endswith(".provider"))
+
+	# Resolution
+	best("resolver", lambda: get_resolver(discovery))
+
+	resolver = get_resolver(discovery)
+	steps = [
+		(channel, ActionType.DISABLE if discovery.cache[channel].enabled else ActionType.ENABLE)
+		for channel in channels
+	]
+
+	best(
+		"solutions",
+		lambda: [resolver.get_channel_solution(channel, action) for channel, action in steps]
+	)
+	best(
+		"blockers",
+		lambda: [
+			resolver.get_channel_blockers(channel, action)
+			for channel in channels
+			for action in ActionType
+		]
+	)
+	best("matrix", resolver.get_channel_matrix)
+
+	# Sources writes. The sources are restored before every run
+	sources = os.path.join(root, "etc")
+	pristine = os.path.join(root, "etc.pristine")
+	shutil.copytree(sources, pristine)
+
+	targets = [channel for channel, action in steps if action == ActionType.ENABLE][:ACTION_TARGETS]
+	state = {}
+
+	def restore():
+		"""
+		Restores the sources, and discovers them again.
+		"""
+
+		shutil.rmtree(sources)
+		shutil.copytree(pristine, sources)
+
+		libchannels.common.sourceslist.refresh()
+
+		state["discovery"] = discover()
+		state["actions"] = libchannels.actions.Actions(
+			state["discovery"],
+			get_resolver(state["discovery"])
+		)
+
+	def enable_channels():
+		"""
+		Enables every target, one at a time.
+		"""
+
+		for channel in targets:
+			state["actions"].enable_channel(channel)
+
+	def enable_channels_transaction():
+		"""
+		Enables every target in a single transaction.
+		"""
+
+		with state["actions"].transaction():
+			enable_channels()
+
+	try:
+		best("actions", enable_channels, setup=restore)
+		best("actions_transaction", enable_channels_transaction, setup=restore)
+	finally:
+		restore()
+		shutil.rmtree(pristine)
+
+	return results
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description="libchannels synthetic scale benchmark")
+	parser.add_argument("--channels", type=int, nargs="+", default=[10, 100, 1000], help="scales to measure (default: 10 100 1000)")
+	parser.add_argument("--repeat", type=int, default=5, help="runs per benchmark (default: 5)")
+	parser.add_argument("--workers", type=int, default=4, help="workers of the parallel discovery (default: 4)")
+	parser.add_argument("--seed", type=int, default=0, help="random seed (default: 0)")
+	parser.add_argument("--keep", metavar="DIRECTORY", help="generate the trees in DIRECTORY, and keep them")
+	parser.add_argument("--json", action="store_true", help="print the results as JSON")
+	parser.add_argument("--output", metavar="FILE", help="write the results as JSON to FILE")
+	parser.add_argument("--measure", metavar="ROOT", help=argparse.SUPPRESS)
+	args = parser.parse_args()
+
+	if args.measure:
+		# Benchmark process
+		print(json.dumps(measure(args.measure, args.repeat, args.workers)))
+		sys.exit(0)
+
+	results = {
+		"python" : platform.python_version(),
+		"repeat" : args.repeat,
+		"scales" : []
+	}
+
+	for channels in args.channels:
+		if args.keep:
+			root = os.path.join(args.keep, "channels-%d" % channels)
+			if os.path.exists(root):
+				shutil.rmtree(root)
+		else:
+			root = tempfile.mkdtemp(prefix="libchannels-benchmark-")
+
+		try:
+			generator = Generator(channels=channels, seed=args.seed)
+			generator.write(root)
+
+			results["scales"].append(
+				{
+					"parameters" : generator.parameters,
+					"enabled" : len(generator.enabled),
+					"results" : run(root, args.repeat, args.workers)
+				}
+			)
+		finally:
+			if not args.keep:
+				shutil.rmtree(root)
+
+	if args.output:
+		with open(args.output, "w") as f:
+			json.dump(results, f, indent=4)
+
+	if args.json:
+		print(json.dumps(results, indent=4))
+	elif not args.output:
+		for scale in results["scales"]:
+			print("%d channels (%d enabled)" % (scale["parameters"]["channels"], scale["enabled"]))
+			for name, elapsed in scale["results"].items():
+				print("    %-25s %10.2f ms" % (name, elapsed * 1000))
@@ -0,0 +1,79 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+#
+# Measures the import time of every libchannels module.
+#
+# Every module is imported in a fresh interpreter, a number of times, and
+# the best time is reported. Use --json to get machine-readable output.
+#
+
+import os
+import sys
+import json
+import argparse
+import subprocess
+
+MODULES = [
+	"libchannels.config",
+	"libchannels.common",
+	"libchannels.relations",
+	"libchannels.actions",
+	"libchannels.channel",
+	"libchannels.provider",
+	"libchannels.discovery",
+	"libchannels.resolver",
+	"libchannels.updates",
+]
+
+# Imports the module and prints the elapsed time (in seconds)
+SNIPPET = "import time; start = time.perf_counter(); import %s; print(time.perf_counter() - start)"
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def measure(module, repeat):
+	"""
+	Returns the best import time of the given module.
+	"""
+	
+	environment = dict(os.environ)
+	environment["PYTHONPATH"] = os.pathsep.join(
+		[ROOT] + ([environment["PYTHONPATH"]] if "PYTHONPATH" in environment else [])
+	)
+	
+	best = None
+	for i in range(repeat):
+		output = subprocess.check_output(
+			[sys.executable, "-c", SNIPPET % module],
+			env=environment
+		)
+		elapsed = float(output.decode().strip())
+		
+		if best == None or elapsed < best:
+			best = elapsed
+	
+	return best
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description="libchannels import time benchmark")
+	parser.add_argument("--repeat", type=int, default=5, help="imports per module (default: 5)")
+	parser.add_argument("--json", action="store_true", help="print the results as JSON")
+	parser.add_argument("modules", nargs="*", default=MODULES, help="modules to measure")
+	args = parser.parse_args()
+	
+	results = {}
+	for module in args.modules:
+		try:
+			results[module] = measure(module, args.repeat)
+		except subprocess.CalledProcessError:
+			results[module] = None
+	
+	if args.json:
+		print(json.dumps(results, indent=4))
+	else:
+		for module, elapsed in results.items():
+			print(
+				"%-25s %s" % (
+					module,
+					"%8.2f ms" % (elapsed * 1000) if elapsed != None else "  failed"
+				)
+			)
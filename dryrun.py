@@ -2,6 +2,7 @@
 # -*- coding: utf-8 -*-
 
 import sys
+import logging
 
 import libchannels.channel
 import libchannels.discovery
@@ -9,6 +10,9 @@ import libchannels.resolver
 
 from libchannels.actions import ActionType
 
+# Channel progress is logged
+logging.basicConfig(level=logging.INFO, format="%(message)s")
+
 discovery = libchannels.discovery.ChannelDiscovery()
 
 discovery.discover()
@@ -20,6 +20,8 @@
 
 from enum import Enum
 
+import libchannels.transaction
+
 class ActionType(Enum):
 	"""
 	The ActionType enum.
@@ -43,46 +45,82 @@ class Actions:
 		self.discovery = discovery
 		self.resolver = resolver
 	
+	def transaction(self):
+		"""
+		Returns the running Transaction, or a new one.
+		
+		Every action done inside the transaction is written to disk once,
+		when the transaction is committed:
+		
+			with actions.transaction():
+				actions.enable_channel("foo")
+				actions.enable_component("bar", "proposed")
+		
+		If something fails, every change is rolled back.
+		"""
+		
+		current = libchannels.transaction.get_current()
+		
+		return current if current else libchannels.transaction.Transaction()
+	
+	def apply_solution(self, solution):
+		"""
+		Applies the given solution (as returned by
+		DependencyResolver.get_channel_solution()) in a single transaction.
+		
+		Returns the number of sources files written (0 if the write has been
+		deferred to an outer transaction).
+		"""
+		
+		transaction = self.transaction()
+		
+		with transaction:
+			for child_channel, action in solution:
+				if action == ActionType.ENABLE:
+					self.discovery.cache[child_channel].enable()
+				elif action == ActionType.DISABLE:
+					self.discovery.cache[child_channel].disable()
+		
+		return transaction.files_written if transaction.depth == 0 else 0
+	
 	def enable_channel(self, channel):
 		"""
 		Enables the given channel.
+		
+		Returns the number of sources files written.
 		"""
 		
 		if self.discovery.cache[channel].enabled:
 			# Nothing to do
-			return
+			return 0
 		
-		for child_channel, action in self.resolver.get_channel_solution(channel, ActionType.ENABLE):
-			if action == ActionType.ENABLE:
-				self.discovery.cache[child_channel].enable()
-			elif action == ActionType.DISABLE:
-				self.discovery.cache[child_channel].disable()
+		return self.apply_solution(self.resolver.get_channel_solution(channel, ActionType.ENABLE))
 	
 	def enable_component(self, channel, component):
 		"""
 		Enables the component of the given channel.
+		
+		Returns the number of sources files written.
 		"""
 		
 		if self.discovery.cache[channel].is_component_enabled(component):
 			# Nothing to do
-			return
+			return 0
 		
 		return self.discovery.cache[channel].enable_component(component)
 	
 	def disable_channel(self, channel):
 		"""
 		Disables the given channel.
+		
+		Returns the number of sources files written.
 		"""
 		
 		if not self.discovery.cache[channel].enabled:
 			# Nothing to do
-			return
+			return 0
 		
-		for child_channel, action in self.resolver.get_channel_solution(channel, ActionType.DISABLE):
-			if action == ActionType.ENABLE:
-				self.discovery.cache[child_channel].enable()
-			elif action == ActionType.DISABLE:
-				self.discovery.cache[child_channel].disable()
+		return self.apply_solution(self.resolver.get_channel_solution(channel, ActionType.DISABLE))
 	
 	def disable_component(self, channel, component):
 		"""
@@ -90,11 +128,13 @@ class Actions:
 		
 		Note: only proposed components can be disabled. Use the lower level
 		methods in Channel() to disable non-proposed components (you shouldn't).
+		
+		Returns the number of sources files written.
 		"""
 		
 		if not self.discovery.cache[channel].is_component_enabled(component):
 			# Nothing to do
-			return
+			return 0
 		elif not self.discovery.cache[channel].is_proposed(component):
 			# Non-proposed methods can't be disabled
 			raise Exception("The component is not proposed and thus can't be disabled.")
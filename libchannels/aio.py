@@ -0,0 +1,604 @@
+# -*- coding: utf-8 -*-
+#
+# libchannels - update channels management library
+# Copyright (C) 2015 Eugenio "g7" Paolantonio
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+#
+
+import asyncio
+import logging
+import threading
+
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from libchannels.actions import ActionType
+
+logger = logging.getLogger(__name__)
+
+# An event of an Operation. kind is one of:
+#   - "progress": data is a dictionary with the progress of the running
+#     step (its keys depend on the step, see the progress classes)
+#   - "item": data is a dictionary with the uri, the description and the
+#     status ("done", "failed" or "ignored") of a fetched item
+#   - "batch": data is the (index, count, status) of a pipelined batch
+#   - "change": data is a change made by the operation (a Change list for
+#     AsyncUpdates.changes(), a (channel, ActionType) for AsyncActions)
+#   - "error": data is the (error, description) of a non-fatal error
+#   - "done", "failed", "cancelled": the operation finished. data is the
+#     result, the exception, or None. Nothing comes after these.
+Event = namedtuple("Event", ["kind", "data"])
+
+FINAL_EVENTS = ("done", "failed", "cancelled")
+
+# (OpProgress, AcquireProgress, InstallProgress) reporting to an
+# Operation, built by get_progress_classes()
+_progress_classes = None
+
+def get_progress_classes():
+	"""
+	Returns the (OpProgress, AcquireProgress, InstallProgress) classes
+	reporting to an Operation.
+
+	apt is only imported on the first call, as in libchannels.updates.
+	"""
+
+	global _progress_classes
+
+	if _progress_classes != None:
+		return _progress_classes
+
+	import apt.progress.base
+
+	class OpProgress(apt.progress.base.OpProgress):
+
+		"""
+		Reports the cache opening progress.
+		"""
+
+		def __init__(self, operation):
+			"""
+			Initializes the class.
+			"""
+
+			super().__init__()
+
+			self.operation = operation
+
+		def update(self, percent=None):
+			"""
+			Emits the progress.
+			"""
+
+			super().update(percent)
+
+			self.operation.emit("progress", {"op" : self.op, "percent" : self.percent})
+
+	class AcquireProgress(apt.progress.base.AcquireProgress):
+
+		"""
+		Reports the download progress. The download is stopped when the
+		operation is cancelled.
+		"""
+
+		def __init__(self, operation):
+			"""
+			Initializes the class.
+			"""
+
+			super().__init__()
+
+			self.operation = operation
+
+		def emit_item(self, item, status):
+			"""
+			Emits the status of the given item.
+			"""
+
+			self.operation.emit(
+				"item",
+				{
+					"uri" : item.uri,
+					"description" : item.description,
+					"status" : status
+				}
+			)
+
+		def done(self, item):
+			"""
+			Called when an item has been fetched.
+			"""
+
+			self.emit_item(item, "done")
+
+		def fail(self, item):
+			"""
+			Called when an item can't be fetched.
+			"""
+
+			self.emit_item(item, "failed")
+
+		def ims_hit(self, item):
+			"""
+			Called when an item is already up-to-date.
+			"""
+
+			self.emit_item(item, "ignored")
+
+		def pulse(self, owner):
+			"""
+			Emits the progress. Returns False to stop the download.
+			"""
+
+			self.operation.emit(
+				"progress",
+				{
+					"percent" : (
+						(self.current_bytes + self.current_items) * 100.0 /
+						float(self.total_bytes + self.total_items)
+						if self.total_bytes + self.total_items
+						else 0.0
+					),
+					"current_bytes" : self.current_bytes,
+					"total_bytes" : self.total_bytes,
+					"current_cps" : self.current_cps,
+					"current_items" : self.current_items,
+					"total_items" : self.total_items,
+				}
+			)
+
+			if self.operation.cancelled:
+				# The blocking call fails or gives up from here
+				self.operation.interrupted = True
+				return False
+
+			return True
+
+	class InstallProgress(apt.progress.base.InstallProgress):
+
+		"""
+		Reports the installation progress.
+		"""
+
+		def __init__(self, operation):
+			"""
+			Initializes the class.
+			"""
+
+			super().__init__()
+
+			self.operation = operation
+
+		def status_change(self, pkg, percent, status):
+			"""
+			Emits the progress.
+			"""
+
+			self.operation.emit(
+				"progress",
+				{"package" : pkg, "percent" : percent, "status" : status}
+			)
+
+		def error(self, pkg, errormsg):
+			"""
+			Emits the error of the given package.
+			"""
+
+			self.operation.emit("error", (errormsg, pkg))
+
+	_progress_classes = (OpProgress, AcquireProgress, InstallProgress)
+
+	return _progress_classes
+
+class Operation:
+
+	"""
+	An Operation() is a blocking call running on the worker thread of an
+	AsyncUpdates or AsyncActions object.
+
+	Iterate it to get its Events, await it to get its result:
+
+		operation = updates.update()
+		async for event in operation:
+			print(event)
+
+		result = await operation
+
+	Events are queued even if nobody iterates the operation, so a single
+	consumer gets all of them.
+	"""
+
+	def __init__(self, name):
+		"""
+		Initializes the class. Must be called from the event loop.
+		"""
+
+		self.name = name
+
+		self.loop = asyncio.get_running_loop()
+		self.queue = asyncio.Queue()
+
+		# Set by cancel(), read by the worker thread
+		self.cancel_event = threading.Event()
+
+		# Set by the worker thread when the blocking call has been
+		# stopped at a cancellation point
+		self.interrupted = False
+
+		# The executor future, and the asyncio one wrapping it
+		self.work = None
+		self.future = None
+
+	@property
+	def cancelled(self):
+		"""
+		Returns True if the operation has been cancelled.
+		"""
+
+		return self.cancel_event.is_set()
+
+	def emit(self, kind, data=None):
+		"""
+		Queues an Event. Can be called from any thread.
+		"""
+
+		self.loop.call_soon_threadsafe(self.queue.put_nowait, Event(kind, data))
+
+	def start(self, executor, function, *args):
+		"""
+		Runs function(*args) on the given executor.
+		"""
+
+		def run():
+			"""
+			Runs the function, unless the operation has been cancelled
+			while queued.
+			"""
+
+			if self.cancelled:
+				raise asyncio.CancelledError()
+
+			return function(*args)
+
+		self.work = executor.submit(run)
+
+		self.future = asyncio.wrap_future(self.work, loop=self.loop)
+		self.future.add_done_callback(self.finish)
+
+		return self
+
+	def finish(self, future):
+		"""
+		Emits the final Event.
+		"""
+
+		if future.cancelled():
+			self.queue.put_nowait(Event("cancelled", None))
+		elif isinstance(future.exception(), asyncio.CancelledError):
+			self.queue.put_nowait(Event("cancelled", None))
+		elif future.exception() != None:
+			if self.interrupted:
+				# e.g. the FetchFailedException raised by a stopped
+				# apt.Cache.update()
+				self.queue.put_nowait(Event("cancelled", None))
+			else:
+				self.queue.put_nowait(Event("failed", future.exception()))
+		elif self.interrupted and not future.result():
+			# The blocking call gave up because of the cancellation
+			self.queue.put_nowait(Event("cancelled", None))
+		else:
+			self.queue.put_nowait(Event("done", future.result()))
+
+	def cancel(self):
+		"""
+		Cancels the operation.
+
+		A queued operation is never started. A running one is stopped at
+		its next cancellation point (every download progress pulse): the
+		package manager is never interrupted, so a running installation
+		goes on until the end. A running operation that isn't stopped
+		reports its result as usual.
+		"""
+
+		self.cancel_event.set()
+
+		# Only effective if the operation has not been started yet: the
+		# asyncio future follows the executor one
+		self.work.cancel()
+
+	async def __aiter__(self):
+		"""
+		Yields the Events, until the operation finishes.
+		"""
+
+		while True:
+			event = await self.queue.get()
+
+			yield event
+
+			if event.kind in FINAL_EVENTS:
+				break
+
+	async def wait(self):
+		"""
+		Waits for the operation and returns its result.
+
+		Raises the exception of the blocking call, or
+		asyncio.CancelledError if the operation has been cancelled. If the
+		waiting task is cancelled, the operation is cancelled as well.
+		"""
+
+		try:
+			result = await asyncio.shield(self.future)
+		except asyncio.CancelledError:
+			self.cancel()
+			raise
+		except Exception:
+			if self.interrupted:
+				raise asyncio.CancelledError()
+
+			raise
+
+		if self.interrupted and not result:
+			raise asyncio.CancelledError()
+
+		return result
+
+	def __await__(self):
+		"""
+		Makes the operation awaitable, see wait().
+		"""
+
+		return self.wait().__await__()
+
+class AsyncUpdates:
+
+	"""
+	The AsyncUpdates() class runs the blocking methods of an Updates()
+	object off the event loop, returning Operations.
+
+	APT is not thread-safe: every operation runs on the same worker
+	thread, in submission order. The worker can be shared with an
+	AsyncActions object by passing the same executor.
+
+	While an operation runs, the progress attributes of the Updates()
+	object are replaced by ones reporting to the operation.
+	"""
+
+	def __init__(self, updates, executor=None):
+		"""
+		Initializes the class.
+		"""
+
+		self.updates = updates
+		self.executor = executor if executor else ThreadPoolExecutor(max_workers=1)
+
+	def run(self, name, function, *args):
+		"""
+		Returns a started Operation calling function(*args).
+		"""
+
+		operation = Operation(name)
+
+		return operation.start(self.executor, self.call, operation, function, args)
+
+	def call(self, operation, function, args):
+		"""
+		Calls function(*args) on the worker thread, with the progress
+		attributes and the callbacks of the Updates() object reporting to
+		operation.
+		"""
+
+		OpProgress, AcquireProgress, InstallProgress = get_progress_classes()
+
+		attributes = {
+			"cache_progress" : OpProgress(operation),
+			"cache_acquire_progress" : AcquireProgress(operation),
+			"packages_acquire_progress" : AcquireProgress(operation),
+			"packages_install_progress" : InstallProgress(operation),
+			"packages_install_failure_callback" : lambda message: operation.emit("error", (message, "")),
+			"packages_batch_callback" : lambda index, count, status: operation.emit("batch", (index, count, status)),
+			"generic_failure_callback" : lambda error, description: operation.emit("error", (error, description)),
+		}
+
+		previous = {name : getattr(self.updates, name) for name in attributes}
+
+		for name, value in attributes.items():
+			setattr(self.updates, name, value)
+
+		try:
+			return function(*args)
+		finally:
+			for name, value in previous.items():
+				setattr(self.updates, name, value)
+
+	def open_cache(self, force=False):
+		"""
+		Opens the cache. See Updates.open_cache().
+		"""
+
+		return self.run("open_cache", self.updates.open_cache, None, force)
+
+	def update(self):
+		"""
+		Updates the package cache. See Updates.update().
+		"""
+
+		return self.run("update", self.updates.update)
+
+	def mark_for_upgrade(self, dist_upgrade=False):
+		"""
+		Marks the packages for upgrade. See Updates.mark_for_upgrade().
+		"""
+
+		return self.run("mark_for_upgrade", self.updates.mark_for_upgrade, dist_upgrade)
+
+	def fetch(self):
+		"""
+		Fetches the updates. See Updates.fetch().
+		"""
+
+		return self.run("fetch", self.updates.fetch)
+
+	def install(self, pipelined=False, batch_size=50):
+		"""
+		Installs the updates. See Updates.install().
+		"""
+
+		return self.run("install", self.updates.install, pipelined, batch_size)
+
+	def change_status(self, id, reason):
+		"""
+		Changes the status of the given package. See
+		Updates.change_status().
+		"""
+
+		return self.run("change_status", self.updates.change_status, id, reason)
+
+	async def changes(self, batch_size=100):
+		"""
+		Yields the changes (see Updates.iter_changes()) as lists of at
+		most batch_size Change objects. Every batch is built on the worker
+		thread.
+		"""
+
+		loop = asyncio.get_running_loop()
+
+		batches = await loop.run_in_executor(
+			self.executor,
+			lambda: iter(self.updates.iter_changes(batch_size))
+		)
+
+		while True:
+			batch = await loop.run_in_executor(self.executor, next, batches, None)
+			if batch == None:
+				break
+
+			yield batch
+
+	def shutdown(self, wait=True):
+		"""
+		Stops the worker thread, once the queued operations are done.
+		"""
+
+		self.executor.shutdown(wait=wait)
+
+class AsyncActions:
+
+	"""
+	The AsyncActions() class runs the methods of an Actions() object off
+	the event loop, returning Operations. Every applied (channel,
+	ActionType) is emitted as a "change" Event.
+
+	Operations run on a single worker thread, in submission order.
+	"""
+
+	def __init__(self, actions, executor=None):
+		"""
+		Initializes the class.
+		"""
+
+		self.actions = actions
+		self.executor = executor if executor else ThreadPoolExecutor(max_workers=1)
+
+	def run(self, name, function, *args):
+		"""
+		Returns a started Operation calling function(operation, *args).
+		"""
+
+		operation = Operation(name)
+
+		return operation.start(self.executor, function, operation, *args)
+
+	def apply(self, operation, solution):
+		"""
+		Applies the given solution, unless the operation has been
+		cancelled, and emits its changes.
+		"""
+
+		if operation.cancelled:
+			raise asyncio.CancelledError()
+
+		files_written = self.actions.apply_solution(solution)
+
+		for change in solution:
+			operation.emit("change", change)
+
+		return files_written
+
+	def set_channel(self, operation, channel, action):
+		"""
+		Enables or disables the given channel.
+		"""
+
+		if self.actions.discovery.cache[channel].enabled == (action == ActionType.ENABLE):
+			# Nothing to do
+			return 0
+
+		return self.apply(
+			operation,
+			self.actions.resolver.get_channel_solution(channel, action)
+		)
+
+	def apply_solution(self, solution):
+		"""
+		Applies the given solution. See Actions.apply_solution().
+		"""
+
+		return self.run("apply_solution", self.apply, solution)
+
+	def enable_channel(self, channel):
+		"""
+		Enables the given channel. See Actions.enable_channel().
+		"""
+
+		return self.run("enable_channel", self.set_channel, channel, ActionType.ENABLE)
+
+	def disable_channel(self, channel):
+		"""
+		Disables the given channel. See Actions.disable_channel().
+		"""
+
+		return self.run("disable_channel", self.set_channel, channel, ActionType.DISABLE)
+
+	def enable_component(self, channel, component):
+		"""
+		Enables the component of the given channel. See
+		Actions.enable_component().
+		"""
+
+		return self.run(
+			"enable_component",
+			lambda operation: self.actions.enable_component(channel, component)
+		)
+
+	def disable_component(self, channel, component):
+		"""
+		Disables the component of the given channel. See
+		Actions.disable_component().
+		"""
+
+		return self.run(
+			"disable_component",
+			lambda operation: self.actions.disable_component(channel, component)
+		)
+
+	def shutdown(self, wait=True):
+		"""
+		Stops the worker thread, once the queued operations are done.
+		"""
+
+		self.executor.shutdown(wait=wait)
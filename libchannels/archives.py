@@ -0,0 +1,299 @@
+# -*- coding: utf-8 -*-
+#
+# libchannels - update channels management library
+# Copyright (C) 2015 Eugenio "g7" Paolantonio
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+#
+
+import os
+import json
+import hashlib
+import logging
+
+from concurrent.futures import ThreadPoolExecutor
+
+import libchannels.config
+import libchannels.metrics
+
+logger = logging.getLogger(__name__)
+
+# APT hash types -> hashlib names
+HASH_TYPES = {
+	"SHA512" : "sha512",
+	"SHA256" : "sha256",
+	"SHA1" : "sha1",
+	"MD5Sum" : "md5",
+}
+
+# Size of the chunks read while hashing. hashlib releases the GIL on
+# big chunks, so more files can be hashed at once by threads.
+CHUNK_SIZE = 1024 * 1024
+
+def get_archive(cache, rawpkg, version):
+	"""
+	Returns the (uri, hashes, size, destfile) of the given version of
+	the given apt_pkg.Package, or None if it can't be downloaded.
+
+	hashes is an apt_pkg.HashStringList, destfile the path APT stores
+	the downloaded archive to. cache is the apt.Cache.
+	"""
+
+	import apt_pkg
+
+	records = cache._records
+	sourcelist = cache._list
+
+	for package_file, index in version.file_list:
+		index_file = sourcelist.find_index(package_file)
+		if index_file and records.lookup((package_file, index)):
+			return (
+				index_file.archive_uri(records.filename),
+				records.hashes,
+				version.size,
+				# The name APT gives to downloaded archives
+				os.path.join(
+					apt_pkg.config.find_dir("Dir::Cache::archives"),
+					"%s_%s_%s.deb" % (rawpkg.name, version.ver_str.replace(":", "%3a"), version.arch)
+				)
+			)
+
+	return None
+
+def get_expected_hash(hashes):
+	"""
+	Returns the hash archives are verified against, among the given
+	"TYPE:value" strings: the strongest one, as picked by
+	apt_pkg.HashStringList.find(""). Returns None if no hash type is
+	known.
+	"""
+
+	for hash_type in HASH_TYPES:
+		for hash in hashes:
+			if hash.split(":", 1)[0] == hash_type:
+				return hash
+
+	return None
+
+def get_file_hash(path, expected):
+	"""
+	Returns the hash of the given file, in the same "TYPE:value" form of
+	expected.
+	"""
+
+	hash_type = expected.split(":", 1)[0]
+
+	hasher = hashlib.new(HASH_TYPES[hash_type])
+	with open(path, "rb") as f:
+		for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+			hasher.update(chunk)
+
+	return "%s:%s" % (hash_type, hasher.hexdigest())
+
+class ArchiveIndex:
+
+	"""
+	The ArchiveIndex() class remembers the downloaded archives that have
+	already been verified, so that they aren't hashed again (e.g. by
+	every install retry).
+
+	Every entry is keyed by path and stores the size, the mtime and the
+	expected hash the archive has been verified against: if any of them
+	changes, the archive is verified again.
+	"""
+
+	VERSION = 1
+
+	def __init__(self, path=None, workers=None):
+		"""
+		Initializes the class.
+
+		workers is the number of archives hashed at once (the number of
+		CPUs if None).
+		"""
+
+		self.path = path if path != None else libchannels.config.ARCHIVES_INDEX_PATH
+		self.workers = workers if workers else (os.cpu_count() or 1)
+
+		# path -> [size, mtime, expected hash]
+		self.entries = {}
+		self.dirty = False
+
+		self.load()
+
+	def load(self):
+		"""
+		Loads the index from disk.
+
+		A missing, unreadable or outdated index is simply ignored.
+		"""
+
+		self.entries = {}
+		self.dirty = False
+
+		if not self.path:
+			return
+
+		try:
+			with open(self.path) as f:
+				data = json.load(f)
+		except (OSError, ValueError):
+			return
+
+		if type(data) == dict and data.get("version") == self.VERSION:
+			self.entries = data["entries"]
+
+	def save(self):
+		"""
+		Writes the index to disk, if it has been changed since the last load.
+
+		The index is a cache: failing to write it is not fatal.
+		"""
+
+		if not self.path or not self.dirty:
+			return
+
+		# Forget the archives removed in the meantime (e.g. apt-get clean)
+		for path in list(self.entries):
+			if not os.path.exists(path):
+				del self.entries[path]
+
+		temp = "%s.%d.tmp" % (self.path, os.getpid())
+
+		try:
+			os.makedirs(os.path.dirname(self.path), exist_ok=True)
+
+			with open(temp, "w") as f:
+				json.dump(
+					{
+						"version" : self.VERSION,
+						"entries" : self.entries
+					},
+					f,
+					separators=(",", ":")
+				)
+
+			os.rename(temp, self.path)
+			self.dirty = False
+		except OSError as e:
+			logger.debug("Unable to write the archive index %s: %s" % (self.path, e))
+
+			if os.path.exists(temp):
+				os.remove(temp)
+
+	def is_verified(self, path, stat, expected):
+		"""
+		Returns True if the given archive has already been verified
+		against the expected hash.
+		"""
+
+		return self.entries.get(path) == [stat.st_size, stat.st_mtime_ns, expected]
+
+	def add(self, path, expected, stat=None):
+		"""
+		Marks the given archive as verified against the expected hash.
+
+		This is also the way to register the archives verified elsewhere
+		(e.g. by another process), so that verify() skips them.
+		"""
+
+		if stat == None:
+			stat = os.stat(path)
+
+		self.entries[path] = [stat.st_size, stat.st_mtime_ns, expected]
+		self.dirty = True
+
+	def verify(self, archives):
+		"""
+		Verifies the given archives, a dictionary of path -> expected
+		hash, skipping the missing and the already verified ones.
+
+		Archives not matching their hash are removed, so that APT
+		downloads them again. Returns the list of the removed paths.
+		"""
+
+		pending = []
+		for path, expected in archives.items():
+			if not expected.split(":", 1)[0] in HASH_TYPES:
+				# Leave it to APT
+				continue
+
+			try:
+				stat = os.stat(path)
+			except FileNotFoundError:
+				continue
+
+			if not self.is_verified(path, stat, expected):
+				pending.append((path, expected, stat))
+
+		libchannels.metrics.count("archives.skipped", len(archives) - len(pending))
+
+		if not pending:
+			return []
+
+		def check(archive):
+			"""
+			Returns True if the archive matches its hash.
+			"""
+
+			path, expected, stat = archive
+
+			try:
+				return get_file_hash(path, expected) == expected
+			except OSError:
+				return False
+
+		with libchannels.metrics.span("archives.verify"):
+			with ThreadPoolExecutor(max_workers=self.workers) as executor:
+				results = list(executor.map(check, pending))
+
+		libchannels.metrics.count("archives.hashed", len(pending))
+
+		removed = []
+		for (path, expected, stat), valid in zip(pending, results):
+			if valid:
+				self.add(path, expected, stat)
+			else:
+				logger.warning("%s doesn't match its hash, removing" % path)
+
+				self.entries.pop(path, None)
+				self.dirty = True
+
+				try:
+					os.remove(path)
+				except FileNotFoundError:
+					pass
+
+				removed.append(path)
+
+		return removed
+
+	def add_downloaded(self, items, archives):
+		"""
+		Marks as verified the archives APT has just downloaded (and
+		verified) with the given AcquireItems. archives is the dictionary
+		of path -> expected hash.
+		"""
+
+		for item in items:
+			if (
+				item.status == item.STAT_DONE and
+				not item.local and
+				item.destfile in archives
+			):
+				try:
+					self.add(item.destfile, archives[item.destfile])
+				except FileNotFoundError:
+					pass
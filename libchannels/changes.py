@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+#
+# libchannels - update channels management library
+# Copyright (C) 2015 Eugenio "g7" Paolantonio
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+#
+
+from array import array
+from collections import namedtuple
+
+# A package change, as returned by Updates.iter_changes().
+# status is True if the change will be applied, False if the package
+# has been kept. size is the size of the candidate, in bytes.
+Change = namedtuple("Change", ["id", "name", "version", "reason", "status", "size"])
+
+# A package seen by Updates.iter_changes(). name is the full name
+# (with the architecture, if not native) and reason the original reason
+# of the change. Unlike an apt.Package, it doesn't keep the cache alive
+# and survives cache reopens.
+PackageRecord = namedtuple("PackageRecord", ["id", "name", "reason"])
+
+# Every possible reason, as stored in the ChangeTable
+REASONS = ("remove", "downgrade", "install", "upgrade", "keep")
+
+class ChangeTable:
+
+	"""
+	The ChangeTable() class stores a list of Changes column by column,
+	so that big lists can be kept, sorted and paged cheaply.
+
+	Rows are accessed by position: table[0] is the first Change.
+	"""
+
+	COLUMNS = Change._fields
+
+	def __init__(self, changes=()):
+		"""
+		Initializes the class.
+		"""
+
+		self.ids = array("q")
+		self.names = []
+		self.versions = []
+		self.reasons = bytearray() # indexes in REASONS
+		self.status = bytearray()
+		self.sizes = array("Q")
+
+		self.extend(changes)
+
+	def append(self, change):
+		"""
+		Appends the given Change.
+		"""
+
+		self.ids.append(change.id)
+		self.names.append(change.name)
+		self.versions.append(change.version)
+		self.reasons.append(REASONS.index(change.reason))
+		self.status.append(change.status)
+		self.sizes.append(change.size)
+
+	def extend(self, changes):
+		"""
+		Appends every given Change.
+		"""
+
+		for change in changes:
+			self.append(change)
+
+	def __len__(self):
+		"""
+		Returns the number of rows.
+		"""
+
+		return len(self.ids)
+
+	def __getitem__(self, row):
+		"""
+		Returns the Change in the given row.
+		"""
+
+		return Change(
+			self.ids[row],
+			self.names[row],
+			self.versions[row],
+			REASONS[self.reasons[row]],
+			bool(self.status[row]),
+			self.sizes[row]
+		)
+
+	def __iter__(self):
+		"""
+		Iterates over the rows.
+		"""
+
+		for row in range(len(self)):
+			yield self[row]
+
+	def get_column(self, column):
+		"""
+		Returns the values of the given column (one of COLUMNS), as a
+		list.
+		"""
+
+		if column == "reason":
+			return [REASONS[reason] for reason in self.reasons]
+		elif column == "status":
+			return [bool(status) for status in self.status]
+
+		return list(getattr(self, column + "s"))
+
+	def get_row(self, id):
+		"""
+		Returns the row of the change of the given package id, or None.
+		"""
+
+		try:
+			return self.ids.index(id)
+		except ValueError:
+			return None
+
+	def sort(self, column, reverse=False):
+		"""
+		Sorts the rows in place by the given column (one of COLUMNS).
+		"""
+
+		values = self.get_column(column)
+		order = sorted(range(len(self)), key=values.__getitem__, reverse=reverse)
+
+		self.ids = array("q", (self.ids[row] for row in order))
+		self.names = [self.names[row] for row in order]
+		self.versions = [self.versions[row] for row in order]
+		self.reasons = bytearray(self.reasons[row] for row in order)
+		self.status = bytearray(self.status[row] for row in order)
+		self.sizes = array("Q", (self.sizes[row] for row in order))
+
+	def set_status(self, id, status):
+		"""
+		Sets the status of the change of the given package id.
+		"""
+
+		row = self.get_row(id)
+		if row != None:
+			self.status[row] = status
+
+	def page(self, start, count):
+		"""
+		Returns the list of the Changes in the given rows.
+		"""
+
+		return [self[row] for row in range(start, min(start + count, len(self)))]
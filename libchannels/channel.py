@@ -19,14 +19,34 @@
 #
 
 import os
-import configparser
+import logging
 
 import libchannels.common
 import libchannels.config
+import libchannels.transaction
 
-from aptsources.sourceslist import SourceEntry
+from libchannels.model import ChannelRecord, read_sections
 
-class Channel(configparser.ConfigParser):
+logger = logging.getLogger(__name__)
+
+# Generation of the sources state. Every change to a SourceEntry used by
+# a channel bumps it, invalidating the cached enabled state of every
+# channel (SourceEntry objects may be shared between channels).
+generation = 0
+
+def invalidate():
+	"""
+	Invalidates the cached enabled state of every channel.
+	
+	This should be called when a SourceEntry is changed outside of the
+	Channel methods.
+	"""
+	
+	global generation
+	
+	generation += 1
+
+class Channel:
 	
 	"""
 	A Channel is, basically, a set of Debian repositories with Dependency
@@ -56,96 +76,159 @@ class Channel(configparser.ConfigParser):
 		...
 	
 	Enabling a channel will enable every repository in the set.
+	
+	The definition itself is kept in an immutable ChannelRecord (see the
+	record attribute). Its sections are still available as read-only
+	mappings, e.g. channel["repo1"]["origin"].
 	"""
-		
-	def __init__(self, channel_name):
+	
+	__slots__ = (
+		"record",
+		"channel_name",
+		"repositories",
+		"sources",
+		"enabled_cache",
+		"enabled_generation",
+	)
+	
+	def __init__(self, channel_name, sections=None, record=None):
 		"""
 		Initializes the class.
+		
+		If record or sections (e.g. from the ChannelIndex) are given, they
+		are used in place of the channel file.
 		"""
 		
-		super().__init__()
+		if record == None:
+			if sections == None:
+				sections = read_sections(
+					os.path.join(libchannels.config.CHANNEL_SEARCH_PATH, "%s.channel" % channel_name)
+				)
+			
+			record = ChannelRecord(sections)
+		
+		self.record = record
 		
 		self.repositories = {}
 		self.sources = {}
 		
-		self.channel_name = channel_name
+		# Cached enabled state, valid for the given generation
+		self.enabled_cache = None
+		self.enabled_generation = None
 		
-		self.read(os.path.join(libchannels.config.CHANNEL_SEARCH_PATH, "%s.channel" % channel_name))
+		self.channel_name = channel_name
 		
 		# Build repository dictionary
-		for repository in self.sections():
-			if repository == "channel":
-				continue
-			
+		for repository in self.record.repositories:
 			self.repositories[repository] = None # check() will eventually change that to the appropriate SourceEntry
 			self.sources[repository] = None # like above
 	
 	def disable_component(self, name, save=True):
 		"""
 		Disables a component.
+		
+		Returns the number of sources files written.
 		"""
 		
-		print("Disabling component %s..." % name)
+		logger.info("Disabling component %s..." % name)
 		
 		source_entry = self.repositories[name]
 		source_source = self.sources[name]
 		
 		if source_entry:
+			libchannels.transaction.record_entry(source_entry)
 			source_entry.set_enabled(False)
 		if source_source:
+			libchannels.transaction.record_entry(source_source)
 			source_source.set_enabled(False)
 		
-		if save:
-			libchannels.common.sourceslist.save()
+		invalidate()
+		
+		return libchannels.transaction.save() if save else 0
 
 	def disable(self):
 		"""
 		Disables enitrely the channel.
+		
+		Returns the number of sources files written.
 		"""
 		
-		print("Disabling %s channel..." % self.channel_name)
+		logger.info("Disabling %s channel..." % self.channel_name)
 		
 		for repository in self.repositories:
 			self.disable_component(repository, save=False)
 		
-		libchannels.common.sourceslist.save()
+		return libchannels.transaction.save()
 	
 	def enable_component(self, name, save=True):
 		"""
 		Enables a component.
+		
+		Returns the number of sources files written.
 		"""
 		
-		print("Enabling component %s..." % name)
+		import apt_pkg
+		from aptsources.sourceslist import SourceEntry
+		
+		logger.info("Enabling component %s..." % name)
 		
 		source_entry = self.repositories[name]
 		source_source = self.sources[name]
 		
 		if type(source_entry) == SourceEntry:
+			libchannels.transaction.record_entry(source_entry)
 			source_entry.set_enabled(True)
 		else:
 			# Manually add the entry
-			self.repositories[name] = libchannels.common.sourceslist.add(
+			repository = self.record.repositories[name]
+			sourceslist = libchannels.common.sourceslist
+			
+			# add() may return an existing matching entry, changed in
+			# place: keep the state of the candidates to journal it
+			states = {
+				id(entry) : libchannels.transaction.get_state(entry)
+				for entry in sourceslist.list
+				if entry.type == "deb" and entry.dist == repository.codename
+			}
+			
+			libchannels.transaction.record_mapping(self.repositories, name)
+			self.repositories[name] = sourceslist.add(
 				"deb",
-				self[name]["default_mirror"],
-				self[name]["codename"],
-				self[name]["components"].split(" "), # FIXME
+				repository.default_mirror,
+				repository.codename,
+				list(repository.components),
 				comment=name,
-				file="/etc/apt/sources.list.d/%s.list" % self.channel_name
+				file=os.path.join(
+					apt_pkg.config.find_dir("Dir::Etc::sourceparts"),
+					"%s.list" % self.channel_name
+				)
 			)
+			
+			if id(self.repositories[name]) in states:
+				libchannels.transaction.record_entry(
+					self.repositories[name],
+					states[id(self.repositories[name])]
+				)
+			else:
+				libchannels.transaction.record_added(self.repositories[name])
 		
 		# FIXME: Should offer the possibility to create a new deb-src entry.
 		if type(source_source) == SourceEntry:
+			libchannels.transaction.record_entry(source_source)
 			source_source.set_enabled(True)
 		
-		if save:
-			libchannels.common.sourceslist.save()
+		invalidate()
+		
+		return libchannels.transaction.save() if save else 0
 	
 	def enable(self):
 		"""
 		Enables the channel.
+		
+		Returns the number of sources files written.
 		"""
 		
-		print("Enabling %s channel..." % self.channel_name)
+		logger.info("Enabling %s channel..." % self.channel_name)
 		
 		for repository in self.repositories:
 			if self.is_proposed(repository):
@@ -154,35 +237,50 @@ class Channel(configparser.ConfigParser):
 			
 			self.enable_component(repository, save=False)
 		
-		libchannels.common.sourceslist.save()
+		return libchannels.transaction.save()
 
 	def get_dependencies(self):
 		"""
 		Returns a list of the channel's dependencies.
 		"""
 		
-		return self["channel"]["depends"].split(" ") if "depends" in self["channel"] else []
+		return list(self.record.depends)
 	
 	def get_conflicts(self):
 		"""
 		Returns a list of the channel's conflicts.
 		"""
 		
-		return self["channel"]["conflicts"].split(" ") if "conflicts" in self["channel"] else []
+		return list(self.record.conflicts)
 	
 	def get_providers(self):
 		"""
 		Returns a list of the channel's provides.
 		"""
 		
-		return self["channel"]["provides"].split(" ") if "provides" in self["channel"] else []
+		return list(self.record.provides)
+	
+	def __getitem__(self, section):
+		"""
+		Returns the given section of the definition, as a read-only
+		mapping.
+		"""
+		
+		return self.record.sections[section]
+	
+	def sections(self):
+		"""
+		Returns the list of the sections of the definition.
+		"""
+		
+		return list(self.record.sections)
 	
 	def __str__(self):
 		"""
 		Returns a stringified version of the object.
 		"""
 		
-		return self["channel"]["name"]
+		return self.record.name
 	
 	def check(self, uri, origin, label, codenames, source_entry):
 		"""
@@ -195,46 +293,69 @@ class Channel(configparser.ConfigParser):
 		if type(codenames) == str:
 			codenames = [codenames]
 		
-		for repository in self.repositories:
+		for repository, record in self.record.repositories.items():
 			
-			#print(self["channel"]["name"], origin, codename, source_entry)
+			#print(self.record.name, origin, codename, source_entry)
 			
-			if ((origin and origin != self[repository]["origin"]) or
-				(not origin and not (
-					self[repository]["default_mirror"] + "/"
-					if not self[repository]["default_mirror"].endswith("/")
-					else self[repository]["default_mirror"]
-				) == uri)
+			if ((origin and origin != record.origin) or
+				(not origin and not record.mirror_uri == uri)
 			):
 				continue
 			
-			if not self[repository]["codename"] in codenames:
+			if not record.codename in codenames:
 				continue
 			
-			if label and ("label" in self[repository] and label != self[repository]["label"]):
+			if label and (record.label != None and label != record.label):
 				continue
 			
 			# Good!
-			if source_entry.type == "deb":
-				self.repositories[repository] = source_entry
-			elif source_entry.type == "deb-src":
-				self.sources[repository] = source_entry
+			self.assign(repository, source_entry)
+	
+	def reset(self):
+		"""
+		Forgets every SourceEntry previously set by check().
+		"""
+		
+		for repository in self.repositories:
+			self.repositories[repository] = None
+			self.sources[repository] = None
+		
+		invalidate()
+	
+	def assign(self, repository, source_entry):
+		"""
+		Sets the given SourceEntry as the one of the given repository.
+		"""
+		
+		if source_entry.type == "deb":
+			self.repositories[repository] = source_entry
+		elif source_entry.type == "deb-src":
+			self.sources[repository] = source_entry
+		
+		invalidate()
+	
+	def get_mirror_uri(self, repository):
+		"""
+		Returns the default mirror of the given repository, with the
+		trailing slash.
+		"""
+		
+		return self.record.repositories[repository].mirror_uri
 		
 	def is_proposed(self, name):
 		"""
 		Returns True if the repository name is proposed, False if not.
 		"""
 		
-		return (
-			"proposed" in self[name] and
-			self[name].getboolean("proposed")
-		)
+		return self.record.repositories[name].proposed
 	
 	def is_sourceentry_enabled(self, name, repository, skip_proposed=False):
 		"""
 		Returns True if the sourceentry is enabled, False if not.
 		"""
-				
+		
+		from aptsources.sourceslist import SourceEntry
+		
 		return (
 			(
 				type(repository) == SourceEntry and
@@ -258,13 +379,19 @@ class Channel(configparser.ConfigParser):
 		Returns True if the component name is available, False if not.
 		"""
 		
-		return (name in self.sections()) if not name == "channel" else False
+		return (name in self.record.repositories)
 	
 	@property
 	def enabled(self):
 		"""
 		Returns True if the channel is enabled, False if not.
+		
+		The result is cached until the sources change (see invalidate()).
 		"""
 		
-		#return (not (None in self.repositories.values()))
-		return (not (False in [self.is_sourceentry_enabled(x, y, skip_proposed=True) for x, y in self.repositories.items()]))
+		if self.enabled_generation != generation:
+			#return (not (None in self.repositories.values()))
+			self.enabled_cache = (not (False in [self.is_sourceentry_enabled(x, y, skip_proposed=True) for x, y in self.repositories.items()]))
+			self.enabled_generation = generation
+		
+		return self.enabled_cache
@@ -20,13 +20,36 @@
 
 import logging
 
-import apt_pkg
-import aptsources.sourceslist
-
 logger = logging.getLogger(__name__)
 
-# Sourceslist
-sourceslist = aptsources.sourceslist.SourcesList()
+# Sourceslist. This is built on first use (see get_sourceslist()), as
+# parsing every sources file is expensive and not everyone needs it.
+_sourceslist = None
+
+def get_sourceslist():
+	"""
+	Returns the shared aptsources SourcesList, building it if needed.
+	"""
+	
+	global _sourceslist, sourceslist
+	
+	if _sourceslist == None:
+		import aptsources.sourceslist
+		
+		_sourceslist = sourceslist = aptsources.sourceslist.SourcesList()
+	
+	return _sourceslist
+
+def __getattr__(name):
+	"""
+	Builds the lazy module state on first access, so that
+	libchannels.common.sourceslist keeps working.
+	"""
+	
+	if name == "sourceslist":
+		return get_sourceslist()
+	
+	raise AttributeError("module %r has no attribute %r" % (__name__, name))
 
 def lock(
 	lock_failed_callback=None
@@ -46,6 +69,8 @@ def lock(
 			The function wrapper.
 			"""
 			
+			import apt_pkg
+			
 			try:
 				with apt_pkg.SystemLock():
 					return obj(self, *args, **kwargs)
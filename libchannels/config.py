@@ -21,3 +21,22 @@
 import os
 
 CHANNEL_SEARCH_PATH = os.environ["CHANNEL_SEARCH_PATH"] if "CHANNEL_SEARCH_PATH" in os.environ else "/etc/channels.d"
+
+# Compiled index of CHANNEL_SEARCH_PATH, used to skip parsing unchanged
+# channel files on warm discoveries. Set it to an empty string to disable it.
+CHANNEL_INDEX_PATH = os.environ["CHANNEL_INDEX_PATH"] if "CHANNEL_INDEX_PATH" in os.environ else "/var/cache/libchannels/channels.index"
+
+# Where APT stores the downloaded indexes (Release, InRelease, ...)
+APT_LISTS_PATH = os.environ["APT_LISTS_PATH"] if "APT_LISTS_PATH" in os.environ else "/var/lib/apt/lists"
+
+# Number of threads used by the discovery to parse the channel definitions
+# and the Release files. 0 or 1 keeps the discovery serial.
+DISCOVERY_WORKERS = int(os.environ["DISCOVERY_WORKERS"]) if "DISCOVERY_WORKERS" in os.environ else 0
+
+# Archives of APT already verified against their hash, used to skip
+# hashing them again on install retries. Set it to an empty string to
+# disable it.
+ARCHIVES_INDEX_PATH = os.environ["ARCHIVES_INDEX_PATH"] if "ARCHIVES_INDEX_PATH" in os.environ else "/var/cache/libchannels/archives.index"
+
+# Unix socket of the libchannels daemon (see libchannels.daemon)
+DAEMON_SOCKET_PATH = os.environ["DAEMON_SOCKET_PATH"] if "DAEMON_SOCKET_PATH" in os.environ else "/run/libchannels.sock"
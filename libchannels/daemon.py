@@ -0,0 +1,630 @@
+# -*- coding: utf-8 -*-
+#
+# libchannels - update channels management library
+# Copyright (C) 2015 Eugenio "g7" Paolantonio
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+#
+
+import os
+import json
+import time
+import inspect
+import socket
+import logging
+import selectors
+
+import libchannels.config
+import libchannels.metrics
+import libchannels.discovery
+import libchannels.resolver
+import libchannels.actions
+import libchannels.watch
+
+from libchannels.actions import ActionType
+
+logger = logging.getLogger(__name__)
+
+# The wire format is newline-delimited JSON. Every request is a line
+# like:
+#
+#     {"id":1,"method":"blockers","params":{"channel":"foo"}}
+#
+# and gets a response line with the same id, and either the result or
+# the error message:
+#
+#     {"id":1,"result":[{"relation":"Dependency","target":"bar"}]}
+#     {"id":1,"error":"Unknown channel: foo"}
+#
+# Responses are sent in the request order. Actions are "enable" and
+# "disable".
+
+# Action names on the wire
+ACTIONS = {
+	"enable" : ActionType.ENABLE,
+	"disable" : ActionType.DISABLE,
+}
+
+# Requests longer than this (in bytes) close the connection
+MAX_REQUEST_SIZE = 64 * 1024
+
+def encode(message):
+	"""
+	Returns the given message as a compact JSON line.
+	"""
+
+	return json.dumps(message, separators=(",", ":")).encode("utf-8") + b"\n"
+
+class DaemonError(Exception):
+
+	"""
+	Raised when a request can't be served, and by the Client() when the
+	daemon returns an error.
+	"""
+
+	pass
+
+class Daemon:
+
+	"""
+	The Daemon() class keeps a ChannelDiscovery and a DependencyResolver
+	warm, and serves queries about them over a Unix socket.
+
+	The discovery is kept up-to-date by a DiscoveryWatcher: only the
+	changed channel definitions are reloaded, and only the relations
+	pointing to them are built again.
+
+	Everything runs in a single thread, so requests and refreshes never
+	overlap.
+	"""
+
+	def __init__(self, path=None, use_inotify=True):
+		"""
+		Initializes the class.
+		"""
+
+		self.path = path if path != None else libchannels.config.DAEMON_SOCKET_PATH
+
+		self.discovery = libchannels.discovery.ChannelDiscovery()
+		self.watcher = libchannels.watch.DiscoveryWatcher(
+			self.discovery,
+			callback=self.on_changes,
+			use_inotify=use_inotify
+		)
+
+		self.resolver = None
+		self.actions = None
+
+		self.selector = None
+		self.server = None
+
+		# socket -> [input buffer, output buffer]
+		self.clients = {}
+
+		self.running = False
+		self.next_poll = 0
+
+		self.methods = {
+			"ping" : self.ping,
+			"status" : self.status,
+			"blockers" : self.blockers,
+			"solution" : self.solution,
+			"apply" : self.apply,
+			"refresh" : self.refresh,
+		}
+
+	def load(self):
+		"""
+		Runs the discovery and builds the resolver.
+
+		This is all call() needs: a loaded Daemon() can serve requests
+		in-process, e.g. when no daemon is running.
+		"""
+
+		self.discovery.discover()
+
+		self.resolver = libchannels.resolver.DependencyResolver(self.discovery.cache)
+		self.actions = libchannels.actions.Actions(self.discovery, self.resolver)
+
+	def start(self):
+		"""
+		Loads everything, if needed, starts watching for changes and starts
+		listening.
+
+		Raises DaemonError if another daemon is listening on the socket.
+		"""
+
+		if self.resolver == None:
+			self.load()
+
+		self.watcher.start()
+
+		if os.path.exists(self.path):
+			client = Client.connect(self.path)
+			if client != None:
+				client.close()
+				raise DaemonError("A daemon is already listening on %s" % self.path)
+
+			# Left by a previous daemon
+			os.remove(self.path)
+
+		os.makedirs(os.path.dirname(self.path), exist_ok=True)
+
+		self.server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+
+		# Requests can change the system sources: only the owner can
+		# connect
+		umask = os.umask(0o177)
+		try:
+			self.server.bind(self.path)
+		finally:
+			os.umask(umask)
+
+		self.server.listen()
+		self.server.setblocking(False)
+
+		self.selector = selectors.DefaultSelector()
+		self.selector.register(self.server, selectors.EVENT_READ, self.accept)
+
+		if self.watcher.fileno() != None:
+			self.selector.register(self.watcher.fileno(), selectors.EVENT_READ, self.on_watcher)
+
+		self.running = True
+
+		logger.info("Listening on %s" % self.path)
+
+	def stop(self):
+		"""
+		Makes run() return.
+		"""
+
+		self.running = False
+
+	def close(self):
+		"""
+		Closes every connection and the socket, and stops watching.
+		"""
+
+		for connection in list(self.clients):
+			self.disconnect(connection)
+
+		if self.selector:
+			self.selector.close()
+			self.selector = None
+
+		if self.server:
+			self.server.close()
+			self.server = None
+
+			try:
+				os.remove(self.path)
+			except FileNotFoundError:
+				pass
+
+		self.watcher.stop()
+
+	def run(self):
+		"""
+		Serves the requests until stop() is called.
+		"""
+
+		if not self.running:
+			self.start()
+
+		try:
+			while self.running:
+				if self.watcher.fileno() == None:
+					# Polling, don't let busy clients delay it forever
+					timeout = max(0, self.next_poll - time.monotonic())
+				else:
+					timeout = None
+
+				for key, mask in self.selector.select(timeout):
+					key.data(key.fileobj, mask)
+
+				if self.watcher.fileno() == None and time.monotonic() >= self.next_poll:
+					self.watcher.wait(timeout=0)
+					self.next_poll = time.monotonic() + self.watcher.POLL_INTERVAL
+		finally:
+			self.close()
+
+	def on_watcher(self, fd, mask):
+		"""
+		Applies the changes reported by inotify.
+		"""
+
+		self.watcher.wait(timeout=0)
+
+	def on_changes(self, events):
+		"""
+		Updates the resolver after the discovery changed.
+		"""
+
+		logger.info("Changes: %s" % ", ".join("%s %s" % (event.type.name.lower(), event.channel) for event in events))
+
+		channels = [
+			event.channel
+			for event in events
+			if event.type in (
+				libchannels.watch.ChangeType.ADDED,
+				libchannels.watch.ChangeType.CHANGED,
+				libchannels.watch.ChangeType.REMOVED
+			)
+		]
+
+		if channels:
+			for channel, e in self.resolver.refresh(channels).items():
+				# A relation points to a missing channel. The previous
+				# relations are kept until it's fixed.
+				logger.warning("Unable to refresh the relations of %s: missing channel %s" % (channel, e))
+
+	def accept(self, server, mask):
+		"""
+		Accepts a new connection.
+		"""
+
+		try:
+			connection, address = server.accept()
+		except BlockingIOError:
+			return
+
+		connection.setblocking(False)
+
+		self.clients[connection] = [bytearray(), bytearray()]
+		self.selector.register(connection, selectors.EVENT_READ, self.on_client)
+
+	def disconnect(self, connection):
+		"""
+		Closes the given connection.
+		"""
+
+		self.clients.pop(connection, None)
+
+		try:
+			self.selector.unregister(connection)
+		except (KeyError, ValueError):
+			pass
+
+		connection.close()
+
+	def on_client(self, connection, mask):
+		"""
+		Reads the requests of the given connection, and sends the pending
+		responses.
+		"""
+
+		input, output = self.clients[connection]
+
+		if mask & selectors.EVENT_READ:
+			try:
+				data = connection.recv(65536)
+			except BlockingIOError:
+				data = None
+			except OSError:
+				data = b""
+
+			if data == b"":
+				self.disconnect(connection)
+				return
+
+			if data:
+				input += data
+
+			while True:
+				end = input.find(b"\n")
+				if end < 0:
+					break
+
+				line = bytes(input[:end])
+				del input[:end+1]
+
+				if line.strip():
+					output += self.handle(line)
+
+			if len(input) > MAX_REQUEST_SIZE:
+				logger.warning("Request too long, closing the connection")
+				self.disconnect(connection)
+				return
+
+		if output:
+			try:
+				sent = connection.send(output)
+				del output[:sent]
+			except BlockingIOError:
+				pass
+			except OSError:
+				self.disconnect(connection)
+				return
+
+		self.selector.modify(
+			connection,
+			selectors.EVENT_READ | (selectors.EVENT_WRITE if output else 0),
+			self.on_client
+		)
+
+	def handle(self, line):
+		"""
+		Serves the given request line, and returns the response line.
+		"""
+
+		id = None
+
+		try:
+			with libchannels.metrics.span("daemon.request"):
+				try:
+					request = json.loads(line.decode("utf-8"))
+				except ValueError:
+					raise DaemonError("Invalid request")
+
+				if type(request) != dict:
+					raise DaemonError("Invalid request")
+
+				id = request.get("id")
+				params = request.get("params", {})
+
+				if type(params) != dict:
+					raise DaemonError("Invalid parameters")
+
+				response = {"id" : id, "result" : self.call(request.get("method"), **params)}
+		except Exception as e:
+			if not isinstance(e, DaemonError):
+				logger.exception("Unable to serve %s" % line)
+
+			response = {"id" : id, "error" : str(e) or type(e).__name__}
+
+		libchannels.metrics.count("daemon.requests")
+
+		return encode(response)
+
+	def call(self, method, **params):
+		"""
+		Serves the given request, and returns its result (as sent on the
+		wire).
+
+		Raises DaemonError if the request is invalid or fails: the
+		errors are the same whether the request comes from the socket or
+		not.
+		"""
+
+		if not method in self.methods:
+			raise DaemonError("Unknown method: %s" % method)
+
+		try:
+			inspect.signature(self.methods[method]).bind(**params)
+		except TypeError as e:
+			raise DaemonError("Invalid parameters for %s: %s" % (method, e))
+
+		try:
+			return self.methods[method](**params)
+		except DaemonError:
+			raise
+		except KeyError as e:
+			# A relation points to a missing channel
+			logger.debug("Unable to serve %s" % method, exc_info=True)
+
+			raise DaemonError("Missing channel: %s" % str(e).strip("'"))
+		except Exception as e:
+			# e.g. DependencyCycleError
+			logger.debug("Unable to serve %s" % method, exc_info=True)
+
+			raise DaemonError(str(e) or type(e).__name__)
+
+	def get_channel(self, channel):
+		"""
+		Raises DaemonError if the given channel is unknown.
+		"""
+
+		if not channel in self.resolver.relations or not channel in self.discovery.cache:
+			raise DaemonError("Unknown channel: %s" % channel)
+
+		return self.discovery.cache[channel]
+
+	@staticmethod
+	def get_action(action):
+		"""
+		Returns the ActionType of the given action name.
+		"""
+
+		if not action in ACTIONS:
+			raise DaemonError("Unknown action: %s" % action)
+
+		return ACTIONS[action]
+
+	@staticmethod
+	def encode_solution(solution):
+		"""
+		Returns the given solution in the wire format.
+		"""
+
+		if solution == None:
+			return None
+
+		return [[channel, action.name.lower()] for channel, action in solution]
+
+	def ping(self):
+		"""
+		Returns True.
+		"""
+
+		return True
+
+	def status(self, channel=None):
+		"""
+		Returns the status of the given channel, or of every channel, as
+		a dictionary of channel -> {"enabled", "enableable"}.
+		"""
+
+		if channel != None:
+			self.get_channel(channel)
+
+		return {
+			name : {
+				"enabled" : self.discovery.cache[name].enabled,
+				"enableable" : self.resolver.is_channel_enableable(name),
+			}
+			for name in ([channel] if channel != None else sorted(self.resolver.relations))
+			if name in self.discovery.cache
+		}
+
+	def blockers(self, channel, action="enable"):
+		"""
+		Returns the blockers of the given action on the given channel, as
+		a list of {"relation", "target"}.
+		"""
+
+		self.get_channel(channel)
+
+		return [
+			{
+				"relation" : type(relation).__name__,
+				"target" : relation.get_name()
+			}
+			for relation in self.resolver.get_channel_blockers(channel, self.get_action(action))
+		]
+
+	def solution(self, channel, action="enable"):
+		"""
+		Returns the solution of the given action on the given channel, as
+		a list of [channel, action], or None.
+		"""
+
+		self.get_channel(channel)
+
+		return self.encode_solution(
+			self.resolver.get_channel_solution(channel, self.get_action(action))
+		)
+
+	def apply(self, channel, action="enable"):
+		"""
+		Applies the given action on the given channel, and returns the
+		applied solution and the number of sources files written.
+		"""
+
+		action = self.get_action(action)
+
+		if self.get_channel(channel).enabled == (action == ActionType.ENABLE):
+			# Nothing to do
+			solution = []
+		else:
+			solution = self.resolver.get_channel_solution(channel, action)
+			if solution == None:
+				raise DaemonError("Unable to %s %s" % (action.name.lower(), channel))
+
+		return {
+			"solution" : self.encode_solution(solution),
+			"files_written" : self.actions.apply_solution(solution) if solution else 0,
+		}
+
+	def refresh(self):
+		"""
+		Checks every channel definition and the sources again, and
+		returns the number of changes found.
+		"""
+
+		events = self.watcher.process(set(), True, True, overflow=True)
+
+		if events:
+			self.on_changes(events)
+
+		return len(events)
+
+class Client:
+
+	"""
+	The Client() class sends requests to a running Daemon():
+
+		client = Client.connect()
+		if client:
+			print(client.call("blockers", channel="foo"))
+	"""
+
+	def __init__(self, path=None, timeout=30):
+		"""
+		Initializes the class.
+
+		Raises OSError if the daemon is not available.
+		"""
+
+		self.path = path if path != None else libchannels.config.DAEMON_SOCKET_PATH
+
+		self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+		self.socket.settimeout(timeout)
+
+		try:
+			self.socket.connect(self.path)
+		except OSError:
+			self.socket.close()
+			raise
+
+		self.file = self.socket.makefile("rwb")
+
+		self.next_id = 0
+
+	@classmethod
+	def connect(cls, path=None, timeout=30):
+		"""
+		Returns a Client() connected to the daemon, or None if the daemon
+		is not available.
+		"""
+
+		try:
+			return cls(path, timeout)
+		except OSError:
+			return None
+
+	def call(self, method, **params):
+		"""
+		Sends the given request, and returns its result.
+
+		Raises DaemonError if the daemon returns an error.
+		"""
+
+		self.next_id += 1
+
+		self.file.write(encode({"id" : self.next_id, "method" : method, "params" : params}))
+		self.file.flush()
+
+		line = self.file.readline()
+		if not line:
+			raise DaemonError("Connection closed by the daemon")
+
+		response = json.loads(line.decode("utf-8"))
+
+		if "error" in response:
+			raise DaemonError(response["error"])
+
+		return response["result"]
+
+	def close(self):
+		"""
+		Closes the connection.
+		"""
+
+		self.file.close()
+		self.socket.close()
+
+	def __enter__(self):
+		"""
+		Returns the client.
+		"""
+
+		return self
+
+	def __exit__(self, type, value, traceback):
+		"""
+		Closes the connection.
+		"""
+
+		self.close()
@@ -20,10 +20,16 @@
 
 import os
 
+from concurrent.futures import ThreadPoolExecutor
+
 import libchannels.channel
 import libchannels.provider
 import libchannels.common
 import libchannels.config
+import libchannels.index
+import libchannels.matcher
+import libchannels.metrics
+import libchannels.release
 
 class ChannelDiscovery:
 	
@@ -35,37 +41,217 @@ class ChannelDiscovery:
 	cache = {}
 	channels = {}
 	
-	def __init__(self):
+	def __init__(self, use_index=True, workers=None):
 		"""
 		Initializes the class.
+		
+		If use_index is True, the channel definitions are loaded through
+		the ChannelIndex.
+		
+		workers is the number of threads used to parse the channel
+		definitions and the Release files (DISCOVERY_WORKERS if None).
+		With 0 or 1 workers, the discovery is serial.
 		"""
 		
-		pass
+		self.index = libchannels.index.ChannelIndex() if use_index else None
+		
+		self.workers = workers if workers != None else libchannels.config.DISCOVERY_WORKERS
+		
+		self.matcher = None
+		
+		# (uri, origin, label, codenames, SourceEntry) for every sources
+		# entry, as used by the last matching
+		self.sources_info = []
 	
+	@libchannels.metrics.timed("discovery.discover")
 	def discover(self):
 		"""
 		Discovers the currently enabled channels.
 		"""
-				
-		# Pre-load channels
-		for channel in os.listdir(libchannels.config.CHANNEL_SEARCH_PATH):
+		
+		with libchannels.metrics.span("discovery.load_channels"):
+			if self.index:
+				self.index.load()
 			
-			if not channel.endswith(".channel") and not channel.endswith(".provider"):
-				continue
+			# Pre-load channels
+			entries = [
+				entry
+				for entry in os.scandir(libchannels.config.CHANNEL_SEARCH_PATH)
+				if entry.name.endswith(".channel") or entry.name.endswith(".provider")
+			]
 			
-			# Obtain name
-			channel = channel.replace(".channel","")
+			# Results are merged in the scandir order, whatever the order
+			# the workers finish in
+			for channel, obj in self.map(
+				lambda entry: self.parse_channel(entry.name, entry.stat()),
+				entries
+			):
+				self.cache[channel] = obj
 			
-			if channel.endswith(".provider"):
-				self.cache[channel] = libchannels.provider.Provider(channel)
-			else:
-				self.cache[channel] = libchannels.channel.Channel(channel)
-				
+			paths = set(entry.path for entry in entries)
+			
+			if self.index:
+				# Drop the entries of removed files and store the updated index
+				self.index.prune(paths)
+				self.index.save()
+		
+		libchannels.metrics.count("discovery.channels_loaded", len(entries))
+		
+		# Index the channel repositories once
+		self.matcher = libchannels.matcher.RepositoryMatcher(self.cache)
+		
 		# Loop through enabled repositories to get a list of enabled channels
-		for repository in libchannels.common.sourceslist:
-			if repository.uri == "":
-				continue
+		self.scan_sources()
+		self.match_sources()
+		
+		self.update_channels()
+	
+	def map(self, function, iterable):
+		"""
+		Returns the list of the results of function applied to every
+		item of iterable, in order.
+		
+		The calls are spread across the workers, if any.
+		"""
+		
+		if self.workers > 1:
+			with ThreadPoolExecutor(max_workers=self.workers) as executor:
+				return list(executor.map(function, iterable))
+		
+		return [function(item) for item in iterable]
+	
+	def load_channel(self, filename, stat=None):
+		"""
+		Loads (or re-loads) the given channel or provider definition
+		into the cache. stat, if given, is the os.stat_result of the file.
+		
+		Returns the name of the loaded object, or None if filename is not
+		a channel definition.
+		"""
+		
+		if not filename.endswith(".channel") and not filename.endswith(".provider"):
+			return None
+		
+		channel, obj = self.parse_channel(filename, stat)
+		
+		self.cache[channel] = obj
+		
+		return channel
+	
+	def parse_channel(self, filename, stat=None):
+		"""
+		Parses the given channel or provider definition, and returns
+		a (name, object) tuple. The cache is not touched, so that this can
+		be safely called by the discovery workers.
+		"""
+		
+		channel = filename
+		
+		# Obtain sections, if we are using the index
+		if self.index:
+			sections = self.index.get(
+				os.path.join(libchannels.config.CHANNEL_SEARCH_PATH, filename),
+				stat
+			)
+		else:
+			sections = None
+		
+		# Obtain name
+		channel = channel.replace(".channel","")
+		
+		if channel.endswith(".provider"):
+			return channel, libchannels.provider.Provider(channel, sections=sections)
+		else:
+			return channel, libchannels.channel.Channel(channel, sections=sections)
+	
+	def reload_channel(self, filename):
+		"""
+		Reloads the given channel definition file, matching it again
+		against the sources. If the file doesn't exist anymore, the channel
+		is removed.
+		
+		Must be called after discover(). Returns the name of the channel,
+		or None if filename is not a channel definition.
+		"""
+		
+		path = os.path.join(libchannels.config.CHANNEL_SEARCH_PATH, filename)
+		channel = filename.replace(".channel","")
+		
+		if not filename.endswith(".channel") and not filename.endswith(".provider"):
+			return None
+		
+		if channel in self.cache and not channel.endswith(".provider"):
+			self.matcher.remove_channel(self.cache[channel])
+		
+		try:
+			exists = os.path.exists(path) and self.load_channel(filename)
+		except FileNotFoundError:
+			# Removed in the meantime
+			exists = False
+		
+		if exists:
+			if not channel.endswith(".provider"):
+				self.matcher.add_channel(self.cache[channel])
+				
+				# Match only the reloaded channel
+				self.match_sources(
+					libchannels.matcher.RepositoryMatcher({channel : self.cache[channel]})
+				)
+		else:
+			self.cache.pop(channel, None)
 			
+			if self.index:
+				self.index.prune(
+					[indexed for indexed in self.index.entries if indexed != path]
+				)
+		
+		if self.index:
+			self.index.save()
+		
+		self.update_channels()
+		
+		return channel
+	
+	def rescan(self, refresh_sources=False):
+		"""
+		Matches again every channel against the sources, without
+		reloading the channel definitions.
+		
+		If refresh_sources is True, the sources are re-read from disk
+		beforehand.
+		
+		Must be called after discover().
+		"""
+		
+		if refresh_sources:
+			libchannels.common.sourceslist.refresh()
+		
+		for channel, obj in self.cache.items():
+			if not channel.endswith(".provider"):
+				obj.reset()
+		
+		self.scan_sources()
+		self.match_sources()
+		
+		self.update_channels()
+	
+	@libchannels.metrics.timed("discovery.scan_sources")
+	def scan_sources(self):
+		"""
+		Builds the matching informations of every sources entry.
+		"""
+		
+		# List the APT lists directory once
+		release_reader = libchannels.release.ReleaseReader()
+		
+		repositories = [
+			repository
+			for repository in libchannels.common.sourceslist
+			if repository.uri != ""
+		]
+		
+		release_names = []
+		for repository in repositories:
 			# Generate InRelease filename from repository URI
 			release_base = repository.uri.replace("/","_").split("_")
 			# Remove empty (former) trailslashes
@@ -76,53 +262,55 @@ class ChannelDiscovery:
 			# Remove protocol
 			release_base.pop(0)
 			
-			# InRelease
-			InRelease = os.path.join("/var/lib/apt/lists", "_".join(release_base + ["InRelease"]))
-			# Release (fallback)
-			Release = os.path.join("/var/lib/apt/lists", "_".join(release_base[1:] + ["Release"]))
-			
-			# Check existence
-			if os.path.exists(InRelease):
-				# InRelease found
-				release_file = open(InRelease)
-			elif os.path.exists(Release):
-				# Release found
-				release_file = open(Release)
-			else:
-				# Nothing found, we should try our luck with the default mirror
-				release_file = None
-						
-			# Obtain informations
-			origin = label = codename = None
-			if release_file:
-				for line in release_file:
-					line = line.strip().split(" ")
-					if line[0] == "Origin:":
-						origin = " ".join(line[1:])
-					elif line[0] == "Label:":
-						label = " ".join(line[1:])
-					elif line[0] == "Codename:":
-						codename = " ".join(line[1:])
-			
-			# Search for the right channel
-			for channel, obj in self.cache.items():
-				
-				if channel.endswith(".provider"):
-					# Providers do not need checking
-					continue
-				
-				obj.check(
-					repository.uri + "/" if not repository.uri.endswith("/") else repository.uri,
-					origin,
-					label,
-					[repository.dist, codename],
-					repository
+			# Obtain informations from InRelease, or Release as a fallback.
+			# If nothing is found, we should try our luck with the default mirror
+			release_names.append(
+				(
+					"_".join(release_base + ["InRelease"]),
+					"_".join(release_base[1:] + ["Release"])
 				)
-			
-			# Close
-			if release_file: release_file.close()
+			)
+		
+		metadata = self.map(
+			lambda names: release_reader.get_metadata(*names),
+			release_names
+		)
+		
+		self.sources_info = [
+			(
+				repository.uri + "/" if not repository.uri.endswith("/") else repository.uri,
+				origin,
+				label,
+				[repository.dist, codename],
+				repository
+			)
+			for repository, (origin, label, codename) in zip(repositories, metadata)
+		]
+	
+	@libchannels.metrics.timed("discovery.match_sources")
+	def match_sources(self, matcher=None):
+		"""
+		Searches the right channel for every sources entry.
+		
+		If matcher is None, the RepositoryMatcher of every channel
+		is used.
+		"""
+		
+		if not matcher:
+			matcher = self.matcher
+		
+		for info in self.sources_info:
+			matcher.match(*info)
+	
+	def update_channels(self):
+		"""
+		Updates the enabled channels dictionary.
+		"""
 		
 		for channel, obj in self.cache.items():
 			if not channel.endswith(".provider") and obj.enabled:
 				self.channels[channel] = obj
-
+		
+		for channel in list(self.channels):
+			if not channel in self.cache or not self.channels[channel].enabled:
+				del self.channels[channel]
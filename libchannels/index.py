@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+#
+# libchannels - update channels management library
+# Copyright (C) 2015 Eugenio "g7" Paolantonio
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+#
+
+import os
+import json
+import logging
+import threading
+
+import libchannels.config
+import libchannels.metrics
+
+from libchannels.model import read_sections
+
+logger = logging.getLogger(__name__)
+
+class ChannelIndex:
+
+	"""
+	The ChannelIndex() class keeps a compiled copy of every definition
+	found in CHANNEL_SEARCH_PATH.
+
+	Every entry is keyed by the path of the definition and stores the
+	(mtime, size, inode) signature of the file it has been compiled from,
+	alongside its sections. Only the entries whose signature doesn't
+	match anymore are compiled again, the others are loaded with a single
+	read of the index file.
+	"""
+
+	VERSION = 2
+
+	def __init__(self, path=None):
+		"""
+		Initializes the class.
+		"""
+
+		self.path = path if path != None else libchannels.config.CHANNEL_INDEX_PATH
+
+		self.entries = {}
+		self.dirty = False
+
+		# get() can be called by more discovery workers at once
+		self.lock = threading.Lock()
+
+	@staticmethod
+	def get_signature(stat):
+		"""
+		Returns the signature of the given os.stat_result.
+		"""
+
+		return [stat.st_mtime_ns, stat.st_size, stat.st_ino]
+
+	@staticmethod
+	def compile(path):
+		"""
+		Parses the given definition and returns its sections, as a
+		dictionary of dictionaries.
+		"""
+
+		return read_sections(path)
+
+	def load(self):
+		"""
+		Loads the index from disk.
+
+		A missing, unreadable or outdated index is simply ignored.
+		"""
+
+		self.entries = {}
+		self.dirty = False
+
+		if not self.path:
+			return
+
+		try:
+			with open(self.path) as f:
+				data = json.load(f)
+		except (OSError, ValueError):
+			return
+
+		if (
+			type(data) == dict and
+			data.get("version") == self.VERSION and
+			data.get("search_path") == libchannels.config.CHANNEL_SEARCH_PATH
+		):
+			self.entries = data["entries"]
+
+	def save(self):
+		"""
+		Writes the index to disk, if it has been changed since the last load.
+
+		The index is a cache: failing to write it is not fatal.
+		"""
+
+		if not self.path or not self.dirty:
+			return
+
+		temp = "%s.%d.tmp" % (self.path, os.getpid())
+
+		try:
+			os.makedirs(os.path.dirname(self.path), exist_ok=True)
+
+			with open(temp, "w") as f:
+				json.dump(
+					{
+						"version" : self.VERSION,
+						"search_path" : libchannels.config.CHANNEL_SEARCH_PATH,
+						"entries" : self.entries
+					},
+					f,
+					separators=(",", ":")
+				)
+
+			os.rename(temp, self.path)
+			self.dirty = False
+		except OSError as e:
+			logger.debug("Unable to write the channel index %s: %s" % (self.path, e))
+
+			if os.path.exists(temp):
+				os.remove(temp)
+
+	def get(self, path, stat=None):
+		"""
+		Returns the sections of the given definition, compiling it
+		again only if it changed since it has been indexed.
+		"""
+
+		if stat == None:
+			stat = os.stat(path)
+
+		signature = self.get_signature(stat)
+
+		entry = self.entries.get(path)
+		if entry and entry["signature"] == signature:
+			return entry["sections"]
+
+		sections = self.compile(path)
+
+		libchannels.metrics.count("index.files_compiled")
+
+		with self.lock:
+			self.entries[path] = {
+				"signature" : signature,
+				"sections" : sections
+			}
+			self.dirty = True
+
+		return sections
+
+	def prune(self, paths):
+		"""
+		Removes every entry whose path is not in the given ones.
+		"""
+
+		for path in list(self.entries):
+			if not path in paths:
+				del self.entries[path]
+				self.dirty = True
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+#
+# libchannels - update channels management library
+# Copyright (C) 2015 Eugenio "g7" Paolantonio
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+#
+
+class RepositoryMatcher:
+
+	"""
+	The RepositoryMatcher() class matches sources entries against the
+	repositories of a set of channels.
+
+	It does the same job of calling Channel.check() on every channel, but
+	the repositories are indexed once by (origin, codename) and by
+	(normalized mirror URI, codename), so that matching a sources entry is
+	a lookup instead of a scan of every repository of every channel.
+	"""
+
+	def __init__(self, cache):
+		"""
+		Initializes the class.
+		"""
+
+		self.by_origin = {}
+		self.by_mirror = {}
+
+		for channel, obj in cache.items():
+			if channel.endswith(".provider"):
+				# Providers do not need checking
+				continue
+
+			self.add_channel(obj)
+
+	def add_channel(self, channel):
+		"""
+		Indexes the repositories of the given channel.
+		"""
+
+		for repository, record in channel.record.repositories.items():
+			candidate = (channel, repository, record.label)
+
+			if record.origin != None:
+				self.by_origin.setdefault((record.origin, record.codename), []).append(candidate)
+
+			self.by_mirror.setdefault((record.mirror_uri, record.codename), []).append(candidate)
+
+	def remove_channel(self, channel):
+		"""
+		Removes the repositories of the given channel from the index.
+		"""
+
+		for index in (self.by_origin, self.by_mirror):
+			for key, candidates in list(index.items()):
+				candidates = [candidate for candidate in candidates if candidate[0] is not channel]
+
+				if candidates:
+					index[key] = candidates
+				else:
+					del index[key]
+
+	def match(self, uri, origin, label, codenames, source_entry):
+		"""
+		Sets the given SourceEntry into the repositories that match the
+		other information given, with the same semantics of Channel.check().
+
+		Returns the list of the matched (channel, repository) pairs.
+		"""
+
+		if type(codenames) == str:
+			codenames = [codenames]
+
+		# When the origin is not known, fallback to the default mirror
+		index, key = (self.by_origin, origin) if origin else (self.by_mirror, uri)
+
+		result = []
+		for codename in dict.fromkeys(codenames):
+			for channel, repository, repository_label in index.get((key, codename), ()):
+				if label and (repository_label != None and label != repository_label):
+					continue
+
+				channel.assign(repository, source_entry)
+				result.append((channel, repository))
+
+		return result
@@ -0,0 +1,414 @@
+# -*- coding: utf-8 -*-
+#
+# libchannels - update channels management library
+# Copyright (C) 2015 Eugenio "g7" Paolantonio
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+#
+
+import os
+import re
+import time
+import logging
+import tempfile
+import functools
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Registered sinks. Nothing is measured while this is empty.
+_sinks = []
+
+# True if at least one sink is registered. Hot loops should check this
+# before computing what they want to count.
+enabled = False
+
+def write_file(path, content):
+	"""
+	Atomically replaces the given file with content, so that readers
+	(e.g. a metrics collector) never see a partial file.
+	"""
+
+	fd, temp = tempfile.mkstemp(
+		prefix=".%s." % os.path.basename(path),
+		dir=os.path.dirname(path) or "."
+	)
+
+	try:
+		with os.fdopen(fd, "w") as f:
+			f.write(content)
+
+		os.chmod(temp, 0o644)
+		os.replace(temp, path)
+	except:
+		os.remove(temp)
+		raise
+
+class Sink:
+
+	"""
+	The base metrics sink. Subclasses get every finished span, every
+	counter increment and every gauge update.
+	"""
+
+	def span(self, name, duration):
+		"""
+		Called when the given span finishes. duration is in seconds.
+		"""
+
+		pass
+
+	def count(self, name, value):
+		"""
+		Called when the given counter is incremented by value.
+		"""
+
+		pass
+
+	def gauge(self, name, value):
+		"""
+		Called when the given gauge is set to value.
+		"""
+
+		pass
+
+	def flush(self):
+		"""
+		Writes the collected metrics, if the sink needs that.
+		"""
+
+		pass
+
+class LoggingSink(Sink):
+
+	"""
+	Logs every span and counter increment.
+	"""
+
+	def __init__(self, logger=logger, level=logging.DEBUG):
+		"""
+		Initializes the class.
+		"""
+
+		self.logger = logger
+		self.level = level
+
+	def span(self, name, duration):
+		"""
+		Logs the given span.
+		"""
+
+		self.logger.log(self.level, "%s: %.3f ms" % (name, duration * 1000))
+
+	def count(self, name, value):
+		"""
+		Logs the given counter increment.
+		"""
+
+		self.logger.log(self.level, "%s: +%s" % (name, value))
+
+	def gauge(self, name, value):
+		"""
+		Logs the given gauge update.
+		"""
+
+		self.logger.log(self.level, "%s: %s" % (name, value))
+
+class CallbackSink(Sink):
+
+	"""
+	Calls callback(kind, name, value) for every span (kind is "span",
+	value the duration in seconds), counter increment (kind is "count")
+	and gauge update (kind is "gauge").
+	"""
+
+	def __init__(self, callback):
+		"""
+		Initializes the class.
+		"""
+
+		self.callback = callback
+
+	def span(self, name, duration):
+		"""
+		Passes the given span to the callback.
+		"""
+
+		self.callback("span", name, duration)
+
+	def count(self, name, value):
+		"""
+		Passes the given counter increment to the callback.
+		"""
+
+		self.callback("count", name, value)
+
+	def gauge(self, name, value):
+		"""
+		Passes the given gauge update to the callback.
+		"""
+
+		self.callback("gauge", name, value)
+
+class PrometheusSink(Sink):
+
+	"""
+	Aggregates the metrics and writes them, on flush(), to path in the
+	Prometheus text format (e.g. for the node_exporter textfile
+	collector).
+
+	Every span becomes a <prefix>_<name>_seconds summary, every counter
+	a <prefix>_<name>_total counter and every gauge a <prefix>_<name>
+	gauge.
+	"""
+
+	def __init__(self, path, prefix="libchannels"):
+		"""
+		Initializes the class.
+		"""
+
+		self.path = path
+		self.prefix = prefix
+
+		# name -> [count, sum]
+		self.spans = {}
+
+		# name -> total
+		self.counters = {}
+
+		# name -> last value
+		self.gauges = {}
+
+		# Spans and counters can come from the discovery workers
+		self.lock = threading.Lock()
+
+	def get_name(self, name, suffix=None):
+		"""
+		Returns the Prometheus name of the given metric.
+		"""
+
+		return re.sub(
+			"[^a-zA-Z0-9_]",
+			"_",
+			"_".join(part for part in (self.prefix, name, suffix) if part)
+		)
+
+	def span(self, name, duration):
+		"""
+		Adds the given span to the summary.
+		"""
+
+		with self.lock:
+			summary = self.spans.setdefault(name, [0, 0.0])
+			summary[0] += 1
+			summary[1] += duration
+
+	def count(self, name, value):
+		"""
+		Adds value to the given counter.
+		"""
+
+		with self.lock:
+			self.counters[name] = self.counters.get(name, 0) + value
+
+	def gauge(self, name, value):
+		"""
+		Sets the given gauge.
+		"""
+
+		with self.lock:
+			self.gauges[name] = value
+
+	def flush(self):
+		"""
+		Atomically writes the metrics file.
+		"""
+
+		lines = []
+
+		with self.lock:
+			for name, (count, total) in sorted(self.spans.items()):
+				metric = self.get_name(name, "seconds")
+				lines += [
+					"# TYPE %s summary" % metric,
+					"%s_sum %f" % (metric, total),
+					"%s_count %d" % (metric, count),
+				]
+
+			for name, value in sorted(self.counters.items()):
+				metric = self.get_name(name, "total")
+				lines += [
+					"# TYPE %s counter" % metric,
+					"%s %s" % (metric, value),
+				]
+
+			for name, value in sorted(self.gauges.items()):
+				metric = self.get_name(name)
+				lines += [
+					"# TYPE %s gauge" % metric,
+					"%s %s" % (metric, value),
+				]
+
+		try:
+			write_file(self.path, "\n".join(lines) + "\n")
+		except OSError as e:
+			logger.warning("Unable to write the metrics to %s: %s" % (self.path, e))
+
+class Span:
+
+	"""
+	Measures the time spent in a with block, and passes it to the sinks.
+	"""
+
+	__slots__ = ("name", "start")
+
+	def __init__(self, name):
+		"""
+		Initializes the class.
+		"""
+
+		self.name = name
+		self.start = None
+
+	def __enter__(self):
+		"""
+		Starts the span.
+		"""
+
+		self.start = time.perf_counter()
+
+		return self
+
+	def __exit__(self, type, value, traceback):
+		"""
+		Finishes the span.
+		"""
+
+		duration = time.perf_counter() - self.start
+
+		for sink in _sinks:
+			sink.span(self.name, duration)
+
+class NullSpan:
+
+	"""
+	The span used while no sink is registered: it does nothing.
+	"""
+
+	__slots__ = ()
+
+	def __enter__(self):
+		"""
+		Does nothing.
+		"""
+
+		return self
+
+	def __exit__(self, type, value, traceback):
+		"""
+		Does nothing.
+		"""
+
+		pass
+
+NULL_SPAN = NullSpan()
+
+def add_sink(sink):
+	"""
+	Registers the given sink.
+	"""
+
+	global _sinks, enabled
+
+	# Spans being finished keep iterating over the old list
+	_sinks = _sinks + [sink]
+	enabled = True
+
+def remove_sink(sink):
+	"""
+	Unregisters the given sink.
+	"""
+
+	global _sinks, enabled
+
+	_sinks = [registered for registered in _sinks if registered is not sink]
+	enabled = bool(_sinks)
+
+def flush():
+	"""
+	Flushes every registered sink.
+	"""
+
+	for sink in _sinks:
+		sink.flush()
+
+def span(name):
+	"""
+	Returns a context manager measuring the time spent in it:
+
+		with libchannels.metrics.span("discovery.scan_sources"):
+			...
+	"""
+
+	return Span(name) if enabled else NULL_SPAN
+
+def count(name, value=1):
+	"""
+	Increments the given counter by value.
+	"""
+
+	if not enabled:
+		return
+
+	for sink in _sinks:
+		sink.count(name, value)
+
+def gauge(name, value):
+	"""
+	Sets the given gauge to value.
+	"""
+
+	if not enabled:
+		return
+
+	for sink in _sinks:
+		sink.gauge(name, value)
+
+def timed(name):
+	"""
+	Function decorator that measures every call of the function in the
+	given span.
+	"""
+
+	def decorator(obj):
+		"""
+		Modifies the object.
+		"""
+
+		@functools.wraps(obj)
+		def wrapper(*args, **kwargs):
+			"""
+			The function wrapper.
+			"""
+
+			if not enabled:
+				return obj(*args, **kwargs)
+
+			with Span(name):
+				return obj(*args, **kwargs)
+
+		return wrapper
+
+	return decorator
@@ -0,0 +1,215 @@
+# -*- coding: utf-8 -*-
+#
+# libchannels - update channels management library
+# Copyright (C) 2015 Eugenio "g7" Paolantonio
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+#
+
+import logging
+import configparser
+
+from types import MappingProxyType
+
+logger = logging.getLogger(__name__)
+
+def read_sections(path):
+	"""
+	Parses the given definition file and returns its sections, as a
+	dictionary of dictionaries. Values are interpolated like
+	ConfigParser does.
+
+	A missing file gives an empty dictionary.
+	"""
+
+	parser = configparser.ConfigParser()
+	parser.read(path)
+
+	sections = {}
+	for section in parser.sections():
+		try:
+			sections[section] = dict(parser.items(section))
+		except configparser.InterpolationError as e:
+			logger.warning("Unable to interpolate %s in %s: %s" % (section, path, e))
+			sections[section] = dict(parser.items(section, raw=True))
+
+	return sections
+
+def split_list(value):
+	"""
+	Splits a space-separated list.
+	"""
+
+	return tuple(value.split()) if value else ()
+
+def get_boolean(value):
+	"""
+	Returns the boolean value of the given string, like
+	ConfigParser.getboolean() does (unknown values are False).
+	"""
+
+	return configparser.ConfigParser.BOOLEAN_STATES.get(value.lower(), False) if value else False
+
+class Record:
+
+	"""
+	Base class for the immutable definition records.
+	"""
+
+	__slots__ = ()
+
+	def __init__(self, **values):
+		"""
+		Initializes the record.
+		"""
+
+		for name, value in values.items():
+			object.__setattr__(self, name, value)
+
+	def __setattr__(self, name, value):
+		"""
+		Records are immutable.
+		"""
+
+		raise AttributeError("%s objects are immutable" % type(self).__name__)
+
+	def __delattr__(self, name):
+		"""
+		Records are immutable.
+		"""
+
+		raise AttributeError("%s objects are immutable" % type(self).__name__)
+
+	def __repr__(self):
+		"""
+		Returns a representation of the record.
+		"""
+
+		return "<%s %s>" % (type(self).__name__, self.name)
+
+class RepositoryRecord(Record):
+
+	"""
+	The definition of a repository of a channel.
+	"""
+
+	__slots__ = (
+		"name",
+		"default_mirror",
+		"mirror_uri", # default_mirror, with the trailing slash
+		"origin",
+		"codename",
+		"label",
+		"components",
+		"proposed",
+		"section", # every value, as read
+	)
+
+	def __init__(self, name, section):
+		"""
+		Initializes the record.
+		"""
+
+		default_mirror = section.get("default_mirror")
+
+		super().__init__(
+			name=name,
+			default_mirror=default_mirror,
+			mirror_uri=(
+				default_mirror + "/"
+				if default_mirror and not default_mirror.endswith("/")
+				else default_mirror
+			),
+			origin=section.get("origin"),
+			codename=section.get("codename"),
+			label=section.get("label"),
+			components=split_list(section.get("components")),
+			proposed=get_boolean(section.get("proposed")),
+			section=(
+				section
+				if type(section) == MappingProxyType
+				else MappingProxyType(dict(section))
+			)
+		)
+
+class ChannelRecord(Record):
+
+	"""
+	The definition of a channel, with its relations already parsed.
+	"""
+
+	__slots__ = (
+		"name",
+		"description",
+		"depends",
+		"conflicts",
+		"provides",
+		"repositories", # repository name -> RepositoryRecord
+		"sections", # every section, as read
+	)
+
+	def __init__(self, sections):
+		"""
+		Initializes the record.
+		"""
+
+		sections = {
+			name : MappingProxyType(dict(section))
+			for name, section in sections.items()
+		}
+
+		channel = sections.get("channel", {})
+
+		super().__init__(
+			name=channel.get("name"),
+			description=channel.get("description"),
+			depends=split_list(channel.get("depends")),
+			conflicts=split_list(channel.get("conflicts")),
+			provides=split_list(channel.get("provides")),
+			repositories=MappingProxyType({
+				name : RepositoryRecord(name, section)
+				for name, section in sections.items()
+				if name != "channel"
+			}),
+			sections=MappingProxyType(sections)
+		)
+
+class ProviderRecord(Record):
+
+	"""
+	The definition of a provider.
+	"""
+
+	__slots__ = (
+		"name",
+		"description",
+		"sections", # every section, as read
+	)
+
+	def __init__(self, sections):
+		"""
+		Initializes the record.
+		"""
+
+		provider = sections.get("provider", {})
+
+		super().__init__(
+			name=provider.get("name"),
+			description=provider.get("description"),
+			sections=MappingProxyType({
+				name : MappingProxyType(dict(section))
+				for name, section in sections.items()
+			})
+		)
@@ -0,0 +1,478 @@
+# -*- coding: utf-8 -*-
+#
+# libchannels - update channels management library
+# Copyright (C) 2015 Eugenio "g7" Paolantonio
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+#
+
+import os
+import sys
+import json
+import logging
+import tempfile
+import subprocess
+
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import libchannels.archives
+import libchannels.metrics
+import libchannels.updates
+
+logger = logging.getLogger(__name__)
+
+# A change of the plan. Packages are referenced by full name, as the
+# cache is reopened between batches. archive is the (uri, hashes, size,
+# destfile) of the package to download, or None, hashes being a list of
+# "TYPE:value" strings.
+PlannedChange = namedtuple("PlannedChange", ["name", "action", "auto", "archive"])
+
+# Relations that require the target to be changed in the same batch, or
+# in an earlier one
+ORDER_RELATIONS = ("PreDepends", "Depends", "Conflicts", "Breaks")
+
+class PipelineError(Exception):
+
+	"""
+	Raised when a batch can't be downloaded or installed.
+	"""
+
+	pass
+
+def download_archives(archives, config):
+	"""
+	Downloads the given archives, a list of (uri, hashes, size, name,
+	destfile), with the given APT configuration (as returned by
+	apt_pkg.Configuration.dump()). Returns the URIs that couldn't be
+	downloaded, and the destfiles APT downloaded and verified.
+
+	This is the download process (see PipelinedInstall.download()).
+	"""
+
+	import apt_pkg
+	import apt.progress.base
+
+	with tempfile.NamedTemporaryFile("w", suffix=".conf") as f:
+		f.write(config)
+		f.flush()
+
+		apt_pkg.read_config_file(apt_pkg.config, f.name)
+
+	apt_pkg.init_system()
+
+	fetcher = apt_pkg.Acquire(progress=apt.progress.base.AcquireProgress())
+
+	items = []
+	for uri, hashes, size, name, destfile in archives:
+		hash_list = apt_pkg.HashStringList()
+		for hash in hashes:
+			hash_list.append(apt_pkg.HashString(hash))
+
+		items.append(
+			apt_pkg.AcquireFile(
+				fetcher,
+				uri,
+				hash_list,
+				size,
+				name,
+				destfile=destfile
+			)
+		)
+
+	try:
+		fetcher.run()
+
+		return {
+			"failed" : [item.desc_uri for item in items if item.status != item.STAT_DONE],
+			"downloaded" : [
+				item.destfile
+				for item in items
+				if item.status == item.STAT_DONE and not item.local
+			],
+		}
+	finally:
+		fetcher.shutdown()
+
+class PipelinedInstall:
+
+	"""
+	The PipelinedInstall() class installs the marked changes of an
+	Updates() object in dependency-closed batches: while a batch is
+	unpacked and configured, the next one is downloaded.
+
+	Every batch only depends on itself and on the batches before it, so
+	the system is consistent after every installed batch. If a batch
+	fails, the pipeline stops there.
+	"""
+
+	def __init__(self, updates, batch_size=50):
+		"""
+		Initializes the class.
+
+		batch_size is the minimum number of packages of a batch (a batch
+		can be bigger, as packages depending on each other are never
+		split).
+		"""
+
+		self.updates = updates
+		self.batch_size = batch_size
+
+		self.batches = []
+
+		# The APT configuration passed to the download process
+		self.config = None
+
+	def plan(self):
+		"""
+		Splits the marked changes into batches, and returns them as
+		lists of PlannedChange.
+		"""
+
+		depcache = self.updates.cache._depcache
+
+		packages = [
+			rawpkg
+			for rawpkg in self.updates.get_changed_packages()
+			if self.updates.get_raw_reason(depcache, rawpkg) != None
+		]
+		ids = {rawpkg.id : index for index, rawpkg in enumerate(packages)}
+
+		changes = []
+		edges = []
+		for rawpkg in packages:
+			if depcache.marked_delete(rawpkg):
+				changes.append(PlannedChange(rawpkg.get_fullname(True), "remove", False, None))
+				edges.append([])
+				continue
+
+			version = depcache.get_candidate_ver(rawpkg)
+
+			archive = libchannels.archives.get_archive(self.updates.cache, rawpkg, version)
+			if archive != None:
+				uri, hashes, size, destfile = archive
+				archive = (uri, [str(hash) for hash in hashes], size, destfile)
+
+			changes.append(
+				PlannedChange(
+					rawpkg.get_fullname(True),
+					"install",
+					depcache.is_auto_installed(rawpkg),
+					archive
+				)
+			)
+
+			# Point to every changed target of the ordering relations
+			targets = []
+			for relation in ORDER_RELATIONS:
+				for group in version.depends_list.get(relation, ()):
+					for dependency in group:
+						if dependency.target_pkg.id in ids:
+							targets.append(ids[dependency.target_pkg.id])
+
+			edges.append(targets)
+
+		self.batches = []
+
+		batch = []
+		for component in self.get_components(edges):
+			batch += [changes[index] for index in component]
+
+			if len(batch) >= self.batch_size:
+				self.batches.append(batch)
+				batch = []
+
+		if batch:
+			self.batches.append(batch)
+
+		return self.batches
+
+	@staticmethod
+	def get_components(edges):
+		"""
+		Returns the strongly connected components of the given graph
+		(node -> list of nodes), every component after the ones it
+		points to.
+		"""
+
+		# Iterative Tarjan's algorithm
+		index = {}
+		lowlink = {}
+		stack = []
+		on_stack = set()
+		components = []
+
+		for root in range(len(edges)):
+			if root in index:
+				continue
+
+			work = [(root, iter(edges[root]))]
+			index[root] = lowlink[root] = len(index)
+			stack.append(root)
+			on_stack.add(root)
+
+			while work:
+				node, children = work[-1]
+
+				for child in children:
+					if not child in index:
+						index[child] = lowlink[child] = len(index)
+						stack.append(child)
+						on_stack.add(child)
+						work.append((child, iter(edges[child])))
+						break
+					elif child in on_stack:
+						lowlink[node] = min(lowlink[node], index[child])
+				else:
+					work.pop()
+
+					if work:
+						parent = work[-1][0]
+						lowlink[parent] = min(lowlink[parent], lowlink[node])
+
+					if lowlink[node] == index[node]:
+						component = []
+						while True:
+							member = stack.pop()
+							on_stack.discard(member)
+							component.append(member)
+
+							if member == node:
+								break
+
+						components.append(sorted(component))
+
+		return components
+
+	def download(self, batch):
+		"""
+		Downloads the archives of the given batch into the APT archives
+		directory, where the package manager will find them.
+
+		apt_pkg isn't thread-safe, and the cache is used by the
+		installation meanwhile: the archives are downloaded by a separate
+		process (see download_archives()).
+
+		Returns the list of the archives APT downloaded (and verified).
+		Raises PipelineError if something can't be downloaded.
+		"""
+
+		archives = []
+		for change in batch:
+			if change.archive == None:
+				continue
+
+			uri, hashes, size, destfile = change.archive
+			archives.append((uri, hashes, size, change.name, destfile))
+
+		root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+		environment = dict(os.environ)
+		environment["PYTHONPATH"] = os.pathsep.join(
+			[root] + ([environment["PYTHONPATH"]] if "PYTHONPATH" in environment else [])
+		)
+
+		with libchannels.metrics.span("pipeline.download"):
+			process = subprocess.run(
+				[sys.executable, "-m", "libchannels.pipeline"],
+				input=json.dumps({"archives" : archives, "config" : self.config}).encode(),
+				stdout=subprocess.PIPE,
+				env=environment
+			)
+
+		if process.returncode != 0:
+			raise PipelineError("Download process failed (%d)" % process.returncode)
+
+		result = json.loads(process.stdout.decode())
+		if result["failed"]:
+			raise PipelineError("Unable to download %s" % ", ".join(result["failed"]))
+
+		libchannels.metrics.count("pipeline.archives_downloaded", len(archives))
+
+		return result["downloaded"]
+
+	def add_downloaded(self, batch, downloaded):
+		"""
+		Marks as verified the archives of the given batch downloaded by
+		download(), so that installing the batch doesn't hash them again.
+		"""
+
+		if self.updates.archive_index == None:
+			self.updates.archive_index = libchannels.archives.ArchiveIndex()
+
+		downloaded = set(downloaded)
+
+		for change in batch:
+			if change.archive == None:
+				continue
+
+			uri, hashes, size, destfile = change.archive
+			if destfile in downloaded:
+				try:
+					self.updates.archive_index.add(destfile, libchannels.archives.get_expected_hash(hashes))
+				except FileNotFoundError:
+					pass
+
+	def mark(self, batch):
+		"""
+		Marks the changes of the given batch on a freshly opened cache.
+
+		Returns False if the batch can't be installed alone.
+		"""
+
+		self.updates.open_cache()
+
+		cache = self.updates.cache
+		depcache = cache._depcache
+
+		with cache.actiongroup():
+			for change in batch:
+				rawpkg = cache._cache[change.name]
+
+				if change.action == "remove":
+					depcache.mark_delete(rawpkg)
+				else:
+					depcache.mark_install(rawpkg, False, not change.auto)
+					depcache.mark_auto(rawpkg, change.auto)
+
+		return depcache.broken_count == 0
+
+	def install(self, batch):
+		"""
+		Installs the given batch (already marked), and returns the
+		package manager result.
+		"""
+
+		apt_pkg = libchannels.updates.apt_pkg
+
+		package_manager = apt_pkg.PackageManager(self.updates.cache._depcache)
+
+		with libchannels.metrics.span("pipeline.install"):
+			# Archives are already there: this only sets them up
+			if not self.updates.fetch(package_manager):
+				return package_manager.RESULT_FAILED
+
+			return self.updates.packages_install_progress.run(package_manager)
+
+	def notify(self, index, status):
+		"""
+		Reports the status of the given batch to the
+		packages_batch_callback of the Updates() object, if any.
+		"""
+
+		logger.info("Batch %d/%d: %s" % (index + 1, len(self.batches), status))
+
+		if self.updates.packages_batch_callback:
+			self.updates.packages_batch_callback(index, len(self.batches), status)
+
+	def fail(self, index, message):
+		"""
+		Reports the failure of the given batch.
+		"""
+
+		self.notify(index, "failed")
+
+		logger.error(message)
+		if self.updates.packages_install_failure_callback:
+			self.updates.packages_install_failure_callback(message)
+
+	def recover(self):
+		"""
+		Leaves the system in a consistent state after a failed batch.
+		"""
+
+		if self.updates.cache.dpkg_journal_dirty:
+			subprocess.call(["dpkg", "--configure", "-a"])
+
+		self.updates.open_cache()
+
+	def run(self):
+		"""
+		Runs the pipeline. Returns True if every batch has been installed.
+		"""
+
+		if not self.batches:
+			self.plan()
+
+		if self.updates.fetch_options:
+			self.updates.fetch_options.apply()
+
+		self.config = libchannels.updates.apt_pkg.config.dump()
+
+		self.updates.packages_install_progress.start_update()
+
+		with ThreadPoolExecutor(max_workers=1) as executor:
+			downloads = {}
+
+			def start_download(index):
+				if index < len(self.batches) and not index in downloads:
+					self.notify(index, "downloading")
+					downloads[index] = executor.submit(self.download, self.batches[index])
+
+			index = 0
+			while index < len(self.batches):
+				start_download(index)
+
+				try:
+					self.add_downloaded(self.batches[index], downloads[index].result())
+
+					# A batch that breaks something alone is merged with
+					# the next one
+					while not self.mark(self.batches[index]):
+						if index + 1 >= len(self.batches):
+							raise PipelineError("Batch %d can't be installed" % (index + 1))
+
+						start_download(index + 1)
+						self.add_downloaded(self.batches[index + 1], downloads.pop(index + 1).result())
+
+						self.batches[index] += self.batches.pop(index + 1)
+				except (PipelineError, SystemError) as err:
+					self.fail(index, "System upgrade failed: %s" % err)
+					return False
+
+				# The next batch downloads while this one is installed
+				start_download(index + 1)
+
+				self.notify(index, "installing")
+				try:
+					result = self.install(self.batches[index])
+				except (SystemError, OSError) as err:
+					result = err
+
+				if result != libchannels.updates.apt_pkg.PackageManager.RESULT_COMPLETED:
+					# Every batch before this one is installed, and closed
+					self.recover()
+
+					self.fail(
+						index,
+						"System upgrade failed: batch %d/%d not installed (%s)" % (index + 1, len(self.batches), result)
+					)
+					return False
+
+				self.notify(index, "done")
+				index += 1
+
+		logger.info("Clearing cache")
+		self.updates.clear()
+
+		logger.info("System update completed")
+		self.updates.packages_install_progress.finish_update()
+
+		return True
+
+if __name__ == "__main__":
+	request = json.load(sys.stdin)
+
+	json.dump(download_archives(request["archives"], request["config"]), sys.stdout)
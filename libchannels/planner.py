@@ -0,0 +1,219 @@
+# -*- coding: utf-8 -*-
+#
+# libchannels - update channels management library
+# Copyright (C) 2015 Eugenio "g7" Paolantonio
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+#
+
+from collections import namedtuple
+
+from libchannels.relations import Dependency, Conflict, ProviderRelation
+from libchannels.actions import ActionType
+
+# Status of an action on a channel, as returned by
+# DependencyResolver.get_channel_matrix().
+# actionable is True if the action can be done right away (no blockers),
+# solution_size is the number of steps of the solution, or None if there
+# is no solution (because of a dependency cycle).
+ActionStatus = namedtuple("ActionStatus", ["actionable", "blockers", "solution_size"])
+
+class DependencyCycleError(Exception):
+
+	"""
+	Raised when the solution of a channel depends on itself.
+
+	The cycle attribute contains the (channel, action) steps forming the
+	cycle, the first one being repeated at the end.
+	"""
+
+	def __init__(self, cycle):
+		"""
+		Initializes the exception.
+		"""
+
+		self.cycle = cycle
+
+		super().__init__(
+			"Dependency cycle detected: %s" % " -> ".join(
+				"%s (%s)" % (channel, action.name.lower())
+				for channel, action in cycle
+			)
+		)
+
+class SolutionPlanner:
+
+	"""
+	The SolutionPlanner() computes the solution of a channel as an ordered
+	plan over the graph of (channel, action) steps, where every step
+	points to the steps needed to clear its blockers.
+
+	The plan is a depth-first post-order visit of that graph: every step
+	comes after the steps it needs, and is listed once. Blockers are
+	memoized for the whole life of the planner, so a planner should not
+	outlive a single query (or a set of queries on an unchanged system).
+	"""
+
+	def __init__(self, resolver):
+		"""
+		Initializes the class.
+		"""
+
+		self.resolver = resolver
+
+		# (channel, action) -> list of blockers
+		self.blockers = {}
+
+		# (channel, action) -> list of (channel, action)
+		self.edges = {}
+
+		# (channel, action) -> frozenset of the steps of its plan
+		self.reachable = {}
+
+		# (channel, action) -> DependencyCycleError
+		self.failures = {}
+
+	def get_blockers(self, step):
+		"""
+		Returns the blockers of the given step.
+		"""
+
+		if not step in self.blockers:
+			channel, action = step
+			self.blockers[step] = self.resolver.get_channel_blockers(channel, action=action)
+
+		return self.blockers[step]
+
+	def get_edges(self, step):
+		"""
+		Returns the steps needed to clear the blockers of the given step.
+		"""
+
+		if step in self.edges:
+			return self.edges[step]
+
+		edges = []
+		for blocker in self.get_blockers(step):
+			if type(blocker) == Dependency:
+				# The dependency should be enabled
+				edges.append((blocker.get_name(), ActionType.ENABLE))
+			elif type(blocker) == Conflict:
+				# The conflict should be disabled
+				edges.append((blocker.get_name(), ActionType.DISABLE))
+			elif type(blocker) == ProviderRelation:
+				# The current provider should be disabled
+				provider_channel = blocker.get_current_provider_channel()
+				if provider_channel != None:
+					edges.append((provider_channel, ActionType.DISABLE))
+
+		self.edges[step] = edges
+
+		return edges
+
+	def plan(self, channel, action=ActionType.ENABLE):
+		"""
+		Returns the list of (channel, action) steps to take to accomplish
+		the given action.
+
+		Raises DependencyCycleError if the plan depends on itself.
+		"""
+
+		root = (channel, action)
+
+		result = []
+		done = set()
+
+		# Iterative depth-first visit, to not hit the recursion limit
+		# on long chains
+		path = [root]
+		on_path = {root}
+		stack = [iter(self.get_edges(root))]
+
+		while stack:
+			for step in stack[-1]:
+				if step in done:
+					continue
+				elif step in on_path:
+					raise DependencyCycleError(path[path.index(step):] + [step])
+
+				path.append(step)
+				on_path.add(step)
+				stack.append(iter(self.get_edges(step)))
+				break
+			else:
+				# Every needed step has been planned
+				stack.pop()
+
+				step = path.pop()
+				on_path.discard(step)
+
+				done.add(step)
+				result.append(step)
+
+		return result
+
+	def get_reachable(self, root):
+		"""
+		Returns the set of steps of the plan of the given step.
+
+		Unlike plan(), the result of every visited step is kept, so
+		that asking for many steps of the same graph shares the work.
+
+		Raises DependencyCycleError if the plan depends on itself.
+		"""
+
+		if root in self.failures:
+			raise self.failures[root]
+		elif root in self.reachable:
+			return self.reachable[root]
+
+		path = [root]
+		on_path = {root}
+		stack = [iter(self.get_edges(root))]
+
+		try:
+			while stack:
+				for step in stack[-1]:
+					if step in self.failures:
+						raise self.failures[step]
+					elif step in self.reachable:
+						continue
+					elif step in on_path:
+						raise DependencyCycleError(path[path.index(step):] + [step])
+
+					path.append(step)
+					on_path.add(step)
+					stack.append(iter(self.get_edges(step)))
+					break
+				else:
+					stack.pop()
+
+					step = path.pop()
+					on_path.discard(step)
+
+					# Every child has been visited already
+					reachable = {step}
+					for child in self.get_edges(step):
+						reachable.update(self.reachable[child])
+
+					self.reachable[step] = frozenset(reachable)
+		except DependencyCycleError as error:
+			# Every step in the current path leads to the cycle
+			for step in path:
+				self.failures[step] = error
+
+			raise
+
+		return self.reachable[root]
@@ -19,12 +19,13 @@
 #
 
 import os
-import configparser
 
 import libchannels.common
 import libchannels.config
 
-class Provider(configparser.ConfigParser):
+from libchannels.model import ProviderRecord, read_sections
+
+class Provider:
 	
 	"""
 	A Provider is a virtual channel that can be used as an alias for a
@@ -54,24 +55,108 @@ class Provider(configparser.ConfigParser):
 	of the time) the ".provider" extension is needed, otherwise it will be treated
 	like a channel.
 	
+	The definition itself is kept in an immutable ProviderRecord (see the
+	record attribute).
+	
 	"""
+	
+	__slots__ = (
+		"record",
+		"provider_name",
+		"repositories",
+	)
 
-	def __init__(self, provider_name):
+	def __init__(self, provider_name, sections=None, record=None):
 		"""
 		Initializes the class.
+		
+		If record or sections (e.g. from the ChannelIndex) are given, they
+		are used in place of the provider file.
 		"""
 		
-		super().__init__()
+		if record == None:
+			if sections == None:
+				sections = read_sections(
+					os.path.join(
+						libchannels.config.CHANNEL_SEARCH_PATH,
+						provider_name if provider_name.endswith(".provider") else "%s.provider" % provider_name
+					)
+				)
+			
+			record = ProviderRecord(sections)
+		
+		self.record = record
 		
 		self.repositories = {}
 		
 		self.provider_name = provider_name
+	
+	def __getitem__(self, section):
+		"""
+		Returns the given section of the definition, as a read-only
+		mapping.
+		"""
+		
+		return self.record.sections[section]
+	
+	def sections(self):
+		"""
+		Returns the list of the sections of the definition.
+		"""
 		
-		self.read(os.path.join(libchannels.config.CHANNEL_SEARCH_PATH, "%s.provider" % provider_name))
+		return list(self.record.sections)
 	
 	def __str__(self):
 		"""
 		Returns a stringified version of the object.
 		"""
 		
-		return self["provider"]["name"]
+		return self.record.name
+
+class ProviderIndex:
+	
+	"""
+	The ProviderIndex() maps every provider to the channels that provide
+	it, so that checking whether a provider is satisfied only looks at
+	its own channels instead of the whole channel cache.
+	"""
+	
+	def __init__(self):
+		"""
+		Initializes the class.
+		"""
+		
+		# provider -> channels (dictionaries used as ordered sets)
+		self.providers = {}
+		
+		# channel -> the providers it has been registered with
+		self.channels = {}
+	
+	def add_channel(self, channel, providers):
+		"""
+		Sets the providers of the given channel, replacing the
+		previous ones.
+		"""
+		
+		self.remove_channel(channel)
+		
+		for provider in providers:
+			self.providers.setdefault(provider, {})[channel] = None
+		
+		self.channels[channel] = tuple(providers)
+	
+	def remove_channel(self, channel):
+		"""
+		Removes the given channel from the index.
+		"""
+		
+		for provider in self.channels.pop(channel, ()):
+			if provider in self.providers:
+				self.providers[provider].pop(channel, None)
+	
+	def get_channels(self, provider):
+		"""
+		Returns the channels providing the given provider.
+		"""
+		
+		return self.providers.get(provider, {})
@@ -91,14 +91,19 @@ class ProviderRelation(Relation):
 	a provider.
 	"""
 	
-	def __init__(self, requirer, target, channels):
+	def __init__(self, requirer, target, channels, index=None):
 		"""
 		Initializes the relation.
+		
+		index, if given, is the ProviderIndex to use to lookup the
+		channels providing the target, in place of scanning every
+		channel.
 		"""
 		
 		self.requirer = requirer
 		self.target = target
 		self.channels = channels
+		self.index = index
 
 	def get_name(self):
 		"""
@@ -116,7 +121,11 @@ class ProviderRelation(Relation):
 		if (
 			not channel.endswith(".provider") and # Check on channels
 			not self.requirer.channel_name == channel and # Ensure we aren't checking ourselves
-			self.target.provider_name in self.channels[channel].get_providers() and # Actual provider check 
+			( # Actual provider check
+				channel in self.index.get_channels(self.target.provider_name)
+				if self.index != None
+				else self.target.provider_name in self.channels[channel].get_providers()
+			) and
 			self.channels[channel].enabled # If the channel is not enabled, don't worry
 		):
 			return True
@@ -128,15 +137,25 @@ class ProviderRelation(Relation):
 		Returns the channel that currently provides the provider.
 		"""
 		
-		for channel in self.channels:
+		for channel in self.get_candidates():
 			if self.is_provider_enabled(channel):
 				return channel
 		
 		return None
+	
+	def get_candidates(self):
+		"""
+		Returns the channels that may provide the provider.
+		"""
+		
+		if self.index != None:
+			return self.index.get_channels(self.target.provider_name)
+		
+		return self.channels
 
 	def __bool__(self):
 		"""
 		Returns True if the provider is not statisfied, False if it is.
 		"""
 		
-		return (not (True in [True for x in self.channels if self.is_provider_enabled(x)]))
+		return (self.get_current_provider_channel() == None)
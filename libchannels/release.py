@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+#
+# libchannels - update channels management library
+# Copyright (C) 2015 Eugenio "g7" Paolantonio
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+#
+
+import os
+
+from collections import namedtuple
+
+import libchannels.config
+import libchannels.metrics
+
+ReleaseMetadata = namedtuple("ReleaseMetadata", ["origin", "label", "codename"])
+
+EMPTY_METADATA = ReleaseMetadata(None, None, None)
+
+# Fields that mark the end of the header stanza: everything that follows
+# is the (huge) list of checksums.
+HASH_FIELDS = ("MD5Sum:", "SHA1:", "SHA256:", "SHA512:")
+
+# Parsed metadata, keyed by path. Every value is a (mtime, size, metadata)
+# tuple, so that unchanged Release files are never opened again.
+# Entries of removed files are dropped by the next ReleaseReader.
+_cache = {}
+
+def parse_header(path):
+	"""
+	Returns the ReleaseMetadata of the given Release/InRelease file.
+
+	Only the header stanza is read: parsing stops at its end, or as soon
+	as every wanted field has been found.
+	"""
+
+	origin = label = codename = None
+
+	with open(path) as release_file:
+		in_signature_header = False
+
+		for line in release_file:
+			if line.startswith("-----BEGIN PGP SIGNED MESSAGE-----"):
+				# Clearsigned InRelease, skip the armor headers
+				in_signature_header = True
+				continue
+			elif in_signature_header:
+				if not line.strip():
+					in_signature_header = False
+				continue
+
+			if not line.strip():
+				# End of the stanza
+				break
+			elif line[0] in (" ", "\t"):
+				# Continuation line of a multi-line field (which we
+				# don't need)
+				continue
+
+			line = line.strip().split(" ")
+			if line[0] == "Origin:":
+				origin = " ".join(line[1:])
+			elif line[0] == "Label:":
+				label = " ".join(line[1:])
+			elif line[0] == "Codename:":
+				codename = " ".join(line[1:])
+			elif line[0] in HASH_FIELDS:
+				break
+
+			if origin != None and label != None and codename != None:
+				break
+
+	return ReleaseMetadata(origin, label, codename)
+
+class ReleaseReader:
+
+	"""
+	The ReleaseReader() class returns the metadata of the Release files
+	stored in the APT lists directory.
+
+	The directory is listed once, when the object is created: a new
+	ReleaseReader should be used for every discovery.
+	"""
+
+	def __init__(self, lists_path=None):
+		"""
+		Initializes the class.
+		"""
+
+		self.lists_path = lists_path if lists_path else libchannels.config.APT_LISTS_PATH
+
+		try:
+			self.files = {entry.name : entry for entry in os.scandir(self.lists_path)}
+		except OSError:
+			self.files = {}
+
+		# Forget the files removed in the meantime (e.g. by apt-get update)
+		prefix = os.path.join(self.lists_path, "")
+		for path in list(_cache):
+			if path.startswith(prefix) and not path[len(prefix):] in self.files:
+				del _cache[path]
+
+	def get_metadata(self, *names):
+		"""
+		Returns the ReleaseMetadata of the first existing file in names,
+		or an empty ReleaseMetadata if none of them exists.
+		"""
+
+		for name in names:
+			if name in self.files:
+				return self.get_file_metadata(self.files[name])
+
+		return EMPTY_METADATA
+
+	def get_file_metadata(self, entry):
+		"""
+		Returns the ReleaseMetadata of the given os.DirEntry, using the
+		cached one if the file hasn't changed.
+		"""
+
+		try:
+			stat = entry.stat()
+		except OSError:
+			return EMPTY_METADATA
+
+		cached = _cache.get(entry.path)
+		if cached and cached[0] == stat.st_mtime_ns and cached[1] == stat.st_size:
+			return cached[2]
+
+		try:
+			metadata = parse_header(entry.path)
+		except OSError:
+			return EMPTY_METADATA
+
+		_cache[entry.path] = (stat.st_mtime_ns, stat.st_size, metadata)
+
+		libchannels.metrics.count("release.files_read")
+
+		return metadata
@@ -18,8 +18,13 @@
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
 #
 
+import libchannels.metrics
+
 from libchannels.relations import Dependency, Conflict, ProviderRelation
+from libchannels.provider import ProviderIndex
 from libchannels.actions import ActionType
+from libchannels.planner import SolutionPlanner, ActionStatus, DependencyCycleError
+from libchannels.solver import ChannelSolver
 
 class DependencyResolver:
 	
@@ -28,8 +33,7 @@ class DependencyResolver:
 	channels and providers.
 	"""
 	
-	relations = {}
-	
+	@libchannels.metrics.timed("resolver.build")
 	def __init__(self, cache):
 		"""
 		Initializes the object.
@@ -37,6 +41,20 @@ class DependencyResolver:
 		
 		self.cache = cache
 		
+		# channel -> its relations
+		self.relations = {}
+		
+		# Reverse dependency edges: channel -> channels depending on it.
+		# Values are dictionaries used as ordered sets.
+		self.dependents = {}
+		
+		# Forward dependency edges: channel -> its dependencies, used to
+		# drop the reverse edges of a channel without scanning them all
+		self.dependencies = {}
+		
+		# provider -> channels providing it
+		self.providers = ProviderIndex()
+		
 		# Build relations for every channel
 		for channel in self.cache:
 			if not channel.endswith(".provider"):
@@ -45,67 +63,168 @@ class DependencyResolver:
 	def build_relations(self, channel):
 		"""
 		Builds the relations links of a channel.
+		
+		Raises KeyError if a relation points to a missing channel: the
+		previous relations of the channel, if any, are kept.
 		"""
 		
-		# Create the list where storing relations at
-		self.relations[channel] = []
+		definition = self.cache[channel]
 		
-		for dependency in self.cache[channel].get_dependencies():
-			self.relations[channel].append(
-				Dependency(
-					self.cache[dependency]
-				)
-			)
+		dependencies = definition.get_dependencies()
+		providers = definition.get_providers()
 		
-		for conflict in self.cache[channel].get_conflicts():
-			self.relations[channel].append(
-				Conflict(
-					self.cache[conflict]
-				)
-			)
+		# Build everything first, so that a missing channel leaves
+		# nothing half-built
+		relations = [
+			Dependency(self.cache[dependency])
+			for dependency in dependencies
+		]
+		
+		relations += [
+			Conflict(self.cache[conflict])
+			for conflict in definition.get_conflicts()
+		]
 		
 		# Handle provider relation
-		for provider in self.cache[channel].get_providers():
-			self.relations[channel].append(
-				ProviderRelation(
-					self.cache[channel],
-					self.cache[provider],
-					self.cache
-				)
+		relations += [
+			ProviderRelation(
+				definition,
+				self.cache[provider],
+				self.cache,
+				index=self.providers
 			)
+			for provider in providers
+		]
+		
+		# Drop the reverse edges of the previous relations, if any
+		self.remove_dependencies(channel)
+		
+		self.relations[channel] = relations
+		
+		for dependency in dependencies:
+			self.dependents.setdefault(dependency, {})[channel] = None
+		
+		self.dependencies[channel] = dependencies
+		
+		self.providers.add_channel(channel, providers)
+	
+	def remove_dependencies(self, channel):
+		"""
+		Drops the reverse dependency edges of the given channel.
+		"""
+		
+		for dependency in self.dependencies.pop(channel, ()):
+			if dependency in self.dependents:
+				self.dependents[dependency].pop(channel, None)
+	
+	@libchannels.metrics.timed("resolver.refresh")
+	def refresh(self, channels):
+		"""
+		Updates the relations after the given channels have been
+		reloaded, added or removed from the cache (e.g. by a
+		DiscoveryWatcher).
+		
+		Only the relations of the given channels, and of the channels
+		pointing to an outdated channel object, are built again.
+		
+		Returns a dictionary of channel -> KeyError of the channels whose
+		relations point to a missing channel: they keep their previous
+		relations (if any), and every other channel is built anyway.
+		"""
+		
+		changed = set(channels)
+		
+		for channel in list(self.relations):
+			if not channel in self.cache:
+				# Removed
+				del self.relations[channel]
+				
+				self.remove_dependencies(channel)
+				
+				self.providers.remove_channel(channel)
+			elif channel in changed or any(
+				self.cache.get(relation.get_name()) is not relation.target
+				for relation in self.relations[channel]
+			):
+				changed.add(channel)
+		
+		rebuilt = 0
+		failed = {}
+		for channel in changed:
+			if channel in self.cache and not channel.endswith(".provider"):
+				try:
+					self.build_relations(channel)
+				except KeyError as e:
+					failed[channel] = e
+				else:
+					rebuilt += 1
+		
+		libchannels.metrics.count("resolver.relations_rebuilt", rebuilt)
+		
+		return failed
 	
+	@libchannels.metrics.timed("resolver.solution")
 	def get_channel_solution(self, channel, action=ActionType.ENABLE):
 		"""
 		Returns a list of key,value pairs containing the steps to
 		take to accomplish the given action, or None if nothing could
 		be done.
+		
+		Raises DependencyCycleError if the solution depends on itself.
 		"""
 		
-		result = []
-
-		blockers = self.get_channel_blockers(channel, action=action)
-		
-		for blocker in blockers:
-			if type(blocker) == Dependency:
-				# Get solution for the given dependency
-				solutions = self.get_channel_solution(blocker.get_name(), ActionType.ENABLE)
-			if type(blocker) == Conflict:
-				# Get solution for the given conflict
-				solutions = self.get_channel_solution(blocker.get_name(), ActionType.DISABLE)
-			elif type(blocker) == ProviderRelation:
-				# Get solution for the given provider relation
-				solutions = self.get_channel_solution(blocker.get_current_provider_channel(), ActionType.DISABLE)
-		
-			if solutions != None:
-				result += [solution for solution in solutions if not solution in result]
-			else:
-				# Nothing to do
-				return None		
-		
-		# Finally add actual action
-		result.append((channel, action))
-		
-		return result
+		return SolutionPlanner(self).plan(channel, action)
+	
+	@libchannels.metrics.timed("resolver.goals_solution")
+	def get_goals_solution(self, goals):
+		"""
+		Returns a single list of key,value pairs containing the steps to
+		take to accomplish every (channel, action) pair in goals at once.
+		
+		Raises UnsatisfiableError if the goals can't be satisfied together,
+		and ValueError if a goal isn't a known channel.
+		"""
+		
+		return ChannelSolver(self).solve(goals)
+	
+	@libchannels.metrics.timed("resolver.matrix")
+	def get_channel_matrix(self):
+		"""
+		Returns the status of every channel, for both actions, as a
+		dictionary of channel -> { ActionType -> ActionStatus }.
+		
+		This is equivalent to calling is_channel_enableable(),
+		get_channel_blockers() and get_channel_solution() for every
+		channel, but everything is computed in a single pass over the
+		relations graph, sharing the results between channels.
+		"""
+		
+		planner = SolutionPlanner(self)
+		
+		matrix = {}
+		for channel in self.relations:
+			if not channel in self.cache:
+				continue
+			
+			matrix[channel] = {}
+			
+			for action in ActionType:
+				step = (channel, action)
+				
+				try:
+					solution_size = len(planner.get_reachable(step))
+				except DependencyCycleError:
+					solution_size = None
+				
+				blockers = planner.get_blockers(step)
+				
+				matrix[channel][action] = ActionStatus(
+					actionable=(not blockers),
+					blockers=blockers,
+					solution_size=solution_size
+				)
+		
+		return matrix
 	
 	def get_channel_blockers(self, channel, action=ActionType.ENABLE):
 		"""
@@ -114,16 +233,20 @@ class DependencyResolver:
 		"""
 		
 		if action == ActionType.ENABLE:
+			if libchannels.metrics.enabled:
+				libchannels.metrics.count("resolver.relations_evaluated", len(self.relations[channel]))
+			
 			return [relation for relation in self.relations[channel] if not relation]
 		elif action == ActionType.DISABLE:
-			compare_relation = Dependency(self.cache[channel])
+			if libchannels.metrics.enabled:
+				libchannels.metrics.count("resolver.relations_evaluated", len(self.dependents.get(channel, ())))
 			
-			# Simply build a list of Conflicts for the channels which depend
-			# on the one we want to remove
+			# Simply build a list of Conflicts for the enabled channels
+			# which depend on the one we want to remove
 			return [
 				Conflict(self.cache[name])
-				for name, relations in self.relations.items()
-				if compare_relation in relations and self.cache[name].enabled
+				for name in self.dependents.get(channel, ())
+				if self.cache[name].enabled
 			]
 	
 	def is_channel_enableable(self, channel):
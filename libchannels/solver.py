@@ -0,0 +1,280 @@
+# -*- coding: utf-8 -*-
+#
+# libchannels - update channels management library
+# Copyright (C) 2015 Eugenio "g7" Paolantonio
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+#
+
+from libchannels.actions import ActionType
+
+class UnsatisfiableError(Exception):
+
+	"""
+	Raised when a set of goals can't be satisfied together.
+
+	The conflicts attribute contains a (channel, enabled_by, disabled_by)
+	tuple for every channel that should be both enabled and disabled,
+	enabled_by and disabled_by being the goals requiring that.
+	A missing provider is reported as (provider, goal, None).
+	"""
+
+	def __init__(self, conflicts):
+		"""
+		Initializes the exception.
+		"""
+
+		self.conflicts = conflicts
+
+		super().__init__(
+			"Unsatisfiable goals: %s" % "; ".join(
+				(
+					"%s should be enabled for %s and disabled for %s" % (
+						channel,
+						"%s (%s)" % (enabled_by[0], enabled_by[1].name.lower()),
+						"%s (%s)" % (disabled_by[0], disabled_by[1].name.lower())
+					)
+					if disabled_by != None
+					else "no channel can provide %s for %s" % (
+						channel,
+						"%s (%s)" % (enabled_by[0], enabled_by[1].name.lower())
+					)
+				)
+				for channel, enabled_by, disabled_by in conflicts
+			)
+		)
+
+class ChannelSolver:
+
+	"""
+	The ChannelSolver() computes a single plan that satisfies a set of
+	(channel, action) goals at once, respecting depends, conflicts and
+	provides.
+
+	Channels are numbered, and the states (enabled, forced on, forced
+	off) are kept as bitsets. The plan is minimal: only the channels whose
+	state is implied by the goals are changed, and every channel is
+	changed at most once.
+	"""
+
+	def __init__(self, resolver):
+		"""
+		Initializes the class.
+		"""
+
+		self.cache = resolver.cache
+
+		self.names = [
+			channel
+			for channel in resolver.relations
+			if channel in self.cache and not channel.endswith(".provider")
+		]
+		self.indexes = {channel : index for index, channel in enumerate(self.names)}
+
+		count = len(self.names)
+
+		self.depends = [[] for x in range(count)]
+		self.dependents = [[] for x in range(count)]
+		self.conflicts = [set() for x in range(count)]
+		self.provides = [self.cache[channel].get_providers() for channel in self.names]
+		self.provider_depends = [[] for x in range(count)]
+
+		# provider -> list of channel indexes
+		self.providers = {}
+
+		for index, channel in enumerate(self.names):
+			obj = self.cache[channel]
+
+			for dependency in obj.get_dependencies():
+				if dependency.endswith(".provider"):
+					self.provider_depends[index].append(dependency)
+				elif dependency in self.indexes:
+					self.depends[index].append(self.indexes[dependency])
+					self.dependents[self.indexes[dependency]].append(index)
+
+			# Conflicts are symmetric
+			for conflict in obj.get_conflicts():
+				if conflict in self.indexes:
+					self.conflicts[index].add(self.indexes[conflict])
+					self.conflicts[self.indexes[conflict]].add(index)
+
+			for provider in self.provides[index]:
+				self.providers.setdefault(provider, []).append(index)
+
+	def get_state(self):
+		"""
+		Returns the bitset of the currently enabled channels.
+		"""
+
+		state = 0
+		for index, channel in enumerate(self.names):
+			if self.cache[channel].enabled:
+				state |= 1 << index
+
+		return state
+
+	def get_channels(self, state):
+		"""
+		Returns the names of the channels in the given bitset.
+		"""
+
+		return [
+			channel
+			for index, channel in enumerate(self.names)
+			if state >> index & 1
+		]
+
+	def solve(self, goals, state=None):
+		"""
+		Returns the list of (channel, action) steps that satisfies every
+		given (channel, action) goal, starting from the given state bitset
+		(or the current one).
+
+		Raises UnsatisfiableError if the goals can't be satisfied together,
+		and ValueError if a goal isn't a known channel.
+		"""
+
+		for channel, action in goals:
+			if not channel in self.indexes:
+				raise ValueError(
+					"%s is a provider, not a channel" % channel
+					if channel.endswith(".provider")
+					else "Unknown channel: %s" % channel
+				)
+
+		if state == None:
+			state = self.get_state()
+
+		on = off = 0
+		# index -> goal that forced it
+		reasons = {}
+		conflicts = []
+
+		worklist = [
+			(self.indexes[channel], action == ActionType.ENABLE, (channel, action))
+			for channel, action in goals
+		]
+
+		while worklist:
+			on, off = self.propagate(worklist, reasons, conflicts, on, off)
+
+			# Every enabled channel depending on a provider needs an
+			# enabled channel providing it
+			final = (state | on) & ~off
+			for index in range(len(self.names)):
+				if not final >> index & 1:
+					continue
+
+				for provider in self.provider_depends[index]:
+					candidates = self.providers.get(provider, [])
+
+					if any(final >> candidate & 1 for candidate in candidates):
+						continue
+
+					available = [candidate for candidate in candidates if not off >> candidate & 1]
+					if available:
+						worklist.append((available[0], True, reasons.get(index, (self.names[index], ActionType.ENABLE))))
+					else:
+						conflicts.append((provider, reasons.get(index, (self.names[index], ActionType.ENABLE)), None))
+
+				if worklist:
+					break
+
+		if conflicts:
+			raise UnsatisfiableError(list(dict.fromkeys(conflicts)))
+
+		return self.get_plan(state & off, on & ~state)
+
+	def propagate(self, worklist, reasons, conflicts, on, off):
+		"""
+		Propagates the requirements in worklist to the on and off bitsets,
+		and returns the updated (on, off).
+		"""
+
+		while worklist:
+			index, enable, goal = worklist.pop()
+			bit = 1 << index
+
+			if enable:
+				if off & bit:
+					conflicts.append((self.names[index], goal, reasons[index]))
+					continue
+				elif on & bit:
+					continue
+
+				on |= bit
+				reasons[index] = goal
+
+				for dependency in self.depends[index]:
+					worklist.append((dependency, True, goal))
+
+				for conflict in self.conflicts[index]:
+					worklist.append((conflict, False, goal))
+
+				# Only one channel can provide a provider
+				for provider in self.provides[index]:
+					for other in self.providers[provider]:
+						if other != index:
+							worklist.append((other, False, goal))
+			else:
+				if on & bit:
+					conflicts.append((self.names[index], reasons[index], goal))
+					continue
+				elif off & bit:
+					continue
+
+				off |= bit
+				reasons[index] = goal
+
+				for dependent in self.dependents[index]:
+					worklist.append((dependent, False, goal))
+
+		return on, off
+
+	def get_plan(self, to_disable, to_enable):
+		"""
+		Returns the ordered steps for the given bitsets: dependent channels
+		are disabled before their dependencies, and dependencies are
+		enabled before the channels depending on them. Disables come
+		first.
+		"""
+
+		plan = []
+
+		for mask, edges, action in (
+			(to_disable, self.dependents, ActionType.DISABLE),
+			(to_enable, self.depends, ActionType.ENABLE)
+		):
+			done = 0
+
+			for root in range(len(self.names)):
+				if not mask >> root & 1 or done >> root & 1:
+					continue
+
+				# Depth-first post-order visit restricted to the mask
+				done |= 1 << root
+				stack = [(root, iter(edges[root]))]
+				while stack:
+					index, children = stack[-1]
+					for child in children:
+						if mask >> child & 1 and not done >> child & 1:
+							done |= 1 << child
+							stack.append((child, iter(edges[child])))
+							break
+					else:
+						stack.pop()
+						plan.append((self.names[index], action))
+
+		return plan
@@ -0,0 +1,279 @@
+# -*- coding: utf-8 -*-
+#
+# libchannels - update channels management library
+# Copyright (C) 2015 Eugenio "g7" Paolantonio
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+#
+
+import logging
+import threading
+
+import libchannels.common
+import libchannels.channel
+import libchannels.writer
+
+logger = logging.getLogger(__name__)
+
+# The running transaction, per-thread
+_local = threading.local()
+
+def get_current():
+	"""
+	Returns the Transaction running in this thread, or None.
+	"""
+
+	return getattr(_local, "transaction", None)
+
+def get_state(entry):
+	"""
+	Returns the state of the given SourceEntry, as journaled by
+	record_entry().
+	"""
+
+	return (entry.disabled, entry.line, list(entry.comps))
+
+def record_entry(entry, state=None):
+	"""
+	Records the state of the given SourceEntry in the running transaction
+	(if any), before it gets changed. Its file is marked as dirty.
+
+	state, if given, is the get_state() of the entry taken before it
+	has been changed.
+	"""
+
+	libchannels.writer.writer.mark_entry_dirty(entry)
+
+	transaction = get_current()
+	if transaction:
+		transaction.record_entry(entry, state)
+
+def record_added(entry):
+	"""
+	Records that the given SourceEntry has been added to the sourceslist
+	in the running transaction (if any). Its file is marked as dirty.
+	"""
+
+	libchannels.writer.writer.mark_entry_dirty(entry)
+
+	transaction = get_current()
+	if transaction:
+		transaction.record_added(entry)
+
+def record_mapping(mapping, key):
+	"""
+	Records the current value of mapping[key] in the running transaction
+	(if any), before it gets changed.
+	"""
+
+	transaction = get_current()
+	if transaction:
+		transaction.record_mapping(mapping, key)
+
+def save():
+	"""
+	Saves the dirty sources files, and returns the number of files
+	written.
+
+	If a transaction is running, the save is deferred to its commit
+	(and 0 is returned).
+	"""
+
+	transaction = get_current()
+	if transaction:
+		transaction.changed = True
+		return 0
+	else:
+		return libchannels.writer.writer.save()
+
+class Transaction:
+
+	"""
+	A Transaction() stages every change made to the sources while it
+	is running, and writes them once on commit.
+
+	Every change is journaled in memory, so that a failed transaction
+	can be rolled back without parsing again the sources from disk.
+
+	Transactions are meant to be used as context managers:
+
+		with Transaction():
+			channel.enable()
+			other_channel.disable()
+
+	The transaction is committed if the block succeeds, and rolled back
+	if it raises. Entering again the running transaction is allowed:
+	only the outermost block commits. The number of files written by the
+	commit is then available in files_written.
+	"""
+
+	def __init__(self):
+		"""
+		Initializes the class.
+		"""
+
+		self.depth = 0
+		self.changed = False
+
+		self.files_written = 0
+
+		self.clear()
+
+	def clear(self):
+		"""
+		Clears the journal.
+		"""
+
+		# id(entry) -> (entry, (disabled, line, comps))
+		self.entries = {}
+		# SourceEntry objects added to the sourceslist
+		self.added = []
+		# (mapping, key, had_key, value)
+		self.mappings = []
+		# Files dirty before the transaction started
+		self.dirty = set(libchannels.writer.writer.dirty)
+
+		self.changed = False
+
+	def __enter__(self):
+		"""
+		Starts the transaction.
+		"""
+
+		current = get_current()
+
+		if current == None:
+			_local.transaction = self
+
+			self.clear()
+			self.files_written = 0
+		elif current != self:
+			raise Exception("Another transaction is already running.")
+
+		self.depth += 1
+
+		return self
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		"""
+		Commits or rolls back the transaction.
+		"""
+
+		self.depth -= 1
+
+		if self.depth > 0:
+			# Nested block, the outermost one will take care of us
+			return False
+
+		try:
+			if exc_type == None:
+				self.commit()
+			else:
+				logger.warning("Rolling back transaction: %s" % exc_value)
+				self.rollback()
+		finally:
+			_local.transaction = None
+
+		return False
+
+	def record_entry(self, entry, state=None):
+		"""
+		Records the state of the given SourceEntry (or the given previous
+		state, see get_state()).
+		"""
+
+		if not id(entry) in self.entries:
+			self.entries[id(entry)] = (entry, state if state != None else get_state(entry))
+
+		self.changed = True
+
+	def record_added(self, entry):
+		"""
+		Records an added SourceEntry.
+		"""
+
+		self.added.append(entry)
+
+		self.changed = True
+
+	def record_mapping(self, mapping, key):
+		"""
+		Records the value of mapping[key].
+		"""
+
+		self.mappings.append((mapping, key, key in mapping, mapping.get(key)))
+
+	def commit(self):
+		"""
+		Writes the staged changes.
+		"""
+
+		if not self.changed:
+			self.clear()
+			return
+
+		writer = libchannels.writer.writer
+		touched = writer.dirty - self.dirty
+
+		try:
+			self.files_written = writer.save()
+		except Exception:
+			# Restore the previous state, and try to write it back
+			self.rollback()
+			writer.mark_dirty(*touched)
+
+			try:
+				writer.save()
+			except Exception as err:
+				logger.error("Unable to restore the sources: %s" % err)
+
+			raise
+
+		self.clear()
+
+	def rollback(self):
+		"""
+		Restores the state the sources had when the transaction started.
+		"""
+
+		for mapping, key, had_key, value in reversed(self.mappings):
+			if had_key:
+				mapping[key] = value
+			else:
+				mapping.pop(key, None)
+
+		# SourceEntry compares by value, so look for the added objects
+		# by identity
+		added = set(id(entry) for entry in self.added)
+		if added:
+			sourceslist = libchannels.common.sourceslist
+			sourceslist.list[:] = [
+				entry
+				for entry in sourceslist.list
+				if not id(entry) in added
+			]
+
+		for entry, (disabled, line, comps) in self.entries.values():
+			entry.disabled = disabled
+			entry.line = line
+			entry.comps = comps
+
+		# Cached enabled states are stale now
+		libchannels.channel.invalidate()
+
+		# Nothing has been written, files are as clean as they were
+		libchannels.writer.writer.dirty = self.dirty
+
+		self.clear()
@@ -18,22 +18,149 @@
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
 #
 
-import apt
-import apt_pkg
-
+import os
+import time
 import logging
+import subprocess
 
+import libchannels.archives
 import libchannels.common
+import libchannels.metrics
 
-from apt_pkg import size_to_str
+from libchannels.changes import Change, ChangeTable, PackageRecord
 
 logger = logging.getLogger(__name__)
 
-# APT Configuration
+# apt and apt_pkg are heavy, and importing them has side effects on the
+# APT configuration: they are imported by load_apt() when the first
+# Updates() object is created.
+apt = None
+apt_pkg = None
+
+def load_apt():
+	"""
+	Imports apt and apt_pkg, and sets up the APT configuration.
+	"""
+	
+	global apt, apt_pkg
+	
+	if apt_pkg != None:
+		return
+	
+	import apt
+	import apt_pkg
+	
+	# APT Configuration
+	
+	# FIXME: should make this interactive
+	apt_pkg.config.set("DPkg::Options::", "--force-confdef")
+	apt_pkg.config.set("DPkg::Options::", "--force-confold")
+
+def get_cache_fingerprint():
+	"""
+	Returns the fingerprint of everything an apt.Cache is built from:
+	the APT lists, the dpkg status file, the sources and the
+	preferences. If it changes, the cache is stale.
+	
+	Only stat() calls are done, nothing is read.
+	"""
+	
+	fingerprint = []
+	
+	for path in (
+		apt_pkg.config.find_file("Dir::State::status"),
+		apt_pkg.config.find_file("Dir::Etc::sourcelist"),
+		apt_pkg.config.find_file("Dir::Etc::preferences"),
+	):
+		try:
+			stat = os.stat(path)
+			fingerprint.append((path, stat.st_mtime_ns, stat.st_size, stat.st_ino))
+		except OSError:
+			fingerprint.append((path, None))
+	
+	for directory in (
+		apt_pkg.config.find_dir("Dir::State::lists"),
+		apt_pkg.config.find_dir("Dir::Etc::sourceparts"),
+		apt_pkg.config.find_dir("Dir::Etc::preferencesparts"),
+	):
+		try:
+			entries = sorted(
+				(entry.name, entry.stat().st_mtime_ns, entry.stat().st_size)
+				for entry in os.scandir(directory)
+				if entry.is_file()
+			)
+		except OSError:
+			entries = None
+		
+		fingerprint.append((directory, entries))
+	
+	return tuple(fingerprint)
 
-# FIXME: should make this interactive
-apt_pkg.config.set("DPkg::Options::", "--force-confdef")
-apt_pkg.config.set("DPkg::Options::", "--force-confold")
+class FetchOptions:
+	
+	"""
+	The FetchOptions() class holds the APT download scheduling options
+	used by Updates.fetch(). Options left to None keep the APT default.
+	
+	queue_mode is "host" (a queue for every host) or "access" (a queue
+	for every method).
+	
+	max_queues sets Acquire::QueueHost::Limit, the maximum number of
+	queues (and so of connections) running at the same time, for every
+	host together. It isn't a per-host limit: APT uses a single queue
+	for every host.
+	
+	pipeline_depth is the number of requests pipelined on every HTTP(S)
+	connection.
+	
+	bandwidth_limit is the overall download rate, in KiB/s. APT only
+	limits the rate of every connection (Acquire::http(s)::Dl-Limit):
+	bandwidth_limit is split between the max_queues ones, so it is only
+	an overall cap if max_queues is set too.
+	"""
+	
+	def __init__(
+		self,
+		queue_mode=None,
+		max_queues=None,
+		pipeline_depth=None,
+		bandwidth_limit=None
+	):
+		"""
+		Initializes the class.
+		"""
+		
+		if queue_mode not in (None, "host", "access"):
+			raise ValueError("Unknown queue mode %s" % queue_mode)
+		
+		self.queue_mode = queue_mode
+		self.max_queues = max_queues
+		self.pipeline_depth = pipeline_depth
+		self.bandwidth_limit = bandwidth_limit
+	
+	def apply(self):
+		"""
+		Sets the options in the APT configuration. This must be done
+		before creating the apt_pkg.Acquire object.
+		"""
+		
+		load_apt()
+		
+		if self.queue_mode != None:
+			apt_pkg.config.set("Acquire::Queue-Mode", self.queue_mode)
+		
+		if self.max_queues != None:
+			apt_pkg.config.set("Acquire::QueueHost::Limit", str(self.max_queues))
+		
+		for method in ("http", "https"):
+			if self.pipeline_depth != None:
+				apt_pkg.config.set("Acquire::%s::Pipeline-Depth" % method, str(self.pipeline_depth))
+			
+			if self.bandwidth_limit != None:
+				apt_pkg.config.set(
+					"Acquire::%s::Dl-Limit" % method,
+					str(max(1, self.bandwidth_limit // (self.max_queues or 1)))
+				)
 
 class Updates:
 	
@@ -48,6 +175,8 @@ class Updates:
 		Initializes the class.
 		"""
 		
+		load_apt()
+		
 		# Used to determine if mark_for_upgrade has been executed
 		self.changed = False
 		
@@ -62,15 +191,41 @@ class Updates:
 		
 		self.cache = None
 		
+		# The last opened apt.Cache. It is kept across clear() calls, and
+		# reused by open_cache() until its fingerprint changes
+		self.warm_cache = None
+		self.cache_fingerprint = None
+		self.cache_opened_at = None
+		
+		# Number of times the cache has been built or reopened
+		self.cache_reopens = 0
+		
 		self.cache_progress = None
 		self.cache_acquire_progress = None
 		self.packages_acquire_progress = None
 		self.packages_install_progress = None
 		self.packages_install_failure_callback = None
 		
+		# Called as callback(index, count, status) by the pipelined
+		# install, status being "downloading", "installing", "done"
+		# or "failed"
+		self.packages_batch_callback = None
+		
+		# id -> PackageRecord of every package listed by iter_changes()
 		self.id_with_packages = {}
 		
-		self.now_kept = []
+		# Kept package ids. Values are unused, this is an ordered set
+		self.now_kept = {}
+		
+		# FetchOptions used by fetch(), None to keep the APT defaults
+		self.fetch_options = None
+		
+		# Already verified archives, built on the first fetch()
+		self.archive_index = None
+		
+		# Ids of the packages whose marking changed since the last
+		# get_user_changes() call (ordered set)
+		self.changed_ids = {}
 	
 	def notify_error(self, error, description="", callback=None):
 		"""
@@ -86,19 +241,56 @@ class Updates:
 		if callback or self.generic_failure_callback:
 			(callback if callback else self.generic_failure_callback)(error, str(description))
 	
-	def open_cache(self, progress=None):
+	@property
+	def cache_age(self):
+		"""
+		Returns the number of seconds since the cache has been (re)opened,
+		or None if it has never been opened.
+		"""
+		
+		if self.cache_opened_at == None:
+			return None
+		
+		return time.monotonic() - self.cache_opened_at
+	
+	@libchannels.metrics.timed("updates.open_cache")
+	def open_cache(self, progress=None, force=False):
 		"""
 		Opens/Creates the cache.
+		
+		The warm cache is reused, with every change cleared, unless what
+		it has been built from changed (see get_cache_fingerprint()) or
+		force is True.
 		"""
 		
-		if not self.cache:
-			self.cache = apt.Cache(progress=self.cache_progress)
+		fingerprint = get_cache_fingerprint()
+		
+		if self.warm_cache and not force and fingerprint == self.cache_fingerprint:
+			# Still fresh, just drop the changes
+			self.warm_cache.clear()
 		else:
-			self.cache.open(progress=self.cache_progress)
+			if not self.warm_cache:
+				self.warm_cache = apt.Cache(progress=self.cache_progress)
+			else:
+				self.warm_cache.open(progress=self.cache_progress)
+			
+			# Take the fingerprint from before the opening: anything
+			# changed in the meantime makes the next call reopen
+			self.cache_fingerprint = fingerprint
+			self.cache_opened_at = time.monotonic()
+			self.cache_reopens += 1
+			
+			libchannels.metrics.count("updates.cache_reopens")
+		
+		libchannels.metrics.gauge("updates.cache_age", self.cache_age)
+		
+		self.cache = self.warm_cache
 	
 	def clear(self):
 		"""
 		Clears the changes made.
+		
+		The cache is detached, but kept warm for the next open_cache().
 		"""
 		
 		if self.cache:
@@ -107,7 +299,8 @@ class Updates:
 		self.changed = False
 		
 		self.id_with_packages = {}
-		self.now_kept = []
+		self.now_kept = {}
+		self.changed_ids = {}
 	
 	def get_update_infos(self):
 		"""
@@ -119,6 +312,7 @@ class Updates:
 		
 		return self.cache.required_download, self.cache.required_space
 	
+	@libchannels.metrics.timed("updates.update")
 	def update(self):
 		"""
 		Updates the package cache.
@@ -152,15 +346,62 @@ class Updates:
 		
 		return True
 	
+	def get_archives(self):
+		"""
+		Returns the archives of the packages marked for install, as a
+		dictionary of path -> expected hash ("TYPE:value").
+		"""
+		
+		depcache = self.cache._depcache
+		
+		archives = {}
+		for rawpkg in self.get_changed_packages():
+			if self.get_raw_reason(depcache, rawpkg) in (None, "remove"):
+				continue
+			
+			archive = libchannels.archives.get_archive(
+				self.cache,
+				rawpkg,
+				depcache.get_candidate_ver(rawpkg)
+			)
+			if archive != None:
+				uri, hashes, size, destfile = archive
+				archives[destfile] = str(hashes.find(""))
+		
+		return archives
+	
+	@libchannels.metrics.timed("updates.fetch")
 	def fetch(self, package_manager=None):
 		"""
 		Fetches the updates.
+		
+		Archives already in the APT cache are verified first (unless they
+		have been verified already, see ArchiveIndex), as APT only checks
+		their size: the damaged ones are downloaded again.
 		"""
 		
 		if not self.cache:
 			return False
 		
 		logger.info("Beginning fetch")
+		
+		if self.fetch_options:
+			self.fetch_options.apply()
+		
+		if self.archive_index == None:
+			self.archive_index = libchannels.archives.ArchiveIndex()
+		
+		try:
+			archives = self.get_archives()
+			self.archive_index.verify(archives)
+			
+			# Even if the fetch fails, they don't need to be hashed again
+			self.archive_index.save()
+		except OSError as err:
+			# e.g. a damaged archive that can't be removed
+			self.notify_error("Unable to verify the cached packages", err)
+			return False
+		
 		acquire_object = apt_pkg.Acquire(progress=self.packages_acquire_progress)
 		
 		try:
@@ -169,6 +410,11 @@ class Updates:
 			else:
 				# Handle internally
 				self.cache._fetch_archives(acquire_object, package_manager)
+			
+			# APT verified what it downloaded
+			self.archive_index.add_downloaded(acquire_object.items, archives)
+			self.archive_index.save()
+			
 			acquire_object.shutdown()
 		except apt.cache.FetchCancelledException:
 			# Cancelled
@@ -180,14 +426,25 @@ class Updates:
 		
 		return True
 	
-	def install(self):
+	@libchannels.metrics.timed("updates.install")
+	def install(self, pipelined=False, batch_size=50):
 		"""
 		Installs the updates.
+		
+		If pipelined is True, the changes are installed in
+		dependency-closed batches of at least batch_size packages, every
+		batch being downloaded while the previous one is installed (see
+		libchannels.pipeline).
 		"""
 		
 		if not self.cache:
 			return False
 		
+		if pipelined:
+			import libchannels.pipeline
+			
+			return libchannels.pipeline.PipelinedInstall(self, batch_size=batch_size).run()
+		
 		package_manager = apt_pkg.PackageManager(self.cache._depcache)
 		
 		# Once the installation has been completed, there are three
@@ -227,7 +484,7 @@ class Updates:
 				)
 				# Dpkg journal dirty?
 				if self.cache.dpkg_journal_dirty:
-					subprocess.call(["dpkg", "configure", "--all"])
+					subprocess.call(["dpkg", "--configure", "-a"])
 				
 				# FIXME: add check for core packages
 				
@@ -286,34 +543,174 @@ class Updates:
 		
 		return reason
 	
-	def get_changes(self, callback, finish_callback=None):
+	@staticmethod
+	def get_raw_reason(depcache, rawpkg):
 		"""
-		Returns the changes one-by-one by firing the callback.
+		Like get_reason(), but works directly on an apt_pkg.Package.
 		"""
 		
-		for pkg in self.cache:
-			reason = self.get_reason(pkg)
-			
-			if reason == None and not pkg.id in self.now_kept:
-				continue
-			
-			if pkg.candidate == None:
+		if depcache.marked_delete(rawpkg):
+			return "remove"
+		elif depcache.marked_downgrade(rawpkg):
+			return "downgrade"
+		elif depcache.marked_install(rawpkg):
+			return "install"
+		elif depcache.marked_upgrade(rawpkg):
+			return "upgrade"
+		
+		return None
+	
+	@staticmethod
+	def get_raw_marking(depcache, rawpkg):
+		"""
+		Like get_raw_reason(), but returns "keep" for kept packages.
+		"""
+		
+		reason = Updates.get_raw_reason(depcache, rawpkg)
+		if reason == None and depcache.marked_keep(rawpkg):
+			reason = "keep"
+		
+		return reason
+	
+	def get_rawpkg(self, id):
+		"""
+		Returns the apt_pkg.Package of the given listed package id.
+		"""
+		
+		return self.cache._cache[self.id_with_packages[id].name]
+	
+	def get_package(self, id):
+		"""
+		Returns the apt.Package of the given listed package id.
+		"""
+		
+		return self.cache[self.id_with_packages[id].name]
+	
+	def get_markings(self, rawpkgs=None):
+		"""
+		Returns a snapshot of the marking of every listed package, as
+		a dictionary of id -> reason ("keep" for kept packages).
+		
+		rawpkgs, if given, is the dictionary of id -> apt_pkg.Package
+		of the listed packages, to save the name lookups.
+		"""
+		
+		depcache = self.cache._depcache
+		
+		if rawpkgs == None:
+			rawpkgs = {id : self.get_rawpkg(id) for id in self.id_with_packages}
+		
+		return {
+			id : self.get_raw_marking(depcache, rawpkg)
+			for id, rawpkg in rawpkgs.items()
+		}
+	
+	def get_changed_packages(self):
+		"""
+		Returns the sorted list of the apt_pkg.Package objects that are
+		either marked for a change or kept by the user.
+		
+		The packages are taken straight from the depcache: no apt.Package
+		is built, and the walk stops as soon as every marked package has
+		been found.
+		"""
+		
+		depcache = self.cache._depcache
+		
+		# Every install, upgrade, downgrade and removal
+		remaining = depcache.inst_count + depcache.del_count
+		
+		found = {}
+		
+		if remaining > 0:
+			for rawpkg in self.cache._cache.packages:
+				if self.get_raw_reason(depcache, rawpkg) != None:
+					found[rawpkg.id] = rawpkg
+					
+					remaining -= 1
+					if remaining == 0:
+						break
+		
+		for id in self.now_kept:
+			if not id in found:
+				found[id] = self.get_rawpkg(id)
+		
+		# Same order of apt.Cache
+		return sorted(found.values(), key=lambda rawpkg: rawpkg.get_fullname(True))
+	
+	def iter_changes(self, batch_size=100):
+		"""
+		Yields the changes (marked and kept packages), as lists of at most
+		batch_size Change objects.
+		"""
+		
+		if not self.cache:
+			return
+		
+		depcache = self.cache._depcache
+		
+		batch = []
+		for rawpkg in self.get_changed_packages():
+			candidate = depcache.get_candidate_ver(rawpkg)
+			if candidate == None:
 				# What?!
 				continue
 			
+			reason = self.get_raw_reason(depcache, rawpkg)
+			
 			# Save the id, may be used later
-			if not pkg.id in self.id_with_packages:
-				self.id_with_packages[pkg.id] = (pkg, reason)
+			if not rawpkg.id in self.id_with_packages:
+				self.id_with_packages[rawpkg.id] = PackageRecord(
+					rawpkg.id,
+					rawpkg.get_fullname(True),
+					reason
+				)
 			
-						
-			callback(
-				pkg.id, # id
-				pkg.name, # name
-				pkg.candidate.version, # version
-				reason if reason else self.id_with_packages[pkg.id][1], # reason
-				not pkg.id in self.now_kept, # status
-				size_to_str(pkg.candidate.size) + "B" # size (FIXME: should use size_to_str outside)
+			batch.append(
+				Change(
+					rawpkg.id,
+					self.id_with_packages[rawpkg.id].name,
+					candidate.ver_str,
+					reason if reason else self.id_with_packages[rawpkg.id].reason,
+					not rawpkg.id in self.now_kept,
+					candidate.size
+				)
 			)
+			
+			if len(batch) >= batch_size:
+				yield batch
+				batch = []
+		
+		if batch:
+			yield batch
+	
+	def get_change_table(self, batch_size=100):
+		"""
+		Returns the changes as a ChangeTable.
+		"""
+		
+		table = ChangeTable()
+		
+		for batch in self.iter_changes(batch_size):
+			table.extend(batch)
+		
+		return table
+	
+	def get_changes(self, callback, finish_callback=None):
+		"""
+		Returns the changes one-by-one by firing the callback.
+		"""
+		
+		for batch in self.iter_changes():
+			for change in batch:
+				callback(
+					change.id, # id
+					change.name, # name
+					change.version, # version
+					change.reason, # reason
+					change.status, # status
+					apt_pkg.size_to_str(change.size) + "B" # size (FIXME: should use size_to_str outside)
+				)
 		
 		if finish_callback:
 			finish_callback()
@@ -324,7 +721,7 @@ class Updates:
 		"""
 		
 		if package:
-			print("Restoring working state (%s)" % package.name)
+			logger.info("Restoring working state (%s)" % package.name)
 		
 		# Clear cache
 		self.cache.clear()
@@ -334,18 +731,27 @@ class Updates:
 		
 		# Restore now_kept
 		for id in self.now_kept:
-			self.cache._depcache.mark_keep(self.id_with_packages[id][0]._pkg)
+			self.cache._depcache.mark_keep(self.get_rawpkg(id))
 	
 	def change_status(self, id, reason):
 		"""
 		Keeps a package, and tries to fix eventual problems.
+		
+		The packages whose marking changed are reported by the next
+		get_user_changes() call.
 		"""
 		
+		# Snapshot the markings, to find what the change touched. The
+		# packages are looked up once: a restored working state keeps
+		# the same cache.
+		rawpkgs = {id : self.get_rawpkg(id) for id in self.id_with_packages}
+		before = self.get_markings(rawpkgs)
+		
 		with self.cache.actiongroup():
 			
 			self.cache.cache_pre_change()
 			
-			package = self.id_with_packages[id][0]
+			package = self.get_package(id)
 			
 			# Change status
 			if reason == "keep":
@@ -385,18 +791,30 @@ class Updates:
 					fixer.clear(package._pkg)
 			
 			self.cache.cache_post_change()
+		
+		for id, marking in self.get_markings(rawpkgs).items():
+			if before[id] != marking:
+				self.changed_ids[id] = None
 	
 	def get_user_changes(self, callback):
 		"""
-		Returns the user changes (done by keep_package).
+		Returns the user changes (done by change_status).
+		
+		Only the packages whose marking changed since the last call are
+		checked.
 		"""
 		
+		depcache = self.cache._depcache
+		
+		changed = [id for id in self.changed_ids if id in self.id_with_packages]
+		self.changed_ids = {}
+		
 		# Firstly handle previously kept packages that may now have
 		# been restored to their original action
-		for id in self.now_kept[:]:
-			if not self.id_with_packages[id][0].marked_keep:
+		for id in changed:
+			if id in self.now_kept and not depcache.marked_keep(self.get_rawpkg(id)):
 				# Reason changed back, should notify
-				reason = self.get_reason(self.id_with_packages[id][0])
+				reason = self.get_raw_reason(depcache, self.get_rawpkg(id))
 				if reason:
 					callback(
 						id,
@@ -404,13 +822,13 @@ class Updates:
 					)
 				
 				# Remove from now_kept
-				self.now_kept.remove(id)
+				del self.now_kept[id]
 			
 		
 		# Now handle every other package that may have now been kept
-		for id, val in self.id_with_packages.items():
+		for id in changed:
 						
-			if val[0].marked_keep and not id in self.now_kept:
+			if depcache.marked_keep(self.get_rawpkg(id)) and not id in self.now_kept:
 				# Newly kept, should notify
 				callback(
 					id,
@@ -418,6 +836,6 @@ class Updates:
 				)
 				
 				# Add to now_kept
-				self.now_kept.append(id)
+				self.now_kept[id] = None
 			
 			
@@ -0,0 +1,480 @@
+# -*- coding: utf-8 -*-
+#
+# libchannels - update channels management library
+# Copyright (C) 2015 Eugenio "g7" Paolantonio
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+#
+
+import os
+import time
+import errno
+import struct
+import select
+import logging
+
+import ctypes
+import ctypes.util
+
+from enum import Enum
+from collections import namedtuple
+
+import libchannels.common
+import libchannels.config
+
+logger = logging.getLogger(__name__)
+
+class ChangeType(Enum):
+	"""
+	The ChangeType enum.
+	"""
+
+	ADDED = 1
+	REMOVED = 2
+	CHANGED = 3
+	ENABLED = 4
+	DISABLED = 5
+
+ChangeEvent = namedtuple("ChangeEvent", ["type", "channel"])
+
+class WatchKind(Enum):
+	"""
+	The WatchKind enum, describing what a watched directory contains.
+	"""
+
+	CHANNELS = 1
+	SOURCES = 2
+	LISTS = 3
+
+class Inotify:
+
+	"""
+	A minimal ctypes wrapper around the Linux inotify API.
+	"""
+
+	IN_MODIFY = 0x00000002
+	IN_ATTRIB = 0x00000004
+	IN_CLOSE_WRITE = 0x00000008
+	IN_MOVED_FROM = 0x00000040
+	IN_MOVED_TO = 0x00000080
+	IN_CREATE = 0x00000100
+	IN_DELETE = 0x00000200
+	IN_Q_OVERFLOW = 0x00004000
+
+	WATCH_MASK = (
+		IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM |
+		IN_MOVED_TO | IN_CREATE | IN_DELETE
+	)
+
+	EVENT_HEADER = struct.Struct("iIII")
+
+	def __init__(self):
+		"""
+		Initializes the class.
+
+		Raises OSError if inotify is not available.
+		"""
+
+		try:
+			self.libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+			init = self.libc.inotify_init1
+		except (OSError, AttributeError):
+			raise OSError(errno.ENOSYS, "inotify is not available")
+
+		self.fd = init(os.O_NONBLOCK | os.O_CLOEXEC)
+		if self.fd < 0:
+			error = ctypes.get_errno()
+			raise OSError(error, os.strerror(error))
+
+	def add_watch(self, path, mask=WATCH_MASK):
+		"""
+		Watches the given path, and returns the watch descriptor.
+		"""
+
+		wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), mask)
+		if wd < 0:
+			error = ctypes.get_errno()
+			raise OSError(error, os.strerror(error), path)
+
+		return wd
+
+	def read(self):
+		"""
+		Returns the pending events as a list of (wd, mask, name) tuples.
+		"""
+
+		try:
+			buffer = os.read(self.fd, 65536)
+		except BlockingIOError:
+			return []
+
+		events = []
+		offset = 0
+		while offset < len(buffer):
+			wd, mask, cookie, length = self.EVENT_HEADER.unpack_from(buffer, offset)
+			offset += self.EVENT_HEADER.size
+
+			name = buffer[offset:offset+length].rstrip(b"\0")
+			offset += length
+
+			events.append((wd, mask, os.fsdecode(name)))
+
+		return events
+
+	def close(self):
+		"""
+		Closes the inotify instance.
+		"""
+
+		os.close(self.fd)
+
+class DiscoveryWatcher:
+
+	"""
+	The DiscoveryWatcher() class keeps a ChannelDiscovery up-to-date by
+	watching CHANNEL_SEARCH_PATH, the APT sources and the APT lists
+	directory.
+
+	Changes are detected through inotify, or by polling the watched
+	directories if inotify is not available. Only the affected channels are
+	reloaded, and every change is notified to the registered callbacks as
+	a list of ChangeEvent.
+
+	The watcher is not thread-safe: the discovery should not be used
+	by other threads while wait() is processing changes.
+	"""
+
+	# Seconds between every check, when polling
+	POLL_INTERVAL = 2.0
+
+	# Seconds to wait for further changes before processing a batch
+	SETTLE_TIME = 0.2
+
+	def __init__(self, discovery, callback=None, use_inotify=True):
+		"""
+		Initializes the class.
+		"""
+
+		self.discovery = discovery
+
+		self.callbacks = [callback] if callback else []
+
+		self.use_inotify = use_inotify
+		self.inotify = None
+		self.watches = {}
+		self.snapshot = {}
+
+		self.running = False
+
+		# (directory, kind, filter) tuples, see get_directories()
+		self.directories = []
+
+	@staticmethod
+	def get_directories():
+		"""
+		Returns the (directory, kind, filter) tuples of the watched
+		directories.
+
+		The APT configuration must be initialized already (e.g. by
+		libchannels.common.get_sourceslist()).
+		"""
+
+		import apt_pkg
+
+		sourcelist = apt_pkg.config.find_file("Dir::Etc::sourcelist")
+		sourceparts = apt_pkg.config.find_dir("Dir::Etc::sourceparts")
+
+		return [
+			(
+				libchannels.config.CHANNEL_SEARCH_PATH,
+				WatchKind.CHANNELS,
+				lambda name: name.endswith(".channel") or name.endswith(".provider")
+			),
+			(
+				os.path.dirname(sourcelist),
+				WatchKind.SOURCES,
+				lambda name: name == os.path.basename(sourcelist)
+			),
+			(
+				sourceparts.rstrip("/"),
+				WatchKind.SOURCES,
+				lambda name: name.endswith(".list")
+			),
+			(
+				libchannels.config.APT_LISTS_PATH,
+				WatchKind.LISTS,
+				lambda name: name.endswith("Release")
+			),
+		]
+
+	def add_callback(self, callback):
+		"""
+		Registers a callback, that will be called with the list of
+		ChangeEvent every time something changes.
+		"""
+
+		self.callbacks.append(callback)
+
+	def start(self):
+		"""
+		Starts watching. The discovery is run first, if needed.
+		"""
+
+		if self.discovery.matcher == None:
+			self.discovery.discover()
+
+		# Initializes the APT configuration as well
+		libchannels.common.get_sourceslist()
+
+		self.directories = self.get_directories()
+
+		if self.use_inotify:
+			try:
+				self.inotify = Inotify()
+			except OSError as e:
+				logger.info("inotify not available (%s), falling back to polling" % e)
+				self.inotify = None
+
+		for directory, kind, filter in self.directories:
+			if not directory or not os.path.isdir(directory):
+				logger.debug("Not watching %s: not a directory" % directory)
+				continue
+
+			if self.inotify:
+				try:
+					self.watches[self.inotify.add_watch(directory)] = (directory, kind, filter)
+				except OSError as e:
+					logger.warning("Unable to watch %s: %s" % (directory, e))
+			else:
+				self.snapshot[directory] = self.get_snapshot(directory, filter)
+
+		self.running = True
+
+	def stop(self):
+		"""
+		Stops watching.
+		"""
+
+		self.running = False
+
+		if self.inotify:
+			self.inotify.close()
+			self.inotify = None
+
+		self.watches = {}
+		self.snapshot = {}
+
+	def fileno(self):
+		"""
+		Returns the inotify file descriptor, to be used in an external
+		event loop, or None when polling.
+		"""
+
+		return self.inotify.fd if self.inotify else None
+
+	@staticmethod
+	def get_snapshot(directory, filter):
+		"""
+		Returns a dictionary with the (mtime, size, inode) of every
+		interesting file in the given directory.
+		"""
+
+		snapshot = {}
+
+		try:
+			for entry in os.scandir(directory):
+				if not filter(entry.name):
+					continue
+
+				try:
+					stat = entry.stat()
+				except OSError:
+					continue
+
+				snapshot[entry.name] = (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+		except OSError:
+			pass
+
+		return snapshot
+
+	def collect_inotify(self, timeout):
+		"""
+		Waits for inotify events and returns the changed
+		(channel_files, sources_changed, lists_changed, overflow).
+		"""
+
+		channel_files = set()
+		sources_changed = lists_changed = overflow = False
+
+		while True:
+			ready, _, _ = select.select([self.inotify.fd], [], [], timeout)
+			if not ready:
+				break
+
+			for wd, mask, name in self.inotify.read():
+				if mask & Inotify.IN_Q_OVERFLOW:
+					overflow = True
+					continue
+
+				if not wd in self.watches:
+					continue
+
+				directory, kind, filter = self.watches[wd]
+				if not filter(name):
+					continue
+
+				if kind == WatchKind.CHANNELS:
+					channel_files.add(name)
+				elif kind == WatchKind.SOURCES:
+					sources_changed = True
+				elif kind == WatchKind.LISTS:
+					lists_changed = True
+
+			# Wait a bit more for related changes (e.g. apt-get update)
+			timeout = self.SETTLE_TIME
+
+		return channel_files, sources_changed, lists_changed, overflow
+
+	def collect_polling(self, timeout):
+		"""
+		Polls the watched directories and returns the changed
+		(channel_files, sources_changed, lists_changed, overflow).
+		"""
+
+		channel_files = set()
+		sources_changed = lists_changed = False
+
+		deadline = None if timeout == None else time.monotonic() + timeout
+
+		while True:
+			for directory, kind, filter in self.directories:
+				if not directory in self.snapshot:
+					continue
+
+				previous = self.snapshot[directory]
+				current = self.get_snapshot(directory, filter)
+
+				if current == previous:
+					continue
+
+				self.snapshot[directory] = current
+
+				if kind == WatchKind.CHANNELS:
+					channel_files.update(
+						name
+						for name in set(previous) | set(current)
+						if previous.get(name) != current.get(name)
+					)
+				elif kind == WatchKind.SOURCES:
+					sources_changed = True
+				elif kind == WatchKind.LISTS:
+					lists_changed = True
+
+			if channel_files or sources_changed or lists_changed:
+				break
+
+			if deadline == None:
+				wait = self.POLL_INTERVAL
+			else:
+				wait = min(self.POLL_INTERVAL, deadline - time.monotonic())
+				if wait <= 0:
+					break
+
+			time.sleep(wait)
+
+		return channel_files, sources_changed, lists_changed, False
+
+	def wait(self, timeout=None):
+		"""
+		Waits for changes (up to timeout seconds, or forever if timeout
+		is None), applies them to the discovery and returns the list of
+		ChangeEvent. The registered callbacks are called as well.
+		"""
+
+		if self.inotify:
+			changes = self.collect_inotify(timeout)
+		else:
+			changes = self.collect_polling(timeout)
+
+		events = self.process(*changes)
+
+		if events:
+			for callback in self.callbacks:
+				callback(events)
+
+		return events
+
+	def run(self):
+		"""
+		Watches for changes until stop() is called.
+		"""
+
+		if not self.running:
+			self.start()
+
+		while self.running:
+			self.wait(timeout=self.POLL_INTERVAL)
+
+	def process(self, channel_files, sources_changed, lists_changed, overflow=False):
+		"""
+		Applies the given changes to the discovery, and returns the list
+		of ChangeEvent.
+		"""
+
+		cache = self.discovery.cache
+
+		if overflow:
+			# We lost track of what happened, check everything
+			channel_files = set(channel_files)
+			channel_files.update(
+				name
+				for name in os.listdir(libchannels.config.CHANNEL_SEARCH_PATH)
+				if name.endswith(".channel") or name.endswith(".provider")
+			)
+			channel_files.update(
+				name if name.endswith(".provider") else "%s.channel" % name
+				for name in cache
+			)
+			sources_changed = True
+
+		enabled_before = set(self.discovery.channels)
+
+		events = []
+
+		for filename in sorted(channel_files):
+			existed = filename.replace(".channel","") in cache
+
+			channel = self.discovery.reload_channel(filename)
+			if channel == None:
+				continue
+
+			if channel in cache:
+				events.append(ChangeEvent(ChangeType.CHANGED if existed else ChangeType.ADDED, channel))
+			elif existed:
+				events.append(ChangeEvent(ChangeType.REMOVED, channel))
+
+		if sources_changed or lists_changed:
+			self.discovery.rescan(refresh_sources=sources_changed)
+
+		enabled_after = set(self.discovery.channels)
+
+		for channel in sorted(enabled_after - enabled_before):
+			events.append(ChangeEvent(ChangeType.ENABLED, channel))
+
+		for channel in sorted(enabled_before - enabled_after):
+			if channel in cache:
+				events.append(ChangeEvent(ChangeType.DISABLED, channel))
+
+		return events
@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+#
+# libchannels - update channels management library
+# Copyright (C) 2015 Eugenio "g7" Paolantonio
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+#
+
+import os
+import logging
+import tempfile
+
+import libchannels.common
+import libchannels.metrics
+
+logger = logging.getLogger(__name__)
+
+class SourcesWriter:
+
+	"""
+	The SourcesWriter() class writes the sources files that have been
+	changed by libchannels, and only them.
+
+	Unlike SourcesList.save(), which rewrites every file it knows about,
+	files have to be explicitly marked as dirty. Every file is written to
+	a temporary file first, which is then synced and renamed over the
+	original one.
+	"""
+
+	def __init__(self):
+		"""
+		Initializes the class.
+		"""
+
+		self.dirty = set()
+
+	def mark_dirty(self, *paths):
+		"""
+		Marks the given files as dirty.
+		"""
+
+		self.dirty.update(path for path in paths if path)
+
+	def mark_entry_dirty(self, entry):
+		"""
+		Marks the file of the given SourceEntry as dirty.
+		"""
+
+		self.mark_dirty(entry.file)
+
+	@staticmethod
+	def write_file(path, content):
+		"""
+		Atomically replaces the given file with content.
+		"""
+
+		directory = os.path.dirname(path)
+
+		try:
+			mode = os.stat(path).st_mode & 0o7777
+		except FileNotFoundError:
+			mode = 0o644
+
+		# The "~" suffix is silently ignored by APT, should it
+		# find the temporary file
+		fd, temp = tempfile.mkstemp(
+			prefix=".%s." % os.path.basename(path),
+			suffix="~",
+			dir=directory
+		)
+
+		try:
+			with os.fdopen(fd, "w") as f:
+				f.write(content)
+				f.flush()
+				os.fchmod(f.fileno(), mode)
+				os.fsync(f.fileno())
+
+			os.rename(temp, path)
+		except:
+			os.remove(temp)
+			raise
+
+		# Ensure the rename hits the disk too
+		try:
+			directory_fd = os.open(directory, os.O_RDONLY)
+			try:
+				os.fsync(directory_fd)
+			finally:
+				os.close(directory_fd)
+		except OSError:
+			pass
+
+	@libchannels.metrics.timed("sources.save")
+	def save(self):
+		"""
+		Writes every dirty file, and returns the number of files written.
+		"""
+
+		if not self.dirty:
+			return 0
+
+		contents = {path : [] for path in self.dirty}
+		for entry in libchannels.common.sourceslist:
+			if entry.file in contents:
+				contents[entry.file].append(entry.str())
+
+		written = 0
+		for path in sorted(contents):
+			if contents[path] or os.path.exists(path):
+				logger.debug("Writing %s" % path)
+				self.write_file(path, "".join(contents[path]))
+				written += 1
+
+			self.dirty.discard(path)
+
+		libchannels.metrics.count("sources.files_written", written)
+
+		return written
+
+# The shared writer
+writer = SourcesWriter()
@@ -1,31 +1,85 @@
 #!/usr/bin/python3
 # -*- coding: utf-8 -*-
 
-import libchannels.discovery
-import libchannels.resolver
-import libchannels.actions
+import libchannels.daemon
 
 import sys
+import signal
+import logging
 
-if len(sys.argv) < 3:
-	print("You should specify the action and the channel to execute the action on!")
+# Channel progress is logged
+logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+USAGE = """Usage:
+	%(name)s enable|disable <channel>
+	%(name)s blockers|solution <channel> [enable|disable]
+	%(name)s status [channel]
+	%(name)s daemon""" % {"name" : sys.argv[0]}
+
+if len(sys.argv) < 2:
+	print(USAGE)
 	sys.exit(1)
 
-action = libchannels.actions.ActionType.DISABLE if sys.argv[1] == "disable" else libchannels.actions.ActionType.ENABLE
-channel = sys.argv[2]
+command = sys.argv[1]
 
-# Discovery
-discovery = libchannels.discovery.ChannelDiscovery()
-discovery.discover()
+if command == "daemon":
+	daemon = libchannels.daemon.Daemon()
 
-# Resolver
-resolver = libchannels.resolver.DependencyResolver(discovery.cache)
+	# Clean up the socket on termination
+	signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
 
-# Actions
-actions = libchannels.actions.Actions(discovery, resolver)
+	try:
+		daemon.run()
+	except KeyboardInterrupt:
+		pass
 
-#print(action)
-if action == libchannels.actions.ActionType.DISABLE:
-	actions.disable_channel(channel)
+	sys.exit(0)
+elif command == "status":
+	method = "status"
+	params = {"channel" : sys.argv[2]} if len(sys.argv) > 2 else {}
+elif len(sys.argv) < 3:
+	print("You should specify the action and the channel to execute the action on!")
+	sys.exit(1)
+elif command in ("blockers", "solution"):
+	method = command
+	params = {
+		"channel" : sys.argv[2],
+		"action" : sys.argv[3] if len(sys.argv) > 3 else "enable"
+	}
 else:
-	actions.enable_channel(channel)
+	method = "apply"
+	params = {
+		"channel" : sys.argv[2],
+		"action" : "disable" if command == "disable" else "enable"
+	}
+
+# Ask the daemon, if it's running. Otherwise, do everything here.
+client = libchannels.daemon.Client.connect()
+if client == None:
+	client = libchannels.daemon.Daemon()
+	client.load()
+
+try:
+	result = client.call(method, **params)
+except libchannels.daemon.DaemonError as e:
+	print(e)
+	sys.exit(1)
+
+if method == "status":
+	for channel, status in result.items():
+		print(
+			"%s: %s%s" % (
+				channel,
+				"enabled" if status["enabled"] else "disabled",
+				"" if status["enabled"] or status["enableable"] else " (not enableable)"
+			)
+		)
+elif method == "blockers":
+	for blocker in result:
+		print("%s %s" % (blocker["relation"], blocker["target"]))
+elif method == "solution":
+	if result == None:
+		print("No solution")
+	else:
+		for channel, action in result:
+			print("%s %s" % (action, channel))
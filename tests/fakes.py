@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+#
+# Minimal stand-ins for apt_pkg and aptsources, so that the sources
+# handling can be tested without touching the system configuration.
+#
+
+import sys
+import types
+
+from unittest import mock
+
+import libchannels.common
+import libchannels.channel
+
+class SourceEntry:
+
+	"""
+	A minimal aptsources.sourceslist.SourceEntry.
+	"""
+
+	def __init__(self, type, uri, dist, comps, disabled=False, file=None):
+		"""
+		Initializes the class.
+		"""
+
+		self.type = type
+		self.uri = uri
+		self.dist = dist
+		self.comps = list(comps)
+		self.disabled = disabled
+		self.invalid = False
+		self.file = file
+		self.architectures = []
+		self.line = self.str().strip()
+
+	def set_enabled(self, new_value):
+		"""
+		Enables or disables the entry.
+		"""
+
+		self.disabled = not new_value
+
+	def str(self):
+		"""
+		Returns the entry as a sources.list line.
+		"""
+
+		return "%s%s %s %s %s\n" % (
+			"# " if self.disabled else "",
+			self.type,
+			self.uri,
+			self.dist,
+			" ".join(self.comps)
+		)
+
+class SourcesList:
+
+	"""
+	A minimal aptsources.sourceslist.SourcesList. add() follows the
+	aptsources semantics: matching entries are reused and changed in
+	place.
+	"""
+
+	def __init__(self, entries=()):
+		"""
+		Initializes the class.
+		"""
+
+		self.list = list(entries)
+
+	def __iter__(self):
+		"""
+		Iterates over the entries.
+		"""
+
+		return iter(self.list)
+
+	def refresh(self):
+		"""
+		Does nothing.
+		"""
+
+		pass
+
+	def add(self, type, uri, dist, orig_comps, comment="", pos=-1, file=None, architectures=[]):
+		"""
+		Adds an entry, or reuses (and changes) a matching one.
+		"""
+
+		comps = list(orig_comps)
+
+		for source in self.list:
+			if source.type == type and source.uri == uri and source.dist == dist:
+				if not source.disabled:
+					source.comps = source.comps + [comp for comp in comps if not comp in source.comps]
+					return source
+				elif set(source.comps) == set(comps):
+					source.disabled = False
+					return source
+
+		entry = SourceEntry(type, uri, dist, comps, file=file)
+		self.list.append(entry)
+
+		return entry
+
+def install(test, entries=(), sourceparts="/nonexistent/sources.list.d/"):
+	"""
+	Installs the fake modules and a fake SourcesList with the given
+	entries for the duration of the given TestCase, and returns the
+	SourcesList.
+	"""
+
+	apt_pkg = types.ModuleType("apt_pkg")
+	apt_pkg.config = mock.Mock()
+	apt_pkg.config.find_dir.return_value = sourceparts
+
+	aptsources = types.ModuleType("aptsources")
+	aptsources.sourceslist = types.ModuleType("aptsources.sourceslist")
+	aptsources.sourceslist.SourceEntry = SourceEntry
+	aptsources.sourceslist.SourcesList = SourcesList
+
+	patcher = mock.patch.dict(
+		sys.modules,
+		{
+			"apt_pkg" : apt_pkg,
+			"aptsources" : aptsources,
+			"aptsources.sourceslist" : aptsources.sourceslist,
+		}
+	)
+	patcher.start()
+	test.addCleanup(patcher.stop)
+
+	sourceslist = SourcesList(entries)
+
+	previous = libchannels.common._sourceslist
+	libchannels.common._sourceslist = libchannels.common.sourceslist = sourceslist
+
+	def restore():
+		libchannels.common._sourceslist = previous
+		if previous == None:
+			del libchannels.common.sourceslist
+		else:
+			libchannels.common.sourceslist = previous
+
+	test.addCleanup(restore)
+
+	libchannels.channel.invalidate()
+
+	return sourceslist
+
+def get_channel(name, repositories, depends=(), conflicts=(), provides=()):
+	"""
+	Returns a Channel with the given repositories, a dictionary of
+	repository name -> (mirror, codename, components).
+	"""
+
+	sections = {
+		"channel" : {
+			"name" : name,
+			"depends" : " ".join(depends),
+			"conflicts" : " ".join(conflicts),
+			"provides" : " ".join(provides),
+		}
+	}
+
+	for repository, (mirror, codename, components) in repositories.items():
+		sections[repository] = {
+			"default_mirror" : mirror,
+			"origin" : "Test",
+			"codename" : codename,
+			"components" : components,
+		}
+
+	return libchannels.channel.Channel(name, sections=sections)
@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+
+import sys
+import types
+import asyncio
+import threading
+import unittest
+
+from unittest import mock
+
+import libchannels.aio
+
+class OpProgress:
+
+	"""
+	A minimal apt.progress.base.OpProgress.
+	"""
+
+	def __init__(self):
+		"""
+		Initializes the class.
+		"""
+
+		self.op = ""
+		self.percent = 0.0
+
+	def update(self, percent=None):
+		self.percent = percent
+
+class AcquireProgress:
+
+	"""
+	A minimal apt.progress.base.AcquireProgress.
+	"""
+
+	def __init__(self):
+		"""
+		Initializes the class.
+		"""
+
+		self.current_bytes = self.total_bytes = 0
+		self.current_items = self.total_items = 0
+		self.current_cps = 0
+
+class InstallProgress:
+
+	"""
+	A minimal apt.progress.base.InstallProgress.
+	"""
+
+	pass
+
+class FetchFailedException(Exception):
+
+	"""
+	The apt.cache.FetchFailedException.
+	"""
+
+	pass
+
+class Updates:
+
+	"""
+	A minimal Updates(), whose update() downloads 5 items, and whose
+	fetch() blocks until released.
+	"""
+
+	cache_progress = None
+	cache_acquire_progress = None
+	packages_acquire_progress = None
+	packages_install_progress = None
+	packages_install_failure_callback = None
+	packages_batch_callback = None
+	generic_failure_callback = None
+
+	def __init__(self):
+		"""
+		Initializes the class.
+		"""
+
+		self.started = threading.Event()
+		self.release = threading.Event()
+
+		self.calls = []
+
+	def update(self):
+		self.calls.append("update")
+
+		progress = self.cache_acquire_progress
+		progress.total_items = 5
+
+		for item in range(5):
+			progress.current_items = item
+			if not progress.pulse(None):
+				# What apt.Cache.update() does
+				raise FetchFailedException("Cancelled")
+
+			self.started.set()
+			self.release.wait()
+
+		return True
+
+	def fetch(self):
+		self.calls.append("fetch")
+
+		self.started.set()
+		self.release.wait()
+
+		return True
+
+	def install(self, pipelined, batch_size):
+		raise SystemError("E:Sub-process /usr/bin/dpkg returned an error code (1)")
+
+class AsyncUpdatesTest(unittest.IsolatedAsyncioTestCase):
+
+	"""
+	Tests the cancellation of the Operations of AsyncUpdates.
+	"""
+
+	def setUp(self):
+		base = types.ModuleType("apt.progress.base")
+		base.OpProgress = OpProgress
+		base.AcquireProgress = AcquireProgress
+		base.InstallProgress = InstallProgress
+
+		progress = types.ModuleType("apt.progress")
+		progress.base = base
+
+		apt = types.ModuleType("apt")
+		apt.progress = progress
+
+		patcher = mock.patch.dict(sys.modules, {"apt" : apt, "apt.progress" : progress, "apt.progress.base" : base})
+		patcher.start()
+		self.addCleanup(patcher.stop)
+
+		# The progress classes are built on the fake apt
+		libchannels.aio._progress_classes = None
+		self.addCleanup(setattr, libchannels.aio, "_progress_classes", None)
+
+		self.updates = Updates()
+		self.async_updates = libchannels.aio.AsyncUpdates(self.updates)
+		self.addCleanup(self.async_updates.shutdown)
+
+	async def started(self):
+		await asyncio.get_running_loop().run_in_executor(None, self.updates.started.wait)
+
+	async def get_events(self, operation):
+		return [event.kind async for event in operation]
+
+	async def test_done(self):
+		self.updates.release.set()
+
+		operation = self.async_updates.update()
+
+		self.assertEqual((await self.get_events(operation))[-1], "done")
+		self.assertTrue(await operation)
+
+	async def test_running_operation_is_not_lost(self):
+		operation = self.async_updates.fetch()
+		await self.started()
+
+		# fetch() has no cancellation point left: it goes on
+		operation.cancel()
+		self.updates.release.set()
+
+		self.assertEqual((await self.get_events(operation))[-1], "done")
+		self.assertTrue(await operation)
+
+	async def test_queued_operation_is_not_started(self):
+		running = self.async_updates.fetch()
+		queued = self.async_updates.update()
+
+		await self.started()
+		queued.cancel()
+		self.updates.release.set()
+
+		self.assertTrue(await running)
+		self.assertEqual(await self.get_events(queued), ["cancelled"])
+		self.assertEqual(self.updates.calls, ["fetch"])
+
+		with self.assertRaises(asyncio.CancelledError):
+			await queued
+
+	async def test_stopped_download(self):
+		operation = self.async_updates.update()
+		await self.started()
+
+		# The next pulse stops the download, update() raises
+		operation.cancel()
+		self.updates.release.set()
+
+		self.assertEqual((await self.get_events(operation))[-1], "cancelled")
+
+		with self.assertRaises(asyncio.CancelledError):
+			await operation
+
+	async def test_failed(self):
+		operation = self.async_updates.install()
+
+		events = [event async for event in operation]
+
+		self.assertEqual(events[-1].kind, "failed")
+		self.assertIsInstance(events[-1].data, SystemError)
+
+		with self.assertRaises(SystemError):
+			await operation
+
+if __name__ == "__main__":
+	unittest.main()
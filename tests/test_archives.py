@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+
+import os
+import hashlib
+import tempfile
+import unittest
+
+from unittest import mock
+
+import libchannels.archives
+
+from libchannels.archives import ArchiveIndex
+
+class ArchiveIndexTest(unittest.TestCase):
+
+	"""
+	Tests libchannels.archives.ArchiveIndex.
+	"""
+
+	def setUp(self):
+		directory = tempfile.TemporaryDirectory()
+		self.addCleanup(directory.cleanup)
+
+		self.directory = directory.name
+		self.path = os.path.join(self.directory, "archives.json")
+
+	def add_archive(self, name, content):
+		"""
+		Writes an archive, and returns its path and its expected hash.
+		"""
+
+		path = os.path.join(self.directory, name)
+		with open(path, "wb") as f:
+			f.write(content)
+
+		return path, "SHA256:%s" % hashlib.sha256(content).hexdigest()
+
+	def test_verify(self):
+		good, good_hash = self.add_archive("good.deb", b"good")
+		bad, bad_hash = self.add_archive("bad.deb", b"bad")
+
+		index = ArchiveIndex(self.path, workers=2)
+
+		removed = index.verify({
+			good : good_hash,
+			bad : "SHA256:%s" % hashlib.sha256(b"expected").hexdigest(),
+			os.path.join(self.directory, "missing.deb") : good_hash,
+		})
+
+		self.assertEqual(removed, [bad])
+		self.assertFalse(os.path.exists(bad))
+		self.assertEqual(list(index.entries), [good])
+
+	def test_verified_archives_are_kept(self):
+		good, good_hash = self.add_archive("good.deb", b"good")
+
+		index = ArchiveIndex(self.path)
+		index.verify({good : good_hash})
+		index.save()
+
+		# Loaded again, the archive isn't hashed anymore
+		index = ArchiveIndex(self.path)
+		self.assertTrue(index.is_verified(good, os.stat(good), good_hash))
+
+		# Unless it changes
+		with open(good, "ab") as f:
+			f.write(b"changed")
+
+		self.assertFalse(index.is_verified(good, os.stat(good), good_hash))
+		self.assertEqual(index.verify({good : good_hash}), [good])
+
+	def test_unchanged_archives_are_not_hashed(self):
+		good, good_hash = self.add_archive("good.deb", b"good")
+		other, other_hash = self.add_archive("other.deb", b"other")
+
+		index = ArchiveIndex(self.path)
+		index.verify({good : good_hash})
+
+		# Verified by another process
+		index.add(other, other_hash)
+		index.save()
+
+		index = ArchiveIndex(self.path)
+		with mock.patch.object(libchannels.archives, "get_file_hash") as get_file_hash:
+			self.assertEqual(index.verify({good : good_hash, other : other_hash}), [])
+
+		get_file_hash.assert_not_called()
+
+	def test_unknown_hash_types(self):
+		archive, archive_hash = self.add_archive("archive.deb", b"archive")
+
+		index = ArchiveIndex(self.path)
+
+		# Left to APT
+		self.assertEqual(index.verify({archive : "SHA3:0"}), [])
+		self.assertTrue(os.path.exists(archive))
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+
+from libchannels.changes import Change, ChangeTable
+
+CHANGES = [
+	Change(3, "libfoo", "1.1", "upgrade", True, 2048),
+	Change(1, "bar", "2.0", "install", True, 512),
+	Change(2, "baz:i386", "0.9", "keep", False, 4096),
+]
+
+class ChangeTableTest(unittest.TestCase):
+
+	"""
+	Tests libchannels.changes.ChangeTable.
+	"""
+
+	def test_rows(self):
+		table = ChangeTable(CHANGES)
+
+		self.assertEqual(len(table), 3)
+		self.assertEqual(list(table), CHANGES)
+		self.assertEqual(table.get_row(2), 2)
+		self.assertEqual(table.get_row(4), None)
+
+	def test_sort(self):
+		table = ChangeTable(CHANGES)
+
+		table.sort("name")
+		self.assertEqual(table.get_column("name"), ["bar", "baz:i386", "libfoo"])
+
+		table.sort("size", reverse=True)
+		self.assertEqual(table.get_column("id"), [2, 3, 1])
+		self.assertEqual(list(table), sorted(CHANGES, key=lambda change: change.size, reverse=True))
+
+	def test_set_status(self):
+		table = ChangeTable(CHANGES)
+
+		table.set_status(3, False)
+
+		self.assertEqual(table.get_column("status"), [False, True, False])
+		self.assertEqual(table[0], CHANGES[0]._replace(status=False))
+
+	def test_page(self):
+		table = ChangeTable(CHANGES)
+
+		self.assertEqual(table.page(1, 5), CHANGES[1:])
+		self.assertEqual(table.page(3, 5), [])
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+
+import libchannels.channel
+
+from tests import fakes
+
+class ChannelTest(unittest.TestCase):
+
+	"""
+	Tests the cached enabled state of libchannels.channel.Channel.
+	"""
+
+	def setUp(self):
+		fakes.install(self)
+
+		self.channel = fakes.get_channel("base", {"main" : ("http://mirror/", "stable", "main")})
+		self.entry = fakes.SourceEntry("deb", "http://mirror/", "stable", ["main"])
+
+	def test_assign(self):
+		self.assertFalse(self.channel.enabled)
+
+		self.channel.assign("main", self.entry)
+
+		self.assertTrue(self.channel.enabled)
+
+	def test_invalidate(self):
+		self.channel.assign("main", self.entry)
+		self.assertTrue(self.channel.enabled)
+
+		# Changed outside of the Channel methods: cached until invalidated
+		self.entry.set_enabled(False)
+		self.assertTrue(self.channel.enabled)
+
+		libchannels.channel.invalidate()
+		self.assertFalse(self.channel.enabled)
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import socket
+import tempfile
+import threading
+import unittest
+
+from unittest import mock
+
+import libchannels.daemon
+import libchannels.resolver
+
+from tests import fakes
+
+class DaemonTest(unittest.TestCase):
+
+	"""
+	Tests that a Daemon() gives the same results and errors through the
+	socket and in-process (as manager.py does when no daemon is
+	running).
+	"""
+
+	def setUp(self):
+		fakes.install(self)
+		sys.modules["apt_pkg"].config.find_file.return_value = "/nonexistent/sources.list"
+
+		channels = [
+			# Depending on each other
+			fakes.get_channel("first", {"main" : ("http://mirror/", "first", "main")}, depends=["second"]),
+			fakes.get_channel("second", {"main" : ("http://mirror/", "second", "main")}, depends=["first"]),
+			fakes.get_channel("base", {"main" : ("http://mirror/", "base", "main")}),
+			fakes.get_channel("extra", {"main" : ("http://mirror/", "extra", "main")}, depends=["base"]),
+			fakes.get_channel("other", {"main" : ("http://mirror/", "other", "main")}, conflicts=["base"]),
+		]
+
+		self.daemon = libchannels.daemon.Daemon(use_inotify=False)
+		self.daemon.discovery.cache = {channel.channel_name : channel for channel in channels}
+		self.daemon.resolver = libchannels.resolver.DependencyResolver(self.daemon.discovery.cache)
+
+		self.client = self.connect()
+
+	def connect(self):
+		"""
+		Returns a Client() connected to the daemon through a socket pair.
+		"""
+
+		client_socket, daemon_socket = socket.socketpair()
+
+		def serve():
+			with daemon_socket, daemon_socket.makefile("rwb") as file:
+				for line in file:
+					file.write(self.daemon.handle(line))
+					file.flush()
+
+		thread = threading.Thread(target=serve)
+		thread.start()
+
+		client = libchannels.daemon.Client.__new__(libchannels.daemon.Client)
+		client.socket = client_socket
+		client.file = client_socket.makefile("rwb")
+		client.next_id = 0
+
+		self.addCleanup(thread.join)
+		self.addCleanup(client.close)
+
+		return client
+
+	def assertSameOutcome(self, method, **params):
+		outcomes = []
+		for client in (self.client, self.daemon):
+			try:
+				outcomes.append(("result", client.call(method, **params)))
+			except libchannels.daemon.DaemonError as e:
+				outcomes.append(("error", str(e)))
+
+		self.assertEqual(outcomes[0], outcomes[1])
+
+		return outcomes[0]
+
+	def test_results(self):
+		self.assertEqual(self.assertSameOutcome("solution", channel="extra"), ("result", [["base", "enable"], ["extra", "enable"]]))
+		self.assertEqual(self.assertSameOutcome("blockers", channel="other", action="enable"), ("result", []))
+
+		self.assertSameOutcome("status")
+		self.assertSameOutcome("status", channel="base")
+
+	def test_invalid_requests(self):
+		self.assertEqual(self.assertSameOutcome("solution", channel="missing"), ("error", "Unknown channel: missing"))
+		self.assertEqual(self.assertSameOutcome("solution", channel="base", action="toggle"), ("error", "Unknown action: toggle"))
+
+		self.assertSameOutcome("unknown")
+		self.assertSameOutcome("solution", name="base")
+
+	def test_dependency_cycle(self):
+		kind, error = self.assertSameOutcome("solution", channel="first")
+
+		self.assertEqual(kind, "error")
+		self.assertTrue(error.startswith("Dependency cycle detected"))
+
+	def test_missing_channel(self):
+		# base disappears, and extra keeps its previous relations
+		del self.daemon.discovery.cache["base"]
+		self.daemon.resolver.refresh(["base"])
+
+		self.assertEqual(self.assertSameOutcome("solution", channel="extra"), ("error", "Missing channel: base"))
+
+	def test_already_running(self):
+		directory = tempfile.TemporaryDirectory()
+		self.addCleanup(directory.cleanup)
+
+		path = os.path.join(directory.name, "daemon.socket")
+
+		with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as server:
+			server.bind(path)
+			server.listen()
+
+			daemon = libchannels.daemon.Daemon(path, use_inotify=False)
+			daemon.resolver = self.daemon.resolver
+			daemon.watcher = mock.Mock()
+
+			clients = []
+			connect = libchannels.daemon.Client.connect
+
+			def probe(*args, **kwargs):
+				clients.append(connect(*args, **kwargs))
+				return clients[-1]
+
+			with mock.patch.object(libchannels.daemon.Client, "connect", side_effect=probe):
+				with self.assertRaisesRegex(libchannels.daemon.DaemonError, "already listening"):
+					daemon.start()
+
+		# The probe connection has been closed
+		self.assertEqual(clients[0].socket.fileno(), -1)
+		self.assertTrue(os.path.exists(path))
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+
+import os
+import tempfile
+import unittest
+
+from unittest import mock
+
+import libchannels.config
+import libchannels.release
+
+from libchannels.discovery import ChannelDiscovery
+
+from benchmarks.generate import Generator, get_mirror
+
+from tests import fakes
+
+class ParallelDiscoveryTest(unittest.TestCase):
+
+	"""
+	Tests that the parallel ChannelDiscovery finds the same channels as
+	the serial one, on a benchmarks.generate tree.
+	"""
+
+	def setUp(self):
+		directory = tempfile.TemporaryDirectory()
+		self.addCleanup(directory.cleanup)
+
+		self.generator = Generator(channels=60, seed=3)
+		self.generator.write(directory.name)
+
+		for name, value in (
+			("CHANNEL_SEARCH_PATH", os.path.join(directory.name, "channels.d")),
+			("APT_LISTS_PATH", os.path.join(directory.name, "lists")),
+		):
+			patcher = mock.patch.object(libchannels.config, name, value)
+			patcher.start()
+			self.addCleanup(patcher.stop)
+
+		# The sources written by the generator
+		entries = [fakes.SourceEntry("deb", "http://unrelated.example/debian", "stable", ["main"])]
+		for index in sorted(self.generator.enabled):
+			for repository, codename, proposed in self.generator.repositories[index]:
+				entries.append(
+					fakes.SourceEntry("deb", get_mirror(index), codename, ["main", "contrib"], disabled=proposed)
+				)
+
+		self.sourceslist = fakes.install(self, entries)
+
+		for attribute in ("cache", "channels"):
+			patcher = mock.patch.dict(getattr(ChannelDiscovery, attribute), clear=True)
+			patcher.start()
+			self.addCleanup(patcher.stop)
+
+		patcher = mock.patch.dict(libchannels.release._cache, clear=True)
+		patcher.start()
+		self.addCleanup(patcher.stop)
+
+	def discover(self, workers):
+		"""
+		Runs a discovery with the given workers, and returns what has been
+		found.
+		"""
+
+		ChannelDiscovery.cache.clear()
+		ChannelDiscovery.channels.clear()
+		libchannels.release._cache.clear()
+
+		discovery = ChannelDiscovery(use_index=False, workers=workers)
+		discovery.discover()
+
+		return {
+			"cache" : [
+				(
+					channel,
+					type(obj).__name__,
+					None if channel.endswith(".provider") else (
+						obj.enabled,
+						{
+							repository : self.sourceslist.list.index(entry) if entry != None else None
+							for repository, entry in obj.repositories.items()
+						}
+					)
+				)
+				for channel, obj in discovery.cache.items()
+			],
+			"channels" : sorted(discovery.channels),
+			"sources_info" : [info[:4] for info in discovery.sources_info],
+		}
+
+	def test_same_results(self):
+		serial = self.discover(0)
+		parallel = self.discover(4)
+
+		self.assertEqual(parallel, serial)
+
+		# Sanity check of the tree itself
+		self.assertEqual(
+			serial["channels"],
+			sorted("channel-%05d" % index for index in self.generator.enabled)
+		)
+
+if __name__ == "__main__":
+	unittest.main()
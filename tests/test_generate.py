@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+
+from benchmarks.generate import Generator
+
+class GeneratorTest(unittest.TestCase):
+
+	"""
+	Tests the synthetic channel tree of benchmarks.generate.
+	"""
+
+	def test_seeds(self):
+		# Every previous channel is a dependency in some of these
+		for seed in (42, 199, 221):
+			generator = Generator(channels=50, seed=seed)
+
+			for index in range(50):
+				self.assertFalse(set(generator.conflicts[index]) & set(generator.depends[index]))
+				self.assertTrue(all(other < index for other in generator.depends[index]))
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+
+import os
+import tempfile
+import unittest
+
+from unittest import mock
+
+from libchannels.index import ChannelIndex
+
+DEFINITION = """[channel]
+name = %s
+depends = base
+"""
+
+class ChannelIndexTest(unittest.TestCase):
+
+	"""
+	Tests libchannels.index.ChannelIndex.
+	"""
+
+	def setUp(self):
+		directory = tempfile.TemporaryDirectory()
+		self.addCleanup(directory.cleanup)
+
+		self.directory = directory.name
+		self.path = os.path.join(self.directory, "channels.index")
+
+		self.definition = os.path.join(self.directory, "test.channel")
+		self.write("test")
+
+	def write(self, name):
+		with open(self.definition, "w") as f:
+			f.write(DEFINITION % name)
+
+	def get_index(self):
+		index = ChannelIndex(self.path)
+		index.load()
+
+		return index
+
+	def test_compiled_once(self):
+		index = self.get_index()
+		sections = index.get(self.definition)
+		index.save()
+
+		self.assertEqual(sections["channel"]["name"], "test")
+
+		# Loaded again, the definition isn't parsed anymore
+		index = self.get_index()
+		with mock.patch.object(ChannelIndex, "compile", side_effect=AssertionError):
+			self.assertEqual(index.get(self.definition), sections)
+
+		self.assertFalse(index.dirty)
+
+	def test_changed_definition(self):
+		index = self.get_index()
+		index.get(self.definition)
+		index.save()
+
+		self.write("changed")
+
+		index = self.get_index()
+		self.assertEqual(index.get(self.definition)["channel"]["name"], "changed")
+		self.assertTrue(index.dirty)
+
+	def test_prune(self):
+		index = self.get_index()
+		index.get(self.definition)
+		index.save()
+
+		index = self.get_index()
+		index.prune([])
+
+		self.assertEqual(index.entries, {})
+		self.assertTrue(index.dirty)
+
+	def test_broken_index(self):
+		with open(self.path, "w") as f:
+			f.write("{")
+
+		self.assertEqual(self.get_index().entries, {})
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+
+from libchannels.matcher import RepositoryMatcher
+
+from tests import fakes
+
+class RepositoryMatcherTest(unittest.TestCase):
+
+	"""
+	Tests libchannels.matcher.RepositoryMatcher.
+	"""
+
+	def setUp(self):
+		fakes.install(self)
+
+		self.base = fakes.get_channel("base", {"main" : ("http://mirror/base/", "stable", "main")})
+		self.extra = fakes.get_channel("extra", {"main" : ("http://mirror/extra/", "stable-extra", "main")})
+
+		self.matcher = RepositoryMatcher({"base" : self.base, "extra" : self.extra})
+
+	def test_match_by_origin(self):
+		entry = fakes.SourceEntry("deb", "http://elsewhere/", "stable", ["main"])
+
+		self.assertEqual(self.matcher.match(entry.uri, "Test", None, "stable", entry), [(self.base, "main")])
+		self.assertIs(self.base.repositories["main"], entry)
+
+	def test_match_by_mirror(self):
+		entry = fakes.SourceEntry("deb", "http://mirror/extra/", "stable-extra", ["main"])
+
+		# Without a Release file, the default mirror is used
+		self.assertEqual(self.matcher.match(entry.uri, None, None, ["stable-extra"], entry), [(self.extra, "main")])
+
+	def test_no_match(self):
+		entry = fakes.SourceEntry("deb", "http://mirror/base/", "unstable", ["main"])
+
+		self.assertEqual(self.matcher.match(entry.uri, "Test", None, "unstable", entry), [])
+		self.assertEqual(self.matcher.match(entry.uri, "Other", None, "stable", entry), [])
+
+	def test_remove_channel(self):
+		entry = fakes.SourceEntry("deb", "http://mirror/base/", "stable", ["main"])
+
+		self.matcher.remove_channel(self.base)
+
+		self.assertEqual(self.matcher.match(entry.uri, "Test", None, "stable", entry), [])
+
+if __name__ == "__main__":
+	unittest.main()
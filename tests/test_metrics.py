@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+
+import os
+import tempfile
+import unittest
+
+import libchannels.metrics
+
+class MetricsTest(unittest.TestCase):
+
+	"""
+	Tests libchannels.metrics and its sinks.
+	"""
+
+	def add_sink(self, sink):
+		libchannels.metrics.add_sink(sink)
+		self.addCleanup(libchannels.metrics.remove_sink, sink)
+
+		return sink
+
+	def test_disabled_without_sinks(self):
+		self.assertFalse(libchannels.metrics.enabled)
+		self.assertIs(libchannels.metrics.span("test"), libchannels.metrics.NULL_SPAN)
+
+	def test_callback_sink(self):
+		calls = []
+		self.add_sink(libchannels.metrics.CallbackSink(lambda *args: calls.append(args)))
+
+		with libchannels.metrics.span("test.span"):
+			pass
+
+		libchannels.metrics.count("test.count", 2)
+		libchannels.metrics.gauge("test.gauge", 5)
+
+		self.assertEqual([(kind, name) for kind, name, value in calls], [
+			("span", "test.span"),
+			("count", "test.count"),
+			("gauge", "test.gauge"),
+		])
+		self.assertEqual(calls[1][2], 2)
+		self.assertEqual(calls[2][2], 5)
+
+	def test_prometheus_sink(self):
+		with tempfile.TemporaryDirectory() as directory:
+			path = os.path.join(directory, "libchannels.prom")
+			sink = self.add_sink(libchannels.metrics.PrometheusSink(path))
+
+			libchannels.metrics.count("test.count")
+			libchannels.metrics.count("test.count")
+			libchannels.metrics.gauge("test.gauge", 1.5)
+			libchannels.metrics.flush()
+
+			with open(path) as f:
+				content = f.read()
+
+			self.assertEqual(os.listdir(directory), ["libchannels.prom"])
+
+		self.assertIn("# TYPE libchannels_test_count_total counter\nlibchannels_test_count_total 2\n", content)
+		self.assertIn("# TYPE libchannels_test_gauge gauge\nlibchannels_test_gauge 1.5\n", content)
+
+		# Still aggregated after the flush
+		self.assertEqual(sink.counters, {"test.count" : 2})
+		self.assertEqual(sink.gauges, {"test.gauge" : 1.5})
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+
+import os
+import json
+import types
+import tempfile
+import subprocess
+import unittest
+
+from unittest import mock
+
+import libchannels.updates
+
+from libchannels.pipeline import PipelinedInstall, PipelineError, PlannedChange
+
+RESULT_COMPLETED = 0
+RESULT_FAILED = 1
+
+class Updates:
+
+	"""
+	A minimal Updates(), recording the calls made by the pipeline.
+	"""
+
+	def __init__(self):
+		"""
+		Initializes the class.
+		"""
+
+		self.calls = []
+		self.failures = []
+
+		self.fetch_options = None
+		self.archive_index = None
+		self.packages_batch_callback = None
+		self.packages_install_failure_callback = self.failures.append
+		self.packages_install_progress = mock.Mock()
+		self.cache = types.SimpleNamespace(dpkg_journal_dirty=False)
+
+	def open_cache(self):
+		self.calls.append("open_cache")
+
+	def clear(self):
+		self.calls.append("clear")
+
+class PipelinedInstallTest(unittest.TestCase):
+
+	"""
+	Tests PipelinedInstall.
+	"""
+
+	def setUp(self):
+		apt_pkg = types.SimpleNamespace(
+			config=types.SimpleNamespace(dump=lambda: ""),
+			PackageManager=types.SimpleNamespace(RESULT_COMPLETED=RESULT_COMPLETED)
+		)
+
+		patcher = mock.patch.object(libchannels.updates, "apt_pkg", apt_pkg)
+		patcher.start()
+		self.addCleanup(patcher.stop)
+
+		self.updates = Updates()
+
+		self.pipeline = PipelinedInstall(self.updates)
+		self.pipeline.batches = [
+			[PlannedChange("a", "install", False, None)],
+			[PlannedChange("b", "install", False, None)],
+		]
+		self.pipeline.download = lambda batch: []
+		self.pipeline.mark = lambda batch: True
+
+	def test_completed(self):
+		self.pipeline.install = lambda batch: RESULT_COMPLETED
+
+		self.assertTrue(self.pipeline.run())
+		self.assertEqual(self.updates.calls, ["clear"])
+
+	def test_install_failure(self):
+		self.pipeline.install = lambda batch: RESULT_FAILED
+
+		with self.assertLogs("libchannels.pipeline", "ERROR"):
+			self.assertFalse(self.pipeline.run())
+
+		self.assertEqual(self.updates.calls, ["open_cache"])
+		self.assertEqual(len(self.updates.failures), 1)
+
+	def test_install_exception(self):
+		def install(batch):
+			raise SystemError("E:Unable to lock the administration directory")
+
+		self.pipeline.install = install
+
+		with self.assertLogs("libchannels.pipeline", "ERROR"):
+			self.assertFalse(self.pipeline.run())
+
+		# Recovered, and reported
+		self.assertEqual(self.updates.calls, ["open_cache"])
+		self.assertIn("Unable to lock", self.updates.failures[0])
+
+class DownloadTest(unittest.TestCase):
+
+	"""
+	Tests PipelinedInstall.download(), which runs a download process.
+	"""
+
+	def download(self, returncode, stdout):
+		pipeline = PipelinedInstall(Updates())
+		pipeline.config = "Dir \"/\";\n"
+
+		process = subprocess.CompletedProcess([], returncode, stdout=stdout)
+		with mock.patch.object(subprocess, "run", return_value=process) as run:
+			self.downloaded = pipeline.download([
+				PlannedChange("a", "install", False, ("http://example.com/a.deb", ["SHA256:00"], 10, "/tmp/a.deb")),
+				PlannedChange("b", "remove", False, None),
+			])
+
+		return json.loads(run.call_args[1]["input"].decode())
+
+	def test_request(self):
+		self.assertEqual(self.download(0, b"{\"failed\": [], \"downloaded\": [\"/tmp/a.deb\"]}"), {
+			"archives" : [["http://example.com/a.deb", ["SHA256:00"], 10, "a", "/tmp/a.deb"]],
+			"config" : "Dir \"/\";\n",
+		})
+		self.assertEqual(self.downloaded, ["/tmp/a.deb"])
+
+	def test_failed_archives(self):
+		with self.assertRaisesRegex(PipelineError, "http://example.com/a.deb"):
+			self.download(0, b"{\"failed\": [\"http://example.com/a.deb\"], \"downloaded\": []}")
+
+	def test_failed_process(self):
+		with self.assertRaises(PipelineError):
+			self.download(1, b"")
+
+class AddDownloadedTest(unittest.TestCase):
+
+	"""
+	Tests PipelinedInstall.add_downloaded().
+	"""
+
+	def test_registered(self):
+		directory = tempfile.TemporaryDirectory()
+		self.addCleanup(directory.cleanup)
+
+		path = os.path.join(directory.name, "a.deb")
+		with open(path, "wb") as f:
+			f.write(b"archive")
+
+		updates = Updates()
+		pipeline = PipelinedInstall(updates)
+		pipeline.add_downloaded([
+			PlannedChange("a", "install", False, ("http://example.com/a.deb", ["MD5Sum:01", "SHA256:00"], 7, path)),
+			PlannedChange("b", "install", False, ("http://example.com/b.deb", ["SHA256:02"], 7, "/missing/b.deb")),
+			PlannedChange("c", "remove", False, None),
+		], [path, "/missing/b.deb"])
+
+		# Verified against the strongest hash, as the install would do
+		self.assertTrue(updates.archive_index.is_verified(path, os.stat(path), "SHA256:00"))
+		self.assertEqual(list(updates.archive_index.entries), [path])
+
+if __name__ == "__main__":
+	unittest.main()
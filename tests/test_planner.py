@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+
+import libchannels.resolver
+
+from libchannels.actions import ActionType
+from libchannels.planner import DependencyCycleError
+
+from tests import fakes
+
+def get_channel(name, enabled=False, **relations):
+	"""
+	Returns a channel with a single repository, enabled if requested.
+	"""
+
+	channel = fakes.get_channel(name, {"main" : ("http://mirror/", name, "main")}, **relations)
+
+	if enabled:
+		channel.assign("main", fakes.SourceEntry("deb", "http://mirror/", name, ["main"]))
+
+	return channel
+
+class PlannerTest(unittest.TestCase):
+
+	"""
+	Tests the solutions computed by libchannels.planner.SolutionPlanner.
+	"""
+
+	def setUp(self):
+		fakes.install(self)
+
+	def get_resolver(self, *channels):
+		return libchannels.resolver.DependencyResolver(
+			{channel.channel_name : channel for channel in channels}
+		)
+
+	def test_dependencies_first(self):
+		resolver = self.get_resolver(
+			get_channel("base"),
+			get_channel("current", depends=["base"]),
+			get_channel("extra", depends=["base", "current"]),
+		)
+
+		self.assertEqual(resolver.get_channel_solution("extra"), [
+			("base", ActionType.ENABLE),
+			("current", ActionType.ENABLE),
+			("extra", ActionType.ENABLE),
+		])
+
+	def test_conflicts_are_disabled(self):
+		resolver = self.get_resolver(
+			get_channel("current", enabled=True),
+			get_channel("other", conflicts=["current"]),
+		)
+
+		self.assertEqual(resolver.get_channel_solution("other"), [
+			("current", ActionType.DISABLE),
+			("other", ActionType.ENABLE),
+		])
+
+	def test_cycle(self):
+		resolver = self.get_resolver(
+			get_channel("first", depends=["second"]),
+			get_channel("second", depends=["first"]),
+		)
+
+		with self.assertRaises(DependencyCycleError) as context:
+			resolver.get_channel_solution("first")
+
+		self.assertEqual(context.exception.cycle, [
+			("first", ActionType.ENABLE),
+			("second", ActionType.ENABLE),
+			("first", ActionType.ENABLE),
+		])
+
+	def test_matrix(self):
+		resolver = self.get_resolver(
+			get_channel("base"),
+			get_channel("current", enabled=True),
+			get_channel("extra", depends=["base"]),
+			get_channel("other", conflicts=["current"]),
+			get_channel("first", depends=["second"]),
+			get_channel("second", depends=["first"]),
+		)
+
+		matrix = resolver.get_channel_matrix()
+
+		# Same as asking every channel alone
+		for channel, statuses in matrix.items():
+			for action, status in statuses.items():
+				blockers = resolver.get_channel_blockers(channel, action)
+
+				self.assertEqual(status.actionable, not blockers)
+				self.assertEqual(
+					[(type(blocker), blocker.get_name()) for blocker in status.blockers],
+					[(type(blocker), blocker.get_name()) for blocker in blockers]
+				)
+
+				try:
+					solution_size = len(resolver.get_channel_solution(channel, action))
+				except DependencyCycleError:
+					solution_size = None
+
+				self.assertEqual(status.solution_size, solution_size, (channel, action))
+
+		self.assertEqual(matrix["first"][ActionType.ENABLE].solution_size, None)
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+
+import os
+import tempfile
+import unittest
+
+from unittest import mock
+
+import libchannels.release
+
+class ParseHeaderTest(unittest.TestCase):
+
+	"""
+	Tests libchannels.release.parse_header().
+	"""
+
+	def parse(self, content):
+		"""
+		Returns the metadata of a Release file with the given content.
+		"""
+
+		with tempfile.TemporaryDirectory() as directory:
+			path = os.path.join(directory, "Release")
+			with open(path, "w") as f:
+				f.write(content)
+
+			return libchannels.release.parse_header(path)
+
+	def test_fields(self):
+		metadata = self.parse(
+			"Origin: Semplice\n"
+			"Label: Semplice Linux\n"
+			"Codename: current\n"
+		)
+
+		self.assertEqual(metadata, ("Semplice", "Semplice Linux", "current"))
+
+	def test_fields_after_multiline_field(self):
+		metadata = self.parse(
+			"Origin: Semplice\n"
+			"Description: first line\n"
+			" continuation\n"
+			"\tanother one\n"
+			"Label: Semplice\n"
+			"Codename: current\n"
+		)
+
+		self.assertEqual(metadata, ("Semplice", "Semplice", "current"))
+
+	def test_stops_at_hashes(self):
+		metadata = self.parse(
+			"Origin: Semplice\n"
+			"SHA256:\n"
+			" 0123 456 main/binary-amd64/Packages\n"
+			"Codename: wrong\n"
+		)
+
+		self.assertEqual(metadata, ("Semplice", None, None))
+
+	def test_stops_at_blank_line(self):
+		metadata = self.parse(
+			"Origin: Semplice\n"
+			"\n"
+			"Codename: wrong\n"
+		)
+
+		self.assertEqual(metadata, ("Semplice", None, None))
+
+	def test_inrelease(self):
+		metadata = self.parse(
+			"-----BEGIN PGP SIGNED MESSAGE-----\n"
+			"Hash: SHA256\n"
+			"\n"
+			"Origin: Semplice\n"
+			"Label: Semplice\n"
+			"Codename: current\n"
+		)
+
+		self.assertEqual(metadata, ("Semplice", "Semplice", "current"))
+
+class ReleaseReaderTest(unittest.TestCase):
+
+	"""
+	Tests the metadata cached by libchannels.release.ReleaseReader.
+	"""
+
+	def setUp(self):
+		directory = tempfile.TemporaryDirectory()
+		self.addCleanup(directory.cleanup)
+
+		self.directory = directory.name
+
+		patcher = mock.patch.dict(libchannels.release._cache, clear=True)
+		patcher.start()
+		self.addCleanup(patcher.stop)
+
+	def write(self, name, origin):
+		path = os.path.join(self.directory, name)
+		with open(path, "w") as f:
+			f.write("Origin: %s\n" % origin)
+
+		return path
+
+	def test_cached(self):
+		path = self.write("mirror_dists_stable_InRelease", "Semplice")
+
+		reader = libchannels.release.ReleaseReader(self.directory)
+		self.assertEqual(reader.get_metadata("mirror_dists_stable_InRelease").origin, "Semplice")
+
+		# Not parsed again while unchanged
+		reader = libchannels.release.ReleaseReader(self.directory)
+		with mock.patch.object(libchannels.release, "parse_header", side_effect=AssertionError):
+			self.assertEqual(reader.get_metadata("mirror_dists_stable_InRelease").origin, "Semplice")
+
+		self.assertEqual(list(libchannels.release._cache), [path])
+
+	def test_removed_files_are_evicted(self):
+		kept = self.write("mirror_dists_stable_InRelease", "Semplice")
+		removed = self.write("mirror_dists_old_InRelease", "Semplice")
+
+		reader = libchannels.release.ReleaseReader(self.directory)
+		reader.get_metadata("mirror_dists_stable_InRelease")
+		reader.get_metadata("mirror_dists_old_InRelease")
+
+		# Another lists directory is left alone
+		libchannels.release._cache["/elsewhere/mirror_dists_stable_InRelease"] = (0, 0, libchannels.release.EMPTY_METADATA)
+
+		os.remove(removed)
+		libchannels.release.ReleaseReader(self.directory)
+
+		self.assertEqual(
+			sorted(libchannels.release._cache),
+			sorted([kept, "/elsewhere/mirror_dists_stable_InRelease"])
+		)
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+
+import libchannels.resolver
+
+from libchannels.actions import ActionType
+from libchannels.provider import ProviderIndex
+
+from tests import fakes
+
+class ResolverTest(unittest.TestCase):
+
+	"""
+	Tests the relations kept by libchannels.resolver.DependencyResolver.
+	"""
+
+	def setUp(self):
+		fakes.install(self)
+
+	def get_resolver(self, *channels):
+		return libchannels.resolver.DependencyResolver(
+			{channel.channel_name : channel for channel in channels}
+		)
+
+	def test_dependents(self):
+		resolver = self.get_resolver(
+			fakes.get_channel("base", {}),
+			fakes.get_channel("current", {}, depends=["base"]),
+			fakes.get_channel("extra", {}, depends=["base", "current"]),
+		)
+
+		self.assertEqual(list(resolver.dependents["base"]), ["current", "extra"])
+		self.assertEqual(list(resolver.dependents["current"]), ["extra"])
+
+	def test_rebuild_drops_old_edges(self):
+		resolver = self.get_resolver(
+			fakes.get_channel("base", {}),
+			fakes.get_channel("current", {}),
+			fakes.get_channel("extra", {}, depends=["base"]),
+		)
+
+		resolver.cache["extra"] = fakes.get_channel("extra", {}, depends=["current"])
+		resolver.build_relations("extra")
+
+		self.assertEqual(list(resolver.dependents["base"]), [])
+		self.assertEqual(list(resolver.dependents["current"]), ["extra"])
+		self.assertEqual(resolver.dependencies["extra"], ["current"])
+
+	def test_disable_blockers(self):
+		base = fakes.get_channel("base", {"main" : ("http://mirror/", "base", "main")})
+		base.assign("main", fakes.SourceEntry("deb", "http://mirror/", "base", ["main"]))
+
+		resolver = self.get_resolver(
+			base,
+			fakes.get_channel("current", {}, depends=["base"]),
+		)
+
+		# current has no repositories, so it's enabled
+		self.assertEqual(
+			[relation.get_name() for relation in resolver.get_channel_blockers("base", ActionType.DISABLE)],
+			["current"]
+		)
+
+	def test_refresh_with_missing_channel(self):
+		resolver = self.get_resolver(
+			fakes.get_channel("base", {}),
+			fakes.get_channel("current", {}, depends=["base"]),
+			fakes.get_channel("extra", {}),
+		)
+
+		relations = resolver.relations["current"]
+
+		del resolver.cache["base"]
+		resolver.cache["current"] = fakes.get_channel("current", {}, depends=["base"])
+		resolver.cache["extra"] = fakes.get_channel("extra", {}, depends=["current"])
+
+		failed = resolver.refresh(["base", "current", "extra"])
+
+		# current can't be built, and keeps its previous relations
+		self.assertEqual(list(failed), ["current"])
+		self.assertIs(resolver.relations["current"], relations)
+
+		# extra is built anyway
+		self.assertEqual([relation.get_name() for relation in resolver.relations["extra"]], ["current"])
+		self.assertEqual(list(resolver.dependents["current"]), ["extra"])
+
+class ProviderIndexTest(unittest.TestCase):
+
+	"""
+	Tests libchannels.provider.ProviderIndex.
+	"""
+
+	def test_replace_and_remove(self):
+		index = ProviderIndex()
+
+		index.add_channel("current", ["base.provider"])
+		index.add_channel("extra", ["base.provider", "other.provider"])
+		index.add_channel("current", ["other.provider"])
+
+		self.assertEqual(list(index.get_channels("base.provider")), ["extra"])
+		self.assertEqual(list(index.get_channels("other.provider")), ["extra", "current"])
+
+		index.remove_channel("extra")
+
+		self.assertEqual(list(index.get_channels("base.provider")), [])
+		self.assertEqual(list(index.get_channels("other.provider")), ["current"])
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,211 @@
+# -*- coding: utf-8 -*-
+
+import types
+import random
+import unittest
+
+from libchannels.actions import ActionType
+from libchannels.solver import ChannelSolver, UnsatisfiableError
+
+from tests import fakes
+
+class SolverTest(unittest.TestCase):
+
+	"""
+	Tests that the plans of libchannels.solver.ChannelSolver are valid.
+	"""
+
+	def setUp(self):
+		fakes.install(self)
+
+	def get_solver(self, *channels):
+		cache = {channel.channel_name : channel for channel in channels}
+
+		return ChannelSolver(types.SimpleNamespace(cache=cache, relations=cache))
+
+	def get_state(self, solver, *channels):
+		return sum(1 << solver.indexes[channel] for channel in channels)
+
+	def assertValid(self, solver, state, goals, plan):
+		"""
+		Checks that applying plan to state gives a consistent state that
+		satisfies the goals, and that every step can be taken when it
+		comes.
+		"""
+
+		enabled = set(solver.get_channels(state))
+
+		self.assertEqual(len(plan), len(set(channel for channel, action in plan)))
+
+		for channel, action in plan:
+			obj = solver.cache[channel]
+
+			if action == ActionType.ENABLE:
+				self.assertNotIn(channel, enabled)
+				for dependency in obj.get_dependencies():
+					if not dependency.endswith(".provider"):
+						self.assertIn(dependency, enabled, "%s enabled before %s" % (channel, dependency))
+
+				enabled.add(channel)
+			else:
+				self.assertIn(channel, enabled)
+				for other in enabled:
+					self.assertNotIn(channel, solver.cache[other].get_dependencies(), "%s disabled before %s" % (channel, other))
+
+				enabled.remove(channel)
+
+		for channel, action in goals:
+			self.assertEqual(channel in enabled, action == ActionType.ENABLE)
+
+		for channel in enabled:
+			obj = solver.cache[channel]
+
+			for dependency in obj.get_dependencies():
+				if dependency.endswith(".provider"):
+					self.assertTrue(any(dependency in solver.cache[other].get_providers() for other in enabled))
+				else:
+					self.assertIn(dependency, enabled)
+
+			for conflict in obj.get_conflicts():
+				self.assertNotIn(conflict, enabled)
+
+	def test_dependencies(self):
+		solver = self.get_solver(
+			fakes.get_channel("base", {}),
+			fakes.get_channel("current", {}, depends=["base"]),
+			fakes.get_channel("extra", {}, depends=["current"]),
+			fakes.get_channel("other", {}, conflicts=["base"]),
+		)
+
+		state = self.get_state(solver, "other")
+		goals = [("extra", ActionType.ENABLE)]
+
+		plan = solver.solve(goals, state)
+
+		self.assertEqual(plan, [
+			("other", ActionType.DISABLE),
+			("base", ActionType.ENABLE),
+			("current", ActionType.ENABLE),
+			("extra", ActionType.ENABLE),
+		])
+		self.assertValid(solver, state, goals, plan)
+
+	def test_disable_dependents_first(self):
+		solver = self.get_solver(
+			fakes.get_channel("base", {}),
+			fakes.get_channel("current", {}, depends=["base"]),
+			fakes.get_channel("extra", {}, depends=["current"]),
+		)
+
+		state = self.get_state(solver, "base", "current", "extra")
+		goals = [("base", ActionType.DISABLE)]
+
+		plan = solver.solve(goals, state)
+
+		self.assertEqual([channel for channel, action in plan], ["extra", "current", "base"])
+		self.assertValid(solver, state, goals, plan)
+
+	def test_provider(self):
+		solver = self.get_solver(
+			fakes.get_channel("first", {}, provides=["desktop.provider"]),
+			fakes.get_channel("second", {}, provides=["desktop.provider"]),
+			fakes.get_channel("extra", {}, depends=["desktop.provider"]),
+		)
+
+		state = self.get_state(solver, "first")
+		goals = [("second", ActionType.ENABLE), ("extra", ActionType.ENABLE)]
+
+		plan = solver.solve(goals, state)
+
+		# Only one channel can provide desktop.provider
+		self.assertIn(("first", ActionType.DISABLE), plan)
+		self.assertValid(solver, state, goals, plan)
+
+	def test_unsatisfiable(self):
+		solver = self.get_solver(
+			fakes.get_channel("base", {}),
+			fakes.get_channel("current", {}, depends=["base"]),
+			fakes.get_channel("other", {}, conflicts=["base"]),
+		)
+
+		with self.assertRaises(UnsatisfiableError) as context:
+			solver.solve([("current", ActionType.ENABLE), ("other", ActionType.ENABLE)], 0)
+
+		# Reported on base or current, depending on the visit order
+		channel, enabled_by, disabled_by = context.exception.conflicts[0]
+
+		self.assertEqual(len(context.exception.conflicts), 1)
+		self.assertEqual({enabled_by, disabled_by}, {("current", ActionType.ENABLE), ("other", ActionType.ENABLE)})
+
+	def test_missing_provider(self):
+		solver = self.get_solver(
+			fakes.get_channel("extra", {}, depends=["desktop.provider"]),
+		)
+
+		with self.assertRaises(UnsatisfiableError) as context:
+			solver.solve([("extra", ActionType.ENABLE)], 0)
+
+		self.assertEqual(context.exception.conflicts, [("desktop.provider", ("extra", ActionType.ENABLE), None)])
+
+	def test_unknown_goals(self):
+		solver = self.get_solver(
+			fakes.get_channel("first", {}, provides=["desktop.provider"]),
+		)
+
+		with self.assertRaisesRegex(ValueError, "Unknown channel: missing"):
+			solver.solve([("missing", ActionType.ENABLE)], 0)
+
+		with self.assertRaisesRegex(ValueError, "desktop.provider is a provider"):
+			solver.solve([("desktop.provider", ActionType.ENABLE)], 0)
+
+	def test_random(self):
+		generator = random.Random(42)
+
+		for graph in range(50):
+			names = ["channel%d" % index for index in range(12)]
+
+			# Dependencies only point backwards, so there are no cycles
+			channels = []
+			for index, name in enumerate(names):
+				channels.append(
+					fakes.get_channel(
+						name,
+						{},
+						depends=generator.sample(names[:index], min(index, generator.randint(0, 2))),
+						conflicts=[other for other in names[index+1:] if generator.random() < 0.05],
+						provides=["desktop.provider"] if index % 5 == 4 else []
+					)
+				)
+
+			solver = self.get_solver(*channels)
+
+			# A consistent starting state
+			state = 0
+			for name in names:
+				try:
+					plan = solver.solve([(name, ActionType.ENABLE)], state)
+				except UnsatisfiableError:
+					continue
+
+				if generator.random() < 0.5:
+					self.assertValid(solver, state, [(name, ActionType.ENABLE)], plan)
+					state = self.get_state(solver, *(
+						set(solver.get_channels(state)) |
+						{channel for channel, action in plan if action == ActionType.ENABLE}
+					) - {channel for channel, action in plan if action == ActionType.DISABLE})
+
+			for attempt in range(10):
+				goals = [
+					(name, generator.choice(list(ActionType)))
+					for name in generator.sample(names, generator.randint(1, 3))
+				]
+
+				try:
+					plan = solver.solve(goals, state)
+				except UnsatisfiableError:
+					continue
+
+				self.assertValid(solver, state, goals, plan)
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+
+import os
+import tempfile
+import unittest
+
+import libchannels.writer
+import libchannels.transaction
+
+from tests import fakes
+
+class TransactionTest(unittest.TestCase):
+
+	"""
+	Tests the journaling and the rollback of libchannels.transaction.
+	"""
+
+	def setUp(self):
+		directory = tempfile.TemporaryDirectory()
+		self.addCleanup(directory.cleanup)
+
+		self.directory = directory.name
+		self.user_list = os.path.join(self.directory, "user.list")
+
+		libchannels.writer.writer.dirty = set()
+		self.addCleanup(setattr, libchannels.writer.writer, "dirty", set())
+
+	def install(self, *entries):
+		return fakes.install(self, entries, sourceparts=self.directory + "/")
+
+	def test_rollback_restores_changed_entry(self):
+		entry = fakes.SourceEntry("deb", "http://mirror/", "current", ["main"], disabled=True, file=self.user_list)
+		self.install(entry)
+
+		channel = fakes.get_channel("current", {"main" : ("http://mirror/", "current", "main")})
+		channel.assign("main", entry)
+
+		with self.assertRaises(RuntimeError):
+			with libchannels.transaction.Transaction():
+				channel.enable()
+				self.assertTrue(channel.enabled)
+
+				raise RuntimeError("abort")
+
+		self.assertTrue(entry.disabled)
+		self.assertFalse(channel.enabled)
+		self.assertEqual(libchannels.writer.writer.dirty, set())
+		self.assertFalse(os.path.exists(self.user_list))
+
+	def test_rollback_removes_added_entry(self):
+		sourceslist = self.install()
+
+		channel = fakes.get_channel("current", {"main" : ("http://mirror/", "current", "main")})
+
+		with self.assertRaises(RuntimeError):
+			with libchannels.transaction.Transaction():
+				channel.enable()
+				self.assertEqual(len(sourceslist.list), 1)
+
+				raise RuntimeError("abort")
+
+		self.assertEqual(sourceslist.list, [])
+		self.assertEqual(channel.repositories["main"], None)
+
+	def test_rollback_keeps_reused_entry(self):
+		# The user already has the mirror, with fewer components: add()
+		# extends that entry instead of adding a new one
+		entry = fakes.SourceEntry("deb", "http://mirror/", "current", ["main"], file=self.user_list)
+		sourceslist = self.install(entry)
+
+		channel = fakes.get_channel("current", {"main" : ("http://mirror/", "current", "main contrib")})
+
+		with self.assertRaises(RuntimeError):
+			with libchannels.transaction.Transaction():
+				channel.enable()
+				self.assertIs(channel.repositories["main"], entry)
+				self.assertEqual(entry.comps, ["main", "contrib"])
+
+				raise RuntimeError("abort")
+
+		self.assertEqual(sourceslist.list, [entry])
+		self.assertEqual(entry.comps, ["main"])
+		self.assertEqual(channel.repositories["main"], None)
+
+	def test_commit_writes_once(self):
+		entry = fakes.SourceEntry("deb", "http://mirror/", "current", ["main"], disabled=True, file=self.user_list)
+		self.install(entry)
+
+		first = fakes.get_channel("first", {"main" : ("http://mirror/", "current", "main")})
+		first.assign("main", entry)
+
+		second = fakes.get_channel("second", {"main" : ("http://other/", "current", "main")})
+
+		with libchannels.transaction.Transaction() as transaction:
+			first.enable()
+			second.enable()
+
+		self.assertEqual(transaction.files_written, 2)
+
+		with open(self.user_list) as f:
+			self.assertEqual(f.read(), "deb http://mirror/ current main\n")
+
+		with open(os.path.join(self.directory, "second.list")) as f:
+			self.assertEqual(f.read(), "deb http://other/ current main\n")
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,296 @@
+# -*- coding: utf-8 -*-
+
+import os
+import types
+import tempfile
+import unittest
+import contextlib
+
+from unittest import mock
+
+import libchannels.updates
+
+from libchannels.changes import PackageRecord
+from libchannels.updates import Updates, FetchOptions
+
+class Package:
+
+	"""
+	A minimal apt_pkg.Package.
+	"""
+
+	def __init__(self, id, name):
+		"""
+		Initializes the class.
+		"""
+
+		self.id = id
+		self.name = name
+
+class DepCache:
+
+	"""
+	A minimal apt_pkg.DepCache, with the markings stored in a
+	dictionary of id -> reason.
+
+	kept is a dictionary of id -> ids kept alongside it, standing for
+	what the APT resolver does through dependencies (e.g. on a virtual
+	package).
+	"""
+
+	def __init__(self):
+		"""
+		Initializes the class.
+		"""
+
+		self.markings = {}
+		self.kept = {}
+		self.broken_count = 0
+
+	def get_marking(self, rawpkg):
+		return self.markings.get(rawpkg.id, "keep")
+
+	def marked_delete(self, rawpkg):
+		return self.get_marking(rawpkg) == "remove"
+
+	def marked_downgrade(self, rawpkg):
+		return self.get_marking(rawpkg) == "downgrade"
+
+	def marked_install(self, rawpkg):
+		return self.get_marking(rawpkg) == "install"
+
+	def marked_upgrade(self, rawpkg):
+		return self.get_marking(rawpkg) == "upgrade"
+
+	def marked_keep(self, rawpkg):
+		return self.get_marking(rawpkg) == "keep"
+
+	def mark_keep(self, rawpkg):
+		for id in [rawpkg.id] + self.kept.get(rawpkg.id, []):
+			self.markings[id] = "keep"
+
+class Cache:
+
+	"""
+	A minimal apt.Cache.
+	"""
+
+	def __init__(self, depcache, packages):
+		"""
+		Initializes the class.
+		"""
+
+		self._depcache = depcache
+		self._cache = {rawpkg.name : rawpkg for rawpkg in packages}
+
+	def __getitem__(self, name):
+		return types.SimpleNamespace(_pkg=self._cache[name], is_auto_installed=False)
+
+	@contextlib.contextmanager
+	def actiongroup(self):
+		yield
+
+	def cache_pre_change(self):
+		pass
+
+	def cache_post_change(self):
+		pass
+
+class ChangeStatusTest(unittest.TestCase):
+
+	"""
+	Tests that Updates.change_status() reports every package whose
+	marking changed.
+	"""
+
+	def setUp(self):
+		# app depends on libfoo-abi, provided by libfoo. helper, kept
+		# already, sits between app and libbar.
+		self.packages = [
+			Package(id, name)
+			for id, name in enumerate(["app", "libfoo", "helper", "libbar", "other"])
+		]
+
+		self.depcache = DepCache()
+		self.depcache.markings = {0 : "upgrade", 1 : "upgrade", 3 : "upgrade", 4 : "upgrade"}
+		self.depcache.kept = {0 : [1, 3]}
+
+		self.updates = Updates.__new__(Updates)
+		self.updates.cache = Cache(self.depcache, self.packages)
+		self.updates.changed_ids = {}
+		self.updates.now_kept = {}
+		self.updates.id_with_packages = {
+			rawpkg.id : PackageRecord(rawpkg.id, rawpkg.name, self.depcache.get_marking(rawpkg))
+			for rawpkg in self.packages
+		}
+
+	def test_keep(self):
+		changes = []
+
+		self.updates.change_status(0, "keep")
+		self.updates.get_user_changes(lambda id, reason: changes.append((id, reason)))
+
+		# libfoo through the virtual package, libbar through helper
+		self.assertEqual(changes, [(0, "keep"), (1, "keep"), (3, "keep")])
+		self.assertEqual(list(self.updates.now_kept), [0, 1, 3])
+
+class FetchTest(unittest.TestCase):
+
+	"""
+	Tests Updates.fetch().
+	"""
+
+	def test_verify_failure(self):
+		errors = []
+
+		updates = Updates.__new__(Updates)
+		updates.cache = Cache(DepCache(), [])
+		updates.fetch_options = None
+		updates.generic_failure_callback = lambda *args: errors.append(args)
+		updates.archive_index = mock.Mock()
+		updates.archive_index.verify.side_effect = PermissionError("Permission denied")
+		updates.get_archives = lambda: {"/var/cache/apt/archives/test.deb" : "SHA256:0"}
+
+		with self.assertLogs("libchannels.updates", "ERROR"):
+			self.assertFalse(updates.fetch())
+
+		self.assertEqual(errors, [("Unable to verify the cached packages", "Permission denied")])
+
+class OpenCacheTest(unittest.TestCase):
+
+	"""
+	Tests the warm cache reused by Updates.open_cache().
+	"""
+
+	def setUp(self):
+		directory = tempfile.TemporaryDirectory()
+		self.addCleanup(directory.cleanup)
+
+		self.status = os.path.join(directory.name, "status")
+		self.lists = os.path.join(directory.name, "lists")
+		os.mkdir(self.lists)
+
+		self.write(self.status, "Package: app\n")
+		self.write(os.path.join(self.lists, "mirror_dists_stable_InRelease"), "Origin: Test\n")
+
+		files = {
+			"Dir::State::status" : self.status,
+			"Dir::Etc::sourcelist" : os.path.join(directory.name, "sources.list"),
+			"Dir::Etc::preferences" : os.path.join(directory.name, "preferences"),
+		}
+		directories = {
+			"Dir::State::lists" : self.lists + "/",
+			"Dir::Etc::sourceparts" : os.path.join(directory.name, "sources.list.d/"),
+			"Dir::Etc::preferencesparts" : os.path.join(directory.name, "preferences.d/"),
+		}
+
+		apt_pkg = types.SimpleNamespace(
+			config=types.SimpleNamespace(find_file=files.get, find_dir=directories.get)
+		)
+		self.apt = types.SimpleNamespace(Cache=mock.Mock())
+
+		for name, value in (("apt_pkg", apt_pkg), ("apt", self.apt)):
+			patcher = mock.patch.object(libchannels.updates, name, value)
+			patcher.start()
+			self.addCleanup(patcher.stop)
+
+		self.updates = Updates.__new__(Updates)
+		self.updates.cache = None
+		self.updates.warm_cache = None
+		self.updates.cache_fingerprint = None
+		self.updates.cache_opened_at = None
+		self.updates.cache_reopens = 0
+		self.updates.cache_progress = None
+
+	def write(self, path, content):
+		with open(path, "w") as f:
+			f.write(content)
+
+	def test_warm_cache_reused(self):
+		self.updates.open_cache()
+		self.updates.clear()
+		self.updates.open_cache()
+
+		cache = self.apt.Cache.return_value
+
+		# Built once, then only cleared
+		self.apt.Cache.assert_called_once()
+		cache.open.assert_not_called()
+		cache.clear.assert_called_once()
+
+		self.assertIs(self.updates.cache, cache)
+		self.assertEqual(self.updates.cache_reopens, 1)
+
+	def test_reopen_on_status_change(self):
+		self.updates.open_cache()
+
+		self.write(self.status, "Package: app\nStatus: install ok installed\n")
+		self.updates.open_cache()
+
+		self.apt.Cache.return_value.open.assert_called_once()
+		self.assertEqual(self.updates.cache_reopens, 2)
+
+		# Fresh again
+		self.updates.open_cache()
+		self.assertEqual(self.updates.cache_reopens, 2)
+
+	def test_reopen_on_lists_change(self):
+		self.updates.open_cache()
+
+		self.write(os.path.join(self.lists, "mirror_dists_testing_InRelease"), "Origin: Test\n")
+		self.updates.open_cache()
+
+		self.assertEqual(self.updates.cache_reopens, 2)
+
+	def test_force(self):
+		self.updates.open_cache()
+		self.updates.open_cache(force=True)
+
+		self.assertEqual(self.updates.cache_reopens, 2)
+
+	def test_cache_age(self):
+		self.assertEqual(self.updates.cache_age, None)
+
+		with mock.patch.object(libchannels.updates.time, "monotonic", return_value=100.0):
+			self.updates.open_cache()
+
+		with mock.patch.object(libchannels.updates.time, "monotonic", return_value=130.0):
+			self.assertEqual(self.updates.cache_age, 30.0)
+
+			# Reusing the warm cache doesn't make it younger
+			self.updates.open_cache()
+			self.assertEqual(self.updates.cache_age, 30.0)
+
+class FetchOptionsTest(unittest.TestCase):
+
+	"""
+	Tests FetchOptions.apply().
+	"""
+
+	def apply(self, options):
+		config = {}
+		apt_pkg = types.SimpleNamespace(config=types.SimpleNamespace(set=config.__setitem__))
+
+		with mock.patch.object(libchannels.updates, "apt_pkg", apt_pkg):
+			options.apply()
+
+		return config
+
+	def test_defaults_are_kept(self):
+		self.assertEqual(self.apply(FetchOptions()), {})
+
+	def test_bandwidth_limit_is_split(self):
+		config = self.apply(FetchOptions(queue_mode="host", max_queues=4, bandwidth_limit=100))
+
+		self.assertEqual(config["Acquire::Queue-Mode"], "host")
+		self.assertEqual(config["Acquire::QueueHost::Limit"], "4")
+		self.assertEqual(config["Acquire::http::Dl-Limit"], "25")
+		self.assertEqual(config["Acquire::https::Dl-Limit"], "25")
+
+	def test_bandwidth_limit_without_max_queues(self):
+		config = self.apply(FetchOptions(bandwidth_limit=100))
+
+		self.assertEqual(config["Acquire::http::Dl-Limit"], "100")
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,248 @@
+# -*- coding: utf-8 -*-
+
+import os
+import tempfile
+import unittest
+
+from unittest import mock
+
+import libchannels.config
+
+from libchannels.watch import ChangeEvent, ChangeType, DiscoveryWatcher, Inotify
+
+from tests import fakes
+
+class Discovery:
+
+	"""
+	A minimal ChannelDiscovery, recording the reloads and the rescans.
+	"""
+
+	def __init__(self, cache, channels):
+		"""
+		Initializes the class.
+		"""
+
+		self.cache = cache
+		self.channels = channels
+		self.matcher = object()
+
+		self.reloaded = []
+		self.rescans = []
+
+		# channel -> enabled, applied by the next reload or rescan
+		self.pending = {}
+
+	def apply(self):
+		for channel, enabled in self.pending.items():
+			if enabled:
+				self.channels[channel] = self.cache[channel]
+			else:
+				self.channels.pop(channel, None)
+
+		self.pending = {}
+
+	def reload_channel(self, filename):
+		channel = filename.replace(".channel","")
+
+		self.reloaded.append(filename)
+
+		if os.path.exists(os.path.join(libchannels.config.CHANNEL_SEARCH_PATH, filename)):
+			self.cache[channel] = object()
+		else:
+			self.cache.pop(channel, None)
+			self.channels.pop(channel, None)
+
+		self.apply()
+
+		return channel
+
+	def rescan(self, refresh_sources=False):
+		self.rescans.append(refresh_sources)
+
+		self.apply()
+
+class WatcherTest(unittest.TestCase):
+
+	"""
+	Base class of the DiscoveryWatcher tests, using temporary channel,
+	sources and lists directories.
+	"""
+
+	def setUp(self):
+		directory = tempfile.TemporaryDirectory()
+		self.addCleanup(directory.cleanup)
+
+		self.etc = directory.name
+		self.channels = os.path.join(directory.name, "channels.d")
+		self.sourceparts = os.path.join(directory.name, "sources.list.d")
+		self.lists = os.path.join(directory.name, "lists")
+
+		for path in (self.channels, self.sourceparts, self.lists):
+			os.mkdir(path)
+
+		for name, value in (("CHANNEL_SEARCH_PATH", self.channels), ("APT_LISTS_PATH", self.lists)):
+			patcher = mock.patch.object(libchannels.config, name, value)
+			patcher.start()
+			self.addCleanup(patcher.stop)
+
+		fakes.install(self, sourceparts=self.sourceparts + "/")
+
+		import apt_pkg
+		apt_pkg.config.find_file.return_value = os.path.join(directory.name, "sources.list")
+
+		self.write(self.channels, "base.channel")
+
+		self.discovery = Discovery({"base" : object()}, {})
+		self.watcher = DiscoveryWatcher(self.discovery, use_inotify=False)
+
+	def write(self, directory, name, content="content"):
+		with open(os.path.join(directory, name), "w") as f:
+			f.write(content)
+
+class ProcessTest(WatcherTest):
+
+	"""
+	Tests DiscoveryWatcher.process().
+	"""
+
+	def test_channel_reload(self):
+		self.write(self.channels, "extra.channel")
+		self.discovery.pending = {"extra" : True}
+
+		events = self.watcher.process({"extra.channel"}, False, False)
+
+		# Only the changed channel is reloaded, without a rescan
+		self.assertEqual(self.discovery.reloaded, ["extra.channel"])
+		self.assertEqual(self.discovery.rescans, [])
+		self.assertEqual(events, [
+			ChangeEvent(ChangeType.ADDED, "extra"),
+			ChangeEvent(ChangeType.ENABLED, "extra"),
+		])
+
+	def test_channel_removal(self):
+		self.discovery.channels["base"] = self.discovery.cache["base"]
+		os.remove(os.path.join(self.channels, "base.channel"))
+
+		events = self.watcher.process({"base.channel"}, False, False)
+
+		# Removed, not disabled
+		self.assertEqual(events, [ChangeEvent(ChangeType.REMOVED, "base")])
+
+	def test_sources_rescan(self):
+		self.discovery.pending = {"base" : True}
+
+		events = self.watcher.process(set(), True, False)
+
+		self.assertEqual(self.discovery.reloaded, [])
+		self.assertEqual(self.discovery.rescans, [True])
+		self.assertEqual(events, [ChangeEvent(ChangeType.ENABLED, "base")])
+
+	def test_lists_rescan(self):
+		self.discovery.channels["base"] = self.discovery.cache["base"]
+		self.discovery.pending = {"base" : False}
+
+		events = self.watcher.process(set(), False, True)
+
+		# The sources didn't change, no need to read them again
+		self.assertEqual(self.discovery.rescans, [False])
+		self.assertEqual(events, [ChangeEvent(ChangeType.DISABLED, "base")])
+
+	def test_overflow(self):
+		self.write(self.channels, "extra.channel")
+
+		self.watcher.process(set(), False, False, overflow=True)
+
+		# Everything is checked again
+		self.assertEqual(self.discovery.reloaded, ["base.channel", "extra.channel"])
+		self.assertEqual(self.discovery.rescans, [True])
+
+class PollingTest(WatcherTest):
+
+	"""
+	Tests the snapshots compared by DiscoveryWatcher when polling.
+	"""
+
+	def setUp(self):
+		super().setUp()
+
+		self.watcher.start()
+		self.addCleanup(self.watcher.stop)
+
+	def test_directories(self):
+		self.assertEqual(
+			sorted(self.watcher.snapshot),
+			sorted([self.channels, self.etc, self.sourceparts, self.lists])
+		)
+
+	def test_nothing_changed(self):
+		self.assertEqual(self.watcher.collect_polling(0), (set(), False, False, False))
+
+	def test_changed_channels(self):
+		self.write(self.channels, "base.channel", "changed content")
+		self.write(self.channels, "extra.provider")
+		self.write(self.channels, "README")
+
+		self.assertEqual(
+			self.watcher.collect_polling(0),
+			({"base.channel", "extra.provider"}, False, False, False)
+		)
+
+		# The snapshot is updated
+		self.assertEqual(self.watcher.collect_polling(0), (set(), False, False, False))
+
+	def test_changed_sources_and_lists(self):
+		self.write(self.sourceparts, "extra.list")
+		self.write(self.lists, "mirror_dists_stable_Release")
+
+		self.assertEqual(self.watcher.collect_polling(0), (set(), True, True, False))
+
+	def test_changed_sourcelist(self):
+		self.write(self.etc, "sources.list")
+
+		self.assertEqual(self.watcher.collect_polling(0), (set(), True, False, False))
+
+	def test_ignored_files(self):
+		self.write(self.sourceparts, "extra.list.save")
+		self.write(self.lists, "mirror_dists_stable_main_binary-amd64_Packages")
+
+		self.assertEqual(self.watcher.collect_polling(0), (set(), False, False, False))
+
+class InotifyTest(unittest.TestCase):
+
+	"""
+	Tests the parsing of the inotify events.
+	"""
+
+	def get_event(self, wd, mask, name):
+		name = name.encode()
+		length = (len(name) // 16 + 1) * 16 if name else 0
+
+		return Inotify.EVENT_HEADER.pack(wd, mask, 0, length) + name.ljust(length, b"\0")
+
+	def test_read(self):
+		inotify = Inotify.__new__(Inotify)
+		inotify.fd = -1
+
+		buffer = (
+			self.get_event(1, Inotify.IN_CLOSE_WRITE, "base.channel") +
+			self.get_event(2, Inotify.IN_MOVED_TO, "a-rather-long-file-name.list") +
+			self.get_event(-1, Inotify.IN_Q_OVERFLOW, "")
+		)
+
+		with mock.patch.object(os, "read", return_value=buffer):
+			self.assertEqual(inotify.read(), [
+				(1, Inotify.IN_CLOSE_WRITE, "base.channel"),
+				(2, Inotify.IN_MOVED_TO, "a-rather-long-file-name.list"),
+				(-1, Inotify.IN_Q_OVERFLOW, ""),
+			])
+
+	def test_read_nothing(self):
+		inotify = Inotify.__new__(Inotify)
+		inotify.fd = -1
+
+		with mock.patch.object(os, "read", side_effect=BlockingIOError):
+			self.assertEqual(inotify.read(), [])
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+
+import os
+import tempfile
+import unittest
+
+from libchannels.writer import SourcesWriter
+
+from tests import fakes
+
+class SourcesWriterTest(unittest.TestCase):
+
+	"""
+	Tests libchannels.writer.SourcesWriter.
+	"""
+
+	def setUp(self):
+		directory = tempfile.TemporaryDirectory()
+		self.addCleanup(directory.cleanup)
+
+		self.directory = directory.name
+
+		self.first = os.path.join(self.directory, "first.list")
+		self.second = os.path.join(self.directory, "second.list")
+
+		for path in (self.first, self.second):
+			with open(path, "w") as f:
+				f.write("# untouched\n")
+
+		os.chmod(self.first, 0o600)
+
+		self.sourceslist = fakes.install(self, [
+			fakes.SourceEntry("deb", "http://mirror/", "first", ["main"], file=self.first),
+			fakes.SourceEntry("deb", "http://mirror/", "second", ["main"], file=self.second),
+		])
+
+	def read(self, path):
+		with open(path) as f:
+			return f.read()
+
+	def test_only_dirty_files(self):
+		writer = SourcesWriter()
+		writer.mark_entry_dirty(self.sourceslist.list[0])
+
+		self.assertEqual(writer.save(), 1)
+
+		self.assertEqual(self.read(self.first), "deb http://mirror/ first main\n")
+		self.assertEqual(self.read(self.second), "# untouched\n")
+
+		# Nothing left to write
+		self.assertEqual(writer.save(), 0)
+
+	def test_mode_is_kept(self):
+		writer = SourcesWriter()
+		writer.mark_dirty(self.first)
+		writer.save()
+
+		self.assertEqual(os.stat(self.first).st_mode & 0o7777, 0o600)
+		self.assertEqual(sorted(os.listdir(self.directory)), ["first.list", "second.list"])
+
+	def test_missing_empty_files(self):
+		missing = os.path.join(self.directory, "missing.list")
+
+		writer = SourcesWriter()
+		writer.mark_dirty(missing)
+
+		# Nothing to write there
+		self.assertEqual(writer.save(), 0)
+		self.assertFalse(os.path.exists(missing))
+
+if __name__ == "__main__":
+	unittest.main()